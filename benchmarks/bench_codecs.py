@@ -0,0 +1,57 @@
+"""
+Benchmark: state codecs — encode/decode time and stored bytes on a 30-step agent state.
+
+    python -m benchmarks.bench_codecs
+"""
+
+import random
+import timeit
+
+from sbas.state.codecs import Codec
+
+
+WORDS = (
+    "checkout cart payment paypal card wallet button visible fold price total shipping tax coupon "
+    "merchant page banner modal login guest address billing express secure badge trust order review"
+).split()
+
+
+def prose(rng, n_words):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)) + f" ({rng.randint(0, 10**6)})"
+
+
+def agent_state(steps=30):
+    rng = random.Random(0)
+    messages = [{"role": "system", "content": prose(rng, 400)}]
+    for step in range(steps):
+        messages.append({"role": "user", "content": f"Step {step}: " + prose(rng, 30)})
+        messages.append({"role": "assistant", "content": prose(rng, 120)})
+    return {"messages": messages, "model": "gpt-4o", "kwargs": {"temperature": 0.2}, "step": steps}
+
+
+def candidates():
+    yield "json", Codec()
+    yield "json+zlib", Codec(compression="zlib")
+    yield "json+lzma", Codec(compression="lzma")
+    for name, codec in (
+        ("json+zstd", Codec(compression="zstd")),
+        ("msgpack", Codec(format="msgpack")),
+        ("msgpack+zstd", Codec(format="msgpack", compression="zstd")),
+    ):
+        try:
+            codec.encode(agent_state(1))
+        except ImportError:
+            print(f"{name:<14} (not installed)")
+            continue
+        yield name, codec
+
+
+if __name__ == "__main__":
+    state = agent_state()
+    print(f"{'codec':<14} {'bytes':>9} {'encode us':>10} {'decode us':>10}")
+    for name, codec in candidates():
+        blob = codec.encode(state)
+        n = 200
+        encode = timeit.timeit(lambda: codec.encode(state), number=n) / n * 1e6
+        decode = timeit.timeit(lambda: codec.decode(blob), number=n) / n * 1e6
+        print(f"{name:<14} {len(blob):>9,} {encode:>10.0f} {decode:>10.0f}")
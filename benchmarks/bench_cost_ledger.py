@@ -0,0 +1,53 @@
+"""
+Benchmark: CostLedger month-end report over a month of calls from several agents.
+
+    python -m benchmarks.bench_cost_ledger [n_calls]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from sbas.cost.ledger import CostLedger
+from sbas.cost.tracker import CostRecord
+
+AGENTS = [f"agent-{i}" for i in range(20)]
+MODELS = ["gpt-4o", "gpt-4o-mini", "claude-3-5-sonnet-20241022"]
+MODES = ["sync", "async", "cached"]
+MONTH = 30 * 86400
+
+
+def run(n_calls):
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = CostLedger(os.path.join(tmp, "costs.db"))
+        start_of_month = 1_700_000_000 - 1_700_000_000 % 86400
+
+        start = time.perf_counter()
+        for i in range(n_calls):
+            ledger.append(CostRecord(
+                job_id=f"job-{i}",
+                model=MODELS[i % len(MODELS)],
+                tokens_in=500,
+                tokens_out=200,
+                mode=MODES[i % len(MODES)],
+                cost_actual=0.002,
+                cost_if_sync=0.004,
+                saved=0.002,
+                timestamp=start_of_month + i * MONTH / n_calls,
+                agent=AGENTS[i % len(AGENTS)],
+            ))
+        ledger.flush()
+        elapsed = time.perf_counter() - start
+        print(f"{'append + commit':<24} {n_calls / elapsed:>12,.0f} records/sec")
+
+        start = time.perf_counter()
+        report = ledger.report(since=start_of_month, until=start_of_month + MONTH)
+        elapsed = time.perf_counter() - start
+        print(f"{'month-end report':<24} {elapsed * 1000:>12,.1f} ms  "
+              f"({report['total_calls']:,} calls, {len(report['by_day'])} days, {len(report['by_agent'])} agents)")
+        ledger.close()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
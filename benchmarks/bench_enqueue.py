@@ -0,0 +1,78 @@
+"""
+Benchmark: enqueue hot path — BatchQueue.enqueue and SBAS create() ops/sec, and bytes
+of queue/state overhead per queued request (messages themselves excluded).
+
+    python -m benchmarks.bench_enqueue [n_requests]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from sbas import SBAS
+from sbas.batch.queue import BatchQueue
+
+
+class Client:
+    """Stands in for a provider client; never called because nothing is flushed."""
+
+
+def requests(n):
+    # Built up front so only what the queue adds per request is measured
+    return [[{"role": "user", "content": f"Summarize document {i}"}] for i in range(n)]
+
+
+def idle_queue():
+    return BatchQueue(max_size=10**9, max_wait_sec=10**9)
+
+
+def run(n, setup, trace=False):
+    """Enqueue n requests through setup()'s enqueue function. Returns (seconds, traced bytes per request)."""
+    batch = requests(n)
+    if trace:
+        tracemalloc.start()
+    enqueue, close = setup()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    for i, messages in enumerate(batch):
+        enqueue(i, messages)
+    elapsed = time.perf_counter() - started
+    per_request = (tracemalloc.get_traced_memory()[0] - before) / n
+    close()
+    tracemalloc.stop()
+    return elapsed, per_request
+
+
+def measure(label, n, setup):
+    elapsed, _ = run(n, setup)
+    # Memory from a second, traced run: tracing slows the hot path down several times
+    _, per_request = run(n, setup, trace=True)
+    print(f"{label:<22} {n / elapsed:>12,.0f} {per_request:>12,.0f}")
+
+
+def queue_setup(client):
+    queue = idle_queue()
+
+    def enqueue(i, messages):
+        queue.enqueue(f"job-{i}", "gpt-4o-mini", messages, {}, client, latency_budget="24h")
+
+    return enqueue, lambda: queue.close(flush=False)
+
+
+def sbas_setup(client):
+    queue = idle_queue()
+    sbas = SBAS(client, latency_budget="24h", batch_queue=queue)
+    jobs = []  # keep the PendingJobs alive, as callers do
+
+    def enqueue(i, messages):
+        jobs.append(sbas.chat.completions.create(model="gpt-4o-mini", messages=messages))
+
+    return enqueue, lambda: queue.close(flush=False)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    client = Client()
+    print(f"{'path':<22} {'ops/sec':>12} {'bytes/req':>12}")
+    measure("BatchQueue.enqueue", n, lambda: queue_setup(client))
+    measure("SBAS create()", n, lambda: sbas_setup(client))
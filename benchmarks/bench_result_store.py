@@ -0,0 +1,69 @@
+"""
+Benchmark: a worker receiving one 50k-response batch that nobody collects yet — peak
+memory held by the result store, unbounded vs under a budget with a SQLite spill,
+and the cost of reading spilled results back.
+
+    python -m benchmarks.bench_result_store [n_responses] [budget_mb]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sbas.batch.results import ResultStore
+
+
+def response(i):
+    """A chat completion of about 2 KB, as model_dump() gives it."""
+    return {
+        "id": f"chatcmpl-{i}",
+        "object": "chat.completion",
+        "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": f"Summary {i}: " + "lorem ipsum " * 160}}],
+        "usage": {"prompt_tokens": 812, "completion_tokens": 410, "total_tokens": 1222},
+    }
+
+
+def fill(n, store, trace=False):
+    """Put n responses. Returns (seconds, peak traced bytes)."""
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    for i in range(n):
+        store.put(f"job-{i}", response(i))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def collect(n, store):
+    started = time.perf_counter()
+    for i in range(n):
+        assert store.pop(f"job-{i}") is not None
+    return time.perf_counter() - started
+
+
+def run(label, n, make_store):
+    store = make_store()
+    stored, _ = fill(n, store)
+    collected = collect(n, store)
+    store.close()
+    # Peak memory from a second, traced run: tracing slows puts down several times
+    store = make_store()
+    _, peak = fill(n, store, trace=True)
+    store.close()
+    print(f"{label:<28} {peak / 2**20:>10.1f} {n / stored:>12,.0f} {n / collected:>12,.0f}")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    print(f"{'store':<28} {'peak MiB':>10} {'put/sec':>12} {'pop/sec':>12}")
+    run("unbounded", n, lambda: ResultStore(max_bytes=None))
+    with tempfile.TemporaryDirectory() as tmp:
+        spill_path = os.path.join(tmp, "results.db")
+        run(f"{budget} MiB budget + spill", n, lambda: ResultStore(max_bytes=budget * 2**20, spill_path=spill_path))
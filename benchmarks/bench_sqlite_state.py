@@ -0,0 +1,53 @@
+"""
+Benchmark: SQLiteStateManager ops/sec, per-write commits vs WAL + group commit.
+
+    python -m benchmarks.bench_sqlite_state [n_ops]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sbas.state.sqlite import SQLiteStateManager
+
+STATE = {
+    "messages": [
+        {"role": "system", "content": "You are an e-commerce analysis agent."},
+        {"role": "user", "content": "Step 1: Navigate to product page. Describe what you see."},
+    ],
+    "model": "gpt-4o",
+    "kwargs": {},
+}
+
+
+def run(label, n_ops, threads=4, **kwargs):
+    with tempfile.TemporaryDirectory() as tmp:
+        sm = SQLiteStateManager(os.path.join(tmp, "state.db"), **kwargs)
+
+        def worker(t):
+            for i in range(n_ops // threads):
+                job_id = f"job-{t}-{i}"
+                sm.save(job_id, STATE)
+                sm.update(job_id, {"step": 2})
+                sm.delete(job_id)
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        sm.close()  # includes waiting for the last group commit
+        elapsed = time.perf_counter() - start
+    ops = (n_ops // threads) * threads * 3
+    print(f"{label:<42} {ops / elapsed:>12,.0f} ops/sec")
+
+
+if __name__ == "__main__":
+    n_ops = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    run("before: rollback journal, FULL, per-op commit", n_ops,
+        journal_mode="DELETE", synchronous="FULL", group_commit=False)
+    run("WAL, NORMAL, per-op commit", n_ops, group_commit=False)
+    run("after: WAL, NORMAL, group commit", n_ops, group_commit=True)
@@ -0,0 +1,52 @@
+"""
+SBAS Demo: 10,000 checkout analysis agents as one workflow.
+Same four steps as checkout_agent.py, but no agent blocks on job.wait(): every agent's
+step N goes out in the same provider batch, so the run takes about four batches.
+"""
+
+from sbas import SBAS, SQLiteStateManager, WorkflowRunner
+from sbas.batch.queue import BatchQueue
+from openai import OpenAI
+import os
+
+STEPS = [
+    "You are a checkout analysis agent. Step 1: Navigate to product page. Describe what you see.",
+    "Step 2: Add item to cart. Confirm cart contents.",
+    "Step 3: Proceed to checkout. Analyze all payment options shown.",
+    "Step 4: Focus on PayPal presentation. Rate visibility from 1-10 and explain.",
+]
+
+
+def checkout_step(state, response):
+    """Record the last answer and return the next request, or None when done."""
+    if response is not None:
+        state["messages"].append({"role": "assistant", "content": response.choices[0].message.content})
+    if state["step"] == len(STEPS):
+        return None
+    state["messages"].append({"role": "user", "content": STEPS[state["step"]]})
+    state["step"] += 1
+    return {"model": "gpt-4o", "messages": state["messages"]}
+
+
+def run_checkout_workflow(n_agents=10_000):
+    client = SBAS(
+        OpenAI(api_key=os.environ["OPENAI_API_KEY"]),
+        latency_budget="24h",
+        state_manager=SQLiteStateManager("./demo.db"),
+        batch_queue=BatchQueue(max_size=n_agents),  # one wave per flush
+    )
+    runner = WorkflowRunner(client, checkout_step, name="checkout")
+    agents = {
+        f"shop-{i}": {"step": 0, "messages": [{"role": "system", "content": "You are an e-commerce analysis agent."}]}
+        for i in range(n_agents)
+    }
+    states = runner.run(agents)
+    print(f"✅ {len(states) - len(runner.errors)} agents finished, {len(runner.errors)} failed")
+
+    print("\n💰 Savings Report:")
+    for k, v in client.savings_report().items():
+        print(f"  {k}: {v}")
+
+
+if __name__ == "__main__":
+    run_checkout_workflow()
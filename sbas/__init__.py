@@ -4,11 +4,22 @@ Run AI agents at 50% lower cost using async batch LLM APIs.
 Your data never leaves your infrastructure.
 """
 
-from sbas.interceptor import SBASInterceptor as SBAS
+from sbas.interceptor import SBASInterceptor as SBAS, PendingJob, wait_all, as_completed
+from sbas.async_interceptor import AsyncSBASInterceptor as AsyncSBAS, AsyncPendingJob
 from sbas.state.memory import InMemoryStateManager
 from sbas.state.redis import RedisStateManager
 from sbas.state.sqlite import SQLiteStateManager
+from sbas.state.chain import ChainedStateManager
 from sbas.cost.tracker import CostTracker
+from sbas.cost.ledger import CostLedger
+from sbas.cache import ResponseCache
+from sbas.router import LatencyRouter, RoutingDecision
+from sbas.workflow import WorkflowRunner
 
 __version__ = "0.1.0"
-__all__ = ["SBAS", "InMemoryStateManager", "RedisStateManager", "SQLiteStateManager", "CostTracker"]
+__all__ = [
+    "SBAS", "PendingJob", "wait_all", "as_completed", "AsyncSBAS", "AsyncPendingJob",
+    "InMemoryStateManager", "RedisStateManager", "SQLiteStateManager", "ChainedStateManager", "CostTracker",
+    "CostLedger", "ResponseCache", "LatencyRouter", "RoutingDecision",
+    "WorkflowRunner",
+]
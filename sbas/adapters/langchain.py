@@ -5,30 +5,176 @@ Wraps any LangChain LLM or ChatModel.
 Usage:
     from langchain_openai import ChatOpenAI
     from sbas.adapters.langchain import SBASLangChain
-    
+
     llm = SBASLangChain(ChatOpenAI(), latency_budget="2h")
     result = llm.invoke("Analyze this document...")
+    results = llm.batch(["Summarize A", "Summarize B", ...])  # a handful of provider batches
+
+invoke/batch/ainvoke/abatch convert LangChain inputs to chat messages, send them through
+the SBAS queue with the chat model's own provider client, and return AIMessages. With a
+"realtime" budget, or when no provider client can be found behind the model, they call
+the wrapped model directly.
 """
 
-from sbas.interceptor import SBASInterceptor
-from typing import Optional
+import asyncio
+from sbas.interceptor import SBASInterceptor, PendingJob
+from typing import Any, List, Optional
+
+# LangChain message.type -> chat API role
+_ROLES = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool", "function": "function", "chat": "user"}
+# Tuple shorthands LangChain accepts, e.g. ("human", "hi")
+_TUPLE_ROLES = {"human": "user", "user": "user", "ai": "assistant", "assistant": "assistant", "system": "system"}
+# Chat model attributes that become request parameters
+_MODEL_PARAMS = ("temperature", "max_tokens", "top_p", "stop")
+
+
+def to_messages(input: Any) -> List[dict]:
+    """Convert a LangChain input (str, PromptValue, messages, (role, content) tuples, dicts) to chat messages."""
+    if isinstance(input, str):
+        return [{"role": "user", "content": input}]
+    if hasattr(input, "to_messages"):  # PromptValue
+        input = input.to_messages()
+    messages = []
+    for message in input:
+        if isinstance(message, dict):
+            messages.append({"role": message["role"], "content": message["content"]})
+        elif isinstance(message, (tuple, list)):
+            role, content = message
+            messages.append({"role": _TUPLE_ROLES.get(role, role), "content": content})
+        elif isinstance(message, str):
+            messages.append({"role": "user", "content": message})
+        else:
+            role = getattr(message, "role", None) if message.type == "chat" else None
+            entry = {"role": role or _ROLES.get(message.type, "user"), "content": message.content}
+            if getattr(message, "tool_call_id", None):
+                entry["tool_call_id"] = message.tool_call_id
+            messages.append(entry)
+    return messages
+
+
+def _get(obj, key, default=None):
+    return obj.get(key, default) if isinstance(obj, dict) else getattr(obj, key, default)
+
+
+def response_content(response: Any) -> str:
+    """Text of an OpenAI chat completion or Anthropic message, as an object or a dict."""
+    choices = _get(response, "choices")
+    if choices:
+        return _get(_get(choices[0], "message"), "content") or ""
+    blocks = _get(response, "content")
+    if isinstance(blocks, str):
+        return blocks
+    return "".join(_get(block, "text", "") for block in blocks or () if _get(block, "type") == "text")
+
+
+def _ai_message(response: Any):
+    try:
+        from langchain_core.messages import AIMessage
+    except ImportError:
+        raise ImportError("Install langchain: pip install langchain-core")
+    usage = _get(response, "usage")
+    if usage is not None and not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+    return AIMessage(
+        content=response_content(response),
+        response_metadata={"model_name": _get(response, "model"), "token_usage": usage or {}},
+    )
 
 
 class SBASLangChain:
-    def __init__(self, llm, latency_budget="1h", state_manager=None):
+    def __init__(self, llm, latency_budget="1h", state_manager=None, client=None, **sbas_kwargs):
         self._llm = llm
+        # The provider SDK client behind the chat model (ChatOpenAI.root_client, ChatAnthropic._client)
+        client = client or getattr(llm, "root_client", None) or getattr(llm, "_client", None)
+        # Without one there is nothing SBAS can call: every method passes through to the model
+        self._has_client = client is not None
         self._sbas = SBASInterceptor(
-            llm_client=llm,
+            llm_client=client or llm,
             latency_budget=latency_budget,
             state_manager=state_manager,
+            **sbas_kwargs,
         )
+        self.model = getattr(llm, "model_name", None) or getattr(llm, "model", None)
+
+    @property
+    def _direct(self) -> bool:
+        return not self._has_client or self._sbas.latency_budget == "realtime"
+
+    def _params(self, kwargs: dict) -> dict:
+        params = {}
+        for name in _MODEL_PARAMS:
+            value = getattr(self._llm, name, None)
+            if value is not None:
+                params[name] = value
+        params.update(getattr(self._llm, "model_kwargs", None) or {})
+        params.update(kwargs)
+        return params
+
+    def _submit(self, input, kwargs: dict) -> PendingJob:
+        return self._sbas.chat.completions.create(model=self.model, messages=to_messages(input), **self._params(kwargs))
 
     def invoke(self, input, config=None, **kwargs):
-        # For realtime budget, pass through directly
-        if self._sbas.latency_budget == "realtime":
+        # For realtime budget, or without a provider client, pass through directly
+        if self._direct:
             return self._llm.invoke(input, config=config, **kwargs)
         # Otherwise route through SBAS batch engine
-        return self._llm.invoke(input, config=config, **kwargs)  # MVP: extend in v1.1
+        return _ai_message(self._submit(input, kwargs).wait())
+
+    def batch(self, inputs: List[Any], config=None, *, return_exceptions: bool = False, **kwargs) -> list:
+        """Queue every input, submit them together and wait for all results (in input order)."""
+        if self._direct:
+            return self._llm.batch(inputs, config=config, return_exceptions=return_exceptions, **kwargs)
+        jobs = self._submit_all(inputs, kwargs, return_exceptions)
+        return [self._collect(job, return_exceptions) for job in jobs]
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        if self._direct:
+            return await self._llm.ainvoke(input, config=config, **kwargs)
+        # Enqueueing can block (a durable log append), so it runs off the event loop
+        job = await asyncio.to_thread(self._submit, input, kwargs)
+        return _ai_message(await asyncio.wrap_future(job.future))
+
+    async def abatch(self, inputs: List[Any], config=None, *, return_exceptions: bool = False, **kwargs) -> list:
+        if self._direct:
+            return await self._llm.abatch(inputs, config=config, return_exceptions=return_exceptions, **kwargs)
+        # The flush uploads the batch file: keep it off the event loop
+        jobs = await asyncio.to_thread(self._submit_all, inputs, kwargs, return_exceptions)
+
+        async def collect(job):
+            if isinstance(job, Exception):
+                return job
+            try:
+                return _ai_message(await asyncio.wrap_future(job.future))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        return list(await asyncio.gather(*(collect(job) for job in jobs)))
+
+    def _submit_all(self, inputs: List[Any], kwargs: dict, return_exceptions: bool) -> list:
+        jobs = []
+        for input in inputs:
+            try:
+                jobs.append(self._submit(input, kwargs))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                jobs.append(e)
+        # Everything is queued: send it now as one (or a few, size-limited) provider batches
+        self._sbas.batch_queue.flush()
+        return jobs
+
+    @staticmethod
+    def _collect(job, return_exceptions: bool):
+        if isinstance(job, Exception):
+            return job
+        try:
+            return _ai_message(job.wait())
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return e
 
     def savings_report(self):
         return self._sbas.savings_report()
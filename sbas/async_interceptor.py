@@ -0,0 +1,127 @@
+"""
+AsyncSBASInterceptor — asyncio variant of SBASInterceptor.
+Wraps AsyncOpenAI / AsyncAnthropic clients; create() is a coroutine and async jobs are awaitable.
+"""
+
+import asyncio
+import uuid
+from typing import Callable, Optional
+from sbas.state.base import BaseStateManager
+from sbas.state.memory import InMemoryStateManager
+from sbas.batch.async_queue import AsyncBatchQueue
+from sbas.batch.executor import direct_call
+from sbas.cost.tracker import CostTracker
+from sbas.interceptor import LatencyBudget
+
+
+class AsyncSBASInterceptor:
+    """
+    Drop-in wrapper for async LLM clients.
+
+    Usage:
+        from sbas import AsyncSBAS
+        from openai import AsyncOpenAI
+
+        client = AsyncSBAS(AsyncOpenAI(), latency_budget="2h")
+        job = await client.chat.completions.create(model="gpt-4o", messages=messages)
+        result = await job
+    """
+
+    def __init__(
+        self,
+        llm_client,
+        latency_budget: LatencyBudget = "1h",
+        state_manager: Optional[BaseStateManager] = None,
+        batch_queue: Optional[AsyncBatchQueue] = None,
+        cost_tracker: Optional[CostTracker] = None,
+        cloud_reporter=None,
+        agent: Optional[str] = None,
+    ):
+        self._client = llm_client
+        self.latency_budget = latency_budget
+        self.agent = agent  # tags cost records, for per-agent reports
+        self.state_manager = state_manager or InMemoryStateManager()
+        self.batch_queue = batch_queue or AsyncBatchQueue()
+        self.cost_tracker = cost_tracker or CostTracker()
+        self.cloud_reporter = cloud_reporter
+        self.chat = _AsyncChatCompletionsProxy(self)
+
+    def savings_report(self):
+        return self.cost_tracker.report()
+
+    def _should_use_async(self) -> bool:
+        return self.latency_budget != "realtime"
+
+
+class _AsyncChatCompletionsProxy:
+    def __init__(self, sbas: AsyncSBASInterceptor):
+        self._sbas = sbas
+        self.completions = _AsyncCompletionsProxy(sbas)
+
+
+class _AsyncCompletionsProxy:
+    def __init__(self, sbas: AsyncSBASInterceptor):
+        self._sbas = sbas
+
+    async def create(self, model: str, messages: list, **kwargs):
+        """
+        Intercepts LLM call and routes to sync or async batch engine.
+        """
+        job_id = str(uuid.uuid4())
+
+        if not self._sbas._should_use_async():
+            result = await direct_call(self._sbas._client, model, messages, kwargs)
+            self._sbas.cost_tracker.record(job_id, result, mode="sync", agent=self._sbas.agent)
+            return result
+
+        state = {"messages": messages, "model": model, "kwargs": kwargs}
+        self._sbas.state_manager.save(job_id, state)
+
+        future = self._sbas.batch_queue.enqueue(
+            job_id=job_id,
+            model=model,
+            messages=messages,
+            kwargs=kwargs,
+            client=self._sbas._client,
+            latency_budget=self._sbas.latency_budget,
+        )
+        return AsyncPendingJob(job_id=job_id, sbas=self._sbas, future=future)
+
+
+class AsyncPendingJob:
+    """Awaitable handle for an async batch job in progress."""
+
+    def __init__(self, job_id: str, sbas: AsyncSBASInterceptor, future: asyncio.Future):
+        self.job_id = job_id
+        self._sbas = sbas
+        self._future = future
+        self.status = "pending"
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            self.status = "failed"
+            return
+        self.status = "complete"
+        self._sbas.state_manager.delete(self.job_id)
+        self._sbas.cost_tracker.record(self.job_id, future.result(), mode="async", agent=self._sbas.agent)
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    async def wait(self, timeout: Optional[float] = 86400):
+        """Wait without blocking the event loop. Returns completion object."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Job {self.job_id} did not complete within {timeout}s") from None
+
+    def add_done_callback(self, fn: Callable[["AsyncPendingJob"], None]) -> None:
+        """Call fn(job) once the job completes."""
+        self._future.add_done_callback(lambda _: fn(self))
+
+    def __await__(self):
+        return self.wait().__await__()
+
+    def __repr__(self):
+        return f"<AsyncPendingJob id={self.job_id} status={self.status}>"
@@ -1 +1,5 @@
 from sbas.batch.queue import BatchQueue
+from sbas.batch.executor import SyncExecutor
+from sbas.batch.tokens import TokenLedger
+from sbas.batch.redis_queue import RedisBatchQueue
+from sbas.batch.results import ResultStore
@@ -0,0 +1,278 @@
+"""
+AsyncBatchQueue — asyncio-native BatchQueue for AsyncOpenAI / AsyncAnthropic clients.
+
+Same flush policy as BatchQueue, but the flusher and the shared batch poller are
+tasks on the running event loop, so no threads or blocking sleeps are involved.
+Requests that fail retryably inside a provider batch are submitted again, like
+BatchOrchestrator does, up to max_attempts batch runs (then run sync with sync_fallback).
+"""
+
+import asyncio
+import heapq
+import time
+from typing import Any, Dict, List, Optional
+
+from sbas.batch.executor import direct_call
+from sbas.batch.orchestrator import adapter_for
+from sbas.batch.packer import BatchPacker
+from sbas.batch.providers.errors import BatchItemError
+from sbas.batch.queue import flush_times
+
+
+class AsyncBatchQueue:
+    def __init__(
+        self,
+        max_size: int = 100,
+        max_wait_sec: int = 300,
+        max_wait_fraction: float = 0.1,
+        min_poll_interval: float = 5,
+        max_poll_interval: float = 300,
+        poll_backoff: float = 1.5,
+        max_sync_concurrency: int = 16,
+        packer: Optional[BatchPacker] = None,
+        max_attempts: int = 3,
+        sync_fallback: bool = False,
+        max_poll_failures: int = 20,
+    ):
+        self._queue = {}       # job_id -> request
+        self._futures = {}     # job_id -> asyncio.Future, until the job completes
+        self._due = []         # heap of (flush_by, job_id)
+        self._inflight = {}    # batch_id -> (adapter, requests, interval, failed status checks in a row)
+        self._schedule = []    # heap of (next_poll_at, batch_id)
+        self._adapters = {}    # id(client) -> (client, adapter or None)
+        self._tasks = set()
+        self._flusher = None
+        self._poller = None
+        self._flush_wakeup = None
+        self._poll_wakeup = None
+        self._sync_slots = None
+        self.max_size = max_size
+        self.max_wait_sec = max_wait_sec
+        self.max_wait_fraction = max_wait_fraction
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.poll_backoff = poll_backoff
+        self.max_sync_concurrency = max_sync_concurrency
+        self.packer = packer or BatchPacker()
+        self.max_attempts = max_attempts
+        self.sync_fallback = sync_fallback
+        # Status checks in a row that may fail to reach the provider before a batch's jobs fail
+        self.max_poll_failures = max_poll_failures
+
+    def enqueue(
+        self,
+        job_id: str,
+        model: str,
+        messages: list,
+        kwargs: dict,
+        client,
+        latency_budget: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> asyncio.Future:
+        """Queue a request. Must be called from the event loop that will await the result."""
+        self._start()
+        now = time.time()
+        deadline, flush_by = flush_times(now, latency_budget, deadline, self.max_wait_sec, self.max_wait_fraction)
+        future = asyncio.get_running_loop().create_future()
+        self._queue[job_id] = {
+            "model": model,
+            "messages": messages,
+            "kwargs": kwargs,
+            "client": client,
+            "enqueued_at": now,
+            "deadline": deadline,
+        }
+        self._futures[job_id] = future
+        heapq.heappush(self._due, (flush_by, job_id))
+        if len(self._queue) >= self.max_size or self._due[0][1] == job_id:
+            self._flush_wakeup.set()
+        return future
+
+    async def flush(self) -> int:
+        """Submit everything queued right now. Returns the number of requests submitted."""
+        batch = self._take_batch()
+        if batch:
+            await self._submit_batch(batch)
+        return len(batch)
+
+    async def close(self, flush: bool = True) -> None:
+        """Cancel the flusher and poller tasks, optionally submitting what is still queued."""
+        if flush:
+            await self.flush()
+        for task in (self._flusher, self._poller, *self._tasks):
+            if task is not None:
+                task.cancel()
+        self._flusher = self._poller = None
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def _start(self):
+        if self._flusher is None:
+            self._flush_wakeup = asyncio.Event()
+            self._poll_wakeup = asyncio.Event()
+            self._sync_slots = asyncio.Semaphore(self.max_sync_concurrency)
+            self._flusher = asyncio.ensure_future(self._run_flusher())
+            self._poller = asyncio.ensure_future(self._run_poller())
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _take_batch(self) -> dict:
+        batch = dict(self._queue)
+        self._queue.clear()
+        self._due.clear()
+        return batch
+
+    async def _run_flusher(self):
+        while True:
+            while self._due and self._due[0][1] not in self._queue:
+                heapq.heappop(self._due)
+            flush_at = self._due[0][0] if self._due else None
+            if len(self._queue) >= self.max_size or (flush_at is not None and flush_at <= time.time()):
+                self._spawn(self._submit_batch(self._take_batch()))
+                continue
+            self._flush_wakeup.clear()
+            timeout = None if flush_at is None else flush_at - time.time()
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _submit_batch(self, batch: Dict[str, dict]):
+        by_client = {}
+        for job_id, req in batch.items():
+            by_client.setdefault(id(req["client"]), []).append({"job_id": job_id, **req})
+
+        for requests in by_client.values():
+            adapter = self._adapter(requests[0]["client"])
+            if adapter is None:
+                for req in requests:
+                    self._spawn(self._run_sync(req))
+                continue
+            await self._submit_to(adapter, requests)
+
+    async def _submit_to(self, adapter, requests: List[dict]):
+        batches, oversized = self.packer.pack(requests, adapter)
+        for req in oversized:
+            self._store_error(req["job_id"], ValueError("Request is larger than the provider batch size limit"))
+        for requests in batches:
+            try:
+                batch_id = await adapter.asubmit(requests)
+            except Exception as e:
+                for req in requests:
+                    self._store_error(req["job_id"], e)
+                continue
+            self._inflight[batch_id] = (adapter, requests, self.min_poll_interval, 0)
+            heapq.heappush(self._schedule, (time.time() + self.min_poll_interval, batch_id))
+            self._poll_wakeup.set()
+
+    async def _run_poller(self):
+        while True:
+            now = time.time()
+            due = []
+            while self._schedule and self._schedule[0][0] <= now:
+                due.append(heapq.heappop(self._schedule)[1])
+            if due:
+                await asyncio.gather(*(self._check(batch_id) for batch_id in due if batch_id in self._inflight))
+                continue
+            self._poll_wakeup.clear()
+            timeout = self._schedule[0][0] - now if self._schedule else None
+            try:
+                await asyncio.wait_for(self._poll_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, batch_id: str):
+        adapter, requests, interval, poll_failures = self._inflight[batch_id]
+        try:
+            batch = await adapter.acheck(batch_id)
+        except RuntimeError as e:
+            del self._inflight[batch_id]
+            for req in requests:
+                self._store_error(req["job_id"], e)
+            return
+        except Exception as e:
+            # Transient failure talking to the provider: try again later, up to a point
+            poll_failures += 1
+            if poll_failures >= self.max_poll_failures:
+                del self._inflight[batch_id]
+                for req in requests:
+                    self._store_error(req["job_id"], e)
+                return
+            batch = None
+        else:
+            poll_failures = 0
+
+        if batch is None:
+            interval = min(interval * self.poll_backoff, self.max_poll_interval)
+            self._inflight[batch_id] = (adapter, requests, interval, poll_failures)
+            heapq.heappush(self._schedule, (time.time() + interval, batch_id))
+            return
+
+        del self._inflight[batch_id]
+        delivered = set()
+        failed = []
+        try:
+            async for job_id, response in adapter.aiter_results(batch):
+                delivered.add(job_id)
+                if isinstance(response, BatchItemError):
+                    failed.append(response)
+                else:
+                    self._store_result(job_id, response)
+        except Exception as e:
+            for req in requests:
+                if req["job_id"] not in delivered:
+                    self._store_error(req["job_id"], e)
+        else:
+            for req in requests:
+                if req["job_id"] not in delivered:
+                    failed.append(BatchItemError(req["job_id"], "missing", "no result in the ended batch", retryable=True))
+        if failed:
+            self._retry(adapter, {req["job_id"]: req for req in requests}, failed)
+
+    def _retry(self, adapter, requests: Dict[str, dict], failed: List[BatchItemError]):
+        """Submit the retryable failures of an ended batch again; fail the rest."""
+        again = []
+        for error in failed:
+            req = requests.get(error.job_id)
+            if not error.retryable or req is None:
+                self._store_error(error.job_id, error)
+            elif req.get("attempts", 1) < self.max_attempts:
+                req["attempts"] = req.get("attempts", 1) + 1
+                again.append(req)
+            elif self.sync_fallback:
+                self._spawn(self._run_sync(req))
+            else:
+                self._store_error(error.job_id, error)
+        if again:
+            # As a task of its own: the upload must not hold up the poller's other status checks
+            self._spawn(self._submit_to(adapter, again))
+
+    async def _run_sync(self, req: dict):
+        async with self._sync_slots:
+            try:
+                response = await direct_call(req["client"], req["model"], req["messages"], req["kwargs"])
+            except Exception as e:
+                self._store_error(req["job_id"], e)
+                return
+        self._store_result(req["job_id"], response)
+
+    def _adapter(self, client):
+        entry = self._adapters.get(id(client))
+        if entry is None or entry[0] is not client:
+            entry = (client, adapter_for(client))
+            self._adapters[id(client)] = entry
+        return entry[1]
+
+    def _store_result(self, job_id: str, response: Any) -> None:
+        future = self._futures.pop(job_id, None)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def _store_error(self, job_id: str, error: Exception) -> None:
+        future = self._futures.pop(job_id, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
@@ -0,0 +1,154 @@
+"""
+SyncExecutor — shared, rate-limited worker pool for direct (non-batch) LLM calls.
+
+Realtime calls, calls the router sends sync, and the orchestrator's fallback for clients
+without a batch API all go through one bounded pool. Per-model token buckets keep
+requests and tokens per minute under client-side limits, and 429 responses are retried
+after the provider's retry-after (or an exponential backoff), pausing every call to
+that model so the other workers back off too.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from sbas.batch.providers.anthropic import AnthropicBatchAdapter
+from sbas.batch.tokens import estimate_tokens
+
+
+class TokenBucket:
+    """`per_minute` units per minute, bursting up to a minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self._rate = per_minute / 60
+        self._level = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` units now, going into debt if needed. Returns seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self._rate)
+            self._updated = now
+            # A single request larger than the bucket waits for a full bucket, not forever
+            self._level -= min(amount, self.capacity)
+            return -self._level / self._rate if self._level < 0 else 0.0
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait, from retry-after(-ms) headers."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass  # HTTP-date or garbage: fall back to backoff
+    return None
+
+
+def direct_call(client, model: str, messages: list, kwargs: dict):
+    """One direct call in the client's own API: Chat Completions, or Anthropic's Messages API.
+    Returns what the client returns (an awaitable for async clients)."""
+    if not hasattr(client, "chat") and hasattr(client, "messages"):
+        # Same system/stop/params translation as the Anthropic batch requests
+        request = {"job_id": None, "model": model, "messages": messages, "kwargs": kwargs}
+        return client.messages.create(**AnthropicBatchAdapter._batch_request(request)["params"])
+    return client.chat.completions.create(model=model, messages=messages, **kwargs)
+
+
+class SyncExecutor:
+    """
+    `rpm`/`tpm` apply to every model without an entry in `limits`
+    ({model: (rpm, tpm)}); None means unlimited.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 16,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        max_retries: int = 5,
+        retry_backoff: float = 1.0,
+        max_retry_wait: float = 60.0,
+    ):
+        self.max_workers = max_workers
+        self.rpm = rpm
+        self.tpm = tpm
+        self.limits = limits or {}
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_wait = max_retry_wait
+        self._buckets = {}  # model -> (request bucket or None, token bucket or None)
+        self._paused_until = {}  # model -> monotonic time the provider told us to wait until
+        self._lock = threading.Lock()
+        self._pool = None   # started on the first call
+
+    def submit(self, client, model: str, messages: list, kwargs: dict) -> Future:
+        """Run the call on the pool: client.chat.completions.create, or client.messages.create for an
+        Anthropic client. The Future holds the response or the final error."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="sbas-sync")
+            pool = self._pool
+        return pool.submit(self._call, client, model, messages, kwargs)
+
+    def call(self, client, model: str, messages: list, kwargs: dict):
+        """submit() and wait for the response."""
+        return self.submit(client, model, messages, kwargs).result()
+
+    def close(self, wait: bool = True) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def _model_buckets(self, model: str):
+        with self._lock:
+            buckets = self._buckets.get(model)
+            if buckets is None:
+                rpm, tpm = self.limits.get(model, (self.rpm, self.tpm))
+                buckets = self._buckets[model] = (
+                    TokenBucket(rpm) if rpm else None,
+                    TokenBucket(tpm) if tpm else None,
+                )
+            return buckets
+
+    def _acquire(self, model: str, tokens: int) -> None:
+        requests, token_bucket = self._model_buckets(model)
+        with self._lock:
+            wait = max(0.0, self._paused_until.get(model, 0.0) - time.monotonic())
+        if requests is not None:
+            wait = max(wait, requests.reserve(1))
+        if token_bucket is not None:
+            wait = max(wait, token_bucket.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
+
+    def _call(self, client, model: str, messages: list, kwargs: dict):
+        tokens = estimate_tokens(messages, kwargs)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(model, tokens)
+            try:
+                return direct_call(client, model, messages, kwargs)
+            except Exception as e:
+                if not _is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = self.retry_backoff * 2 ** attempt * random.uniform(1, 1.25)
+                delay = min(delay, self.max_retry_wait)
+                with self._lock:
+                    resume = time.monotonic() + delay
+                    self._paused_until[model] = max(self._paused_until.get(model, 0.0), resume)
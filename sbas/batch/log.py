@@ -0,0 +1,179 @@
+"""
+BatchLog — append-only write-ahead log that lets a BatchQueue survive restarts.
+
+Records enqueue, submit (with the provider batch_id) and completion events as JSON
+lines. Appends from many threads are written and fsynced together by one writer
+thread (group commit). On open the log is replayed, compacted to the live entries,
+and the surviving state is handed to BatchQueue.recover().
+"""
+
+import json
+import os
+import threading
+from typing import Any, List, Optional
+
+
+class RecoveredState:
+    """What was still live in the log when it was opened."""
+
+    def __init__(self):
+        self.pending = {}      # job_id -> enqueue event, not yet submitted
+        self.inflight = {}     # batch_id -> submit event, with job_ids not yet done and their attempts
+        self.results = {}      # job_id -> done event (a result or an error), not yet collected
+
+    def events(self) -> List[dict]:
+        """The minimal event sequence that replays back to this state."""
+        events = list(self.pending.values())
+        for submit in self.inflight.values():
+            events.extend(submit["requests"].values())
+            event = {k: v for k, v in submit.items() if k not in ("requests", "attempts")}
+            event["job_ids"] = list(submit["job_ids"])
+            if submit["attempts"]:
+                event["attempts"] = submit["attempts"]
+            events.append(event)
+        events.extend(self.results.values())
+        return events
+
+
+class BatchLog:
+    def __init__(self, path: str, sync_enqueue: bool = True):
+        self.path = path
+        # fsync enqueues before enqueue() returns; submits are always made durable
+        self.sync_enqueue = sync_enqueue
+        self.recovered = self._replay()
+        self._file = open(path, "a", encoding="utf-8")
+        self._buffer = []
+        self._appended = 0
+        self._committed = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run_writer, name="sbas-batch-log", daemon=True)
+        self._writer.start()
+
+    def append(self, event: dict, durable: bool = False) -> None:
+        """Add an event. With durable=True, block until it has been fsynced."""
+        self._append_line(json.dumps(event) + "\n", durable)
+
+    def append_result(self, job_id: str, text: Optional[str]) -> None:
+        """Add job_id's "done" event with its result given as JSON text (from to_json()), so a
+        result serialized once for the log can be reused by the caller. None: no JSON form."""
+        event = json.dumps({"e": "done", "job_id": job_id})
+        if text is not None:
+            event = f'{event[:-1]}, "result": {text}}}'
+        self._append_line(event + "\n", False)
+
+    def _append_line(self, line: str, durable: bool) -> None:
+        with self._cond:
+            self._buffer.append(line)
+            self._appended += 1
+            seq = self._appended
+            self._cond.notify_all()
+            if durable:
+                while self._committed < seq and not self._closed:
+                    self._cond.wait()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._file.close()
+
+    def _run_writer(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer and self._closed:
+                    return
+                lines, self._buffer = self._buffer, []
+                seq = self._appended
+            # One write and one fsync for everything appended since the last commit
+            self._file.write("".join(lines))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            with self._cond:
+                self._committed = seq
+                self._cond.notify_all()
+
+    def _replay(self) -> RecoveredState:
+        state = RecoveredState()
+        if not os.path.exists(self.path):
+            return state
+
+        job_batch = {}  # job_id -> batch_id for submitted jobs
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # torn write from a crash mid-append
+                kind = event["e"]
+                if kind == "enqueue":
+                    state.pending[event["job_id"]] = event
+                elif kind == "submit":
+                    requests, attempts = {}, {}
+                    for job_id in event["job_ids"]:
+                        n = 1
+                        if job_id in state.pending:
+                            requests[job_id] = state.pending.pop(job_id)
+                        else:
+                            # Submitted again after failing in an earlier batch: it moves to this one
+                            earlier = state.inflight.get(job_batch.get(job_id))
+                            if earlier is not None:
+                                n = earlier["attempts"].pop(job_id, 1) + 1
+                                earlier["job_ids"].pop(job_id, None)
+                                if job_id in earlier["requests"]:
+                                    requests[job_id] = earlier["requests"].pop(job_id)
+                                if not earlier["job_ids"]:
+                                    del state.inflight[earlier["batch_id"]]
+                        # A compacted log states the count; otherwise it's the submits seen
+                        n = event.get("attempts", {}).get(job_id, n)
+                        if n > 1:
+                            attempts[job_id] = n
+                        job_batch[job_id] = event["batch_id"]
+                    state.inflight[event["batch_id"]] = {
+                        **event, "job_ids": dict.fromkeys(event["job_ids"]), "requests": requests, "attempts": attempts,
+                    }
+                elif kind == "done":
+                    job_id = event["job_id"]
+                    state.pending.pop(job_id, None)
+                    batch = state.inflight.get(job_batch.pop(job_id, None))
+                    if batch is not None:
+                        batch["job_ids"].pop(job_id, None)
+                        batch["requests"].pop(job_id, None)
+                        batch["attempts"].pop(job_id, None)
+                        if not batch["job_ids"]:
+                            del state.inflight[batch["batch_id"]]
+                    if "result" in event or "error" in event:
+                        state.results[job_id] = event
+                elif kind == "collect":
+                    state.results.pop(event["job_id"], None)
+
+        # Compact: rewrite the log with only the live entries
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for event in state.events():
+                f.write(json.dumps(event) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return state
+
+
+def to_jsonable(response: Any) -> Optional[Any]:
+    """Best-effort JSON form of a provider response, or None if it has none."""
+    if hasattr(response, "model_dump"):
+        return response.model_dump()
+    if isinstance(response, (dict, list, str, int, float, bool)):
+        return response
+    return None
+
+
+def to_json(response: Any) -> Optional[str]:
+    """to_jsonable(response) as JSON text, or None. SDK (pydantic) responses are serialized
+    in one pass by model_dump_json(), without building the dict first."""
+    if hasattr(response, "model_dump_json"):
+        return response.model_dump_json()
+    jsonable = to_jsonable(response)
+    return json.dumps(jsonable) if jsonable is not None else None
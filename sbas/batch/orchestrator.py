@@ -1,30 +1,360 @@
 """
 BatchOrchestrator — submits batches to LLM provider batch APIs and polls for results.
+
+All in-flight provider batches are tracked by one shared poller thread. Each batch
+is re-checked on its own schedule, backing off while it is still running.
+
+With a TokenLedger, requests are admitted only while the estimated tokens enqueued per
+model stay under its quota; the rest are held back and submitted as batches complete.
+
+When a batch ends, every response in it is delivered, and only the requests that failed
+are dealt with: retryable failures (expired, rate limited, server errors, or missing
+from the results) are submitted again in a new batch, up to max_attempts batch
+runs per request, then optionally run sync; the rest fail their job.
 """
 
+import heapq
 import threading
 import time
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+from sbas.batch.executor import SyncExecutor
+from sbas.batch.packer import BatchPacker
+from sbas.batch.tokens import TokenLedger
+from sbas.batch.providers.anthropic import AnthropicBatchAdapter
+from sbas.batch.providers.errors import BatchItemError
+from sbas.batch.providers.openai import OpenAIBatchAdapter
+
+
+def adapter_for(client):
+    """Pick the provider batch adapter for a client. None if it has no batch API."""
+    if hasattr(client, "batches") and hasattr(client, "files"):
+        return OpenAIBatchAdapter(client)
+    messages = getattr(client, "messages", None)
+    if messages is not None and hasattr(messages, "batches"):
+        return AnthropicBatchAdapter(client)
+    return None
+
+
+class _InFlightBatch:
+    def __init__(
+        self,
+        batch_id: str,
+        adapter,
+        job_ids: List[str],
+        interval: float,
+        models: Optional[List[str]],
+        tokens: Optional[List[tuple]],
+        requests: Optional[Dict[str, dict]],
+    ):
+        self.batch_id = batch_id
+        self.adapter = adapter
+        self.job_ids = job_ids
+        self.interval = interval
+        self.models = models  # None when submitted by another process: turnaround unknown
+        self.tokens = tokens  # (model, tokens) reserved in the token ledger
+        self.requests = requests or {}  # job_id -> request, for the ones that can be retried
+        self.submitted_at = time.time()
+        self.poll_failures = 0  # status checks in a row that failed to reach the provider
 
 
 class BatchOrchestrator:
-    @staticmethod
-    def submit_and_poll(batch: dict, results: dict, lock: threading.Lock):
+    def __init__(
+        self,
+        on_result: Callable[[str, Any], None],
+        on_error: Callable[[str, Exception], None],
+        min_poll_interval: float = 5,
+        max_poll_interval: float = 300,
+        poll_backoff: float = 1.5,
+        packer: Optional[BatchPacker] = None,
+        on_submit: Optional[Callable[[str, str, List[str]], None]] = None,
+        on_turnaround: Optional[Callable[[str, str, float], None]] = None,
+        executor: Optional[SyncExecutor] = None,
+        token_ledger: Optional[TokenLedger] = None,
+        max_attempts: int = 3,
+        sync_fallback: bool = False,
+        max_poll_failures: int = 20,
+    ):
+        self._on_result = on_result
+        self._on_error = on_error
+        self._on_submit = on_submit
+        # Called with (provider, model, seconds) when a batch this process submitted ends
+        self.on_turnaround = on_turnaround
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.poll_backoff = poll_backoff
+        self.packer = packer or BatchPacker()
+        # Runs the individual calls for clients without a batch API
+        self.executor = executor or SyncExecutor()
+        self.token_ledger = token_ledger
+        # Batch runs per request before a retryable failure is final (or, with
+        # sync_fallback, before the request is run sync on the executor instead)
+        self.max_attempts = max_attempts
+        self.sync_fallback = sync_fallback
+        # Status checks in a row that may fail to reach the provider before a batch's jobs fail
+        self.max_poll_failures = max_poll_failures
+        self._held = {}        # id(adapter) -> (adapter, requests waiting for token quota)
+        self._adapters = {}    # id(client) -> (client, adapter or None)
+        self._inflight = {}    # batch_id -> _InFlightBatch
+        self._schedule = []    # heap of (next_poll_at, batch_id)
+        self._cond = threading.Condition()
+        self._poller = None
+        self._submitter = None  # one thread for submissions the poller triggers, started on demand
+        self._closed = False
+
+    def submit(self, batch: Dict[str, dict]) -> None:
         """
-        Submits a batch of requests to LLM provider and polls until all results arrive.
-        Falls back to individual sync calls if batch API is unavailable.
+        Submits a batch of requests through each client's provider batch API,
+        split into as many limit-compliant provider batches as needed.
+        Falls back to individual sync calls on the executor if the client has no batch API.
         """
+        by_client = {}
         for job_id, req in batch.items():
+            by_client.setdefault(id(req["client"]), []).append({"job_id": job_id, **req})
+
+        for requests in by_client.values():
+            adapter = self.adapter(requests[0]["client"])
+            if adapter is None:
+                self._run_sync(requests)
+                continue
+            self._submit_to(adapter, requests)
+
+    def _submit_to(self, adapter, requests: List[dict]) -> None:
+        """Pack and submit the requests that fit the token quotas; hold back the rest."""
+        batches, oversized = self.packer.pack(self._admit(adapter, requests), adapter)
+        for req in oversized:
+            self._release_tokens(req.get("tokens", ()))
+            self._on_error(req["job_id"], ValueError("Request is larger than the provider batch size limit"))
+        for requests in batches:
+            tokens = [(req["model"], req["tokens"]) for req in requests if "tokens" in req]
             try:
-                # Attempt batch API (provider-specific)
-                # For MVP: fall back to direct sync call
-                response = req["client"].chat.completions.create(
-                    model=req["model"],
-                    messages=req["messages"],
-                    **req["kwargs"],
-                )
-                with lock:
-                    results[job_id] = response
+                batch_id = adapter.submit(requests)
             except Exception as e:
-                with lock:
-                    results[job_id] = {"error": str(e)}
+                self._release_tokens(tokens)
+                for req in requests:
+                    self._on_error(req["job_id"], e)
+                continue
+            job_ids = [req["job_id"] for req in requests]
+            if self._on_submit is not None:
+                self._on_submit(batch_id, adapter.provider, job_ids)
+            self.track(
+                batch_id,
+                adapter,
+                job_ids,
+                models=list(dict.fromkeys(req["model"] for req in requests)),
+                tokens=tokens,
+                requests={req["job_id"]: req for req in requests} if self._retries() else None,
+            )
+
+    def _admit(self, adapter, requests: List[dict]) -> List[dict]:
+        """Reserve token quota for as many requests as fit, oldest (held back earlier) first."""
+        if self.token_ledger is None:
+            return requests
+        for req in requests:
+            if "tokens" not in req:
+                req["tokens"] = self.token_ledger.estimate(req["messages"], req["kwargs"], adapter.quota_counts_completion)
+        admitted, too_large = [], []
+        # One critical section from taking the held requests to putting back the ones still
+        # waiting: a concurrent call can't find them gone and let newer requests take the quota
+        with self._cond:
+            _, held = self._held.pop(id(adapter), (adapter, []))
+            still_held = []
+            for req in held + requests:
+                quota = self.token_ledger.quota(req["model"])
+                if quota is not None and req["tokens"] > quota:
+                    too_large.append(req)
+                elif self.token_ledger.reserve(req["model"], req["tokens"]):
+                    admitted.append(req)
+                else:
+                    still_held.append(req)
+            if still_held:
+                self._held[id(adapter)] = (adapter, still_held)
+        for req in too_large:
+            self._on_error(req["job_id"], ValueError("Request needs more tokens than the model's enqueued-token quota"))
+        return admitted
+
+    def _release_tokens(self, tokens) -> None:
+        if self.token_ledger is not None:
+            for model, n in tokens:
+                self.token_ledger.release(model, n)
+
+    def held(self) -> int:
+        """Requests waiting for enqueued-token quota."""
+        with self._cond:
+            return sum(len(requests) for _, requests in self._held.values())
+
+    def track(
+        self,
+        batch_id: str,
+        adapter,
+        job_ids: List[str],
+        models: Optional[List[str]] = None,
+        tokens: Optional[List[tuple]] = None,
+        requests: Optional[Dict[str, dict]] = None,
+    ) -> None:
+        """Hand a submitted provider batch to the shared poller. Tracking a batch that is
+        already tracked adds job_ids to it. Failed jobs can only be retried when their
+        request ({job_id: {"model", "messages", "kwargs", "client"}}) is given."""
+        with self._cond:
+            entry = self._inflight.get(batch_id)
+            if entry is not None:
+                entry.job_ids = list(dict.fromkeys([*entry.job_ids, *job_ids]))
+                entry.requests.update(requests or {})
+                return
+            self._inflight[batch_id] = _InFlightBatch(
+                batch_id, adapter, job_ids, self.min_poll_interval, models, tokens, requests
+            )
+            heapq.heappush(self._schedule, (time.time() + self.min_poll_interval, batch_id))
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._run_poller, name="sbas-batch-poller", daemon=True)
+                self._poller.start()
+            self._cond.notify()
+
+    def in_flight(self) -> int:
+        with self._cond:
+            return len(self._inflight)
+
+    def close(self) -> None:
+        """Stop the poller. Batches still in flight are no longer checked."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._poller is not None:
+            self._poller.join()
+        with self._cond:
+            submitter, self._submitter = self._submitter, None
+        if submitter is not None:
+            submitter.shutdown(wait=True)
+
+    def adapter(self, client):
+        """Cached adapter_for(client)."""
+        entry = self._adapters.get(id(client))
+        if entry is None or entry[0] is not client:
+            entry = (client, adapter_for(client))
+            self._adapters[id(client)] = entry
+        return entry[1]
+
+    def _run_poller(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    if self._schedule and self._schedule[0][0] <= time.time():
+                        break
+                    timeout = self._schedule[0][0] - time.time() if self._schedule else None
+                    self._cond.wait(timeout)
+                due = []
+                while self._schedule and self._schedule[0][0] <= time.time():
+                    _, batch_id = heapq.heappop(self._schedule)
+                    if batch_id in self._inflight:
+                        due.append(self._inflight[batch_id])
+            for entry in due:
+                self._check(entry)
+
+    def _check(self, entry: _InFlightBatch):
+        try:
+            batch = entry.adapter.check(entry.batch_id)
+        except RuntimeError as e:
+            self._finish(entry)
+            for job_id in entry.job_ids:
+                self._on_error(job_id, e)
+            return
+        except Exception as e:
+            # Transient failure talking to the provider: try again later, up to a point
+            entry.poll_failures += 1
+            if entry.poll_failures >= self.max_poll_failures:
+                self._finish(entry)
+                for job_id in entry.job_ids:
+                    self._on_error(job_id, e)
+                return
+            batch = None
+        else:
+            entry.poll_failures = 0
+
+        if batch is None:
+            with self._cond:
+                entry.interval = min(entry.interval * self.poll_backoff, self.max_poll_interval)
+                heapq.heappush(self._schedule, (time.time() + entry.interval, entry.batch_id))
+            return
+
+        self._finish(entry)
+        delivered = set()
+        failed = []
+        try:
+            for job_id, response in entry.adapter.iter_results(batch):
+                delivered.add(job_id)
+                if isinstance(response, BatchItemError):
+                    failed.append(response)
+                else:
+                    self._on_result(job_id, response)
+        except Exception as e:
+            for job_id in entry.job_ids:
+                if job_id not in delivered:
+                    self._on_error(job_id, e)
+        else:
+            for job_id in entry.job_ids:
+                if job_id not in delivered:
+                    failed.append(BatchItemError(job_id, "missing", "no result in the ended batch", retryable=True))
+            # Only batches that ran everything say how long a batch takes
+            if not failed and getattr(batch, "status", "completed") == "completed":
+                self._report_turnaround(entry)
+        if failed:
+            self._retry(entry, failed)
+
+    def _retries(self) -> bool:
+        return self.max_attempts > 1 or self.sync_fallback
+
+    def _retry(self, entry: _InFlightBatch, failed: List[BatchItemError]):
+        """Submit the retryable failures of an ended batch again; fail the rest."""
+        again = []
+        for error in failed:
+            req = entry.requests.get(error.job_id)
+            if not error.retryable or req is None:
+                self._on_error(error.job_id, error)
+            elif req.get("attempts", 1) < self.max_attempts:
+                req["attempts"] = req.get("attempts", 1) + 1
+                again.append(req)
+            elif self.sync_fallback:
+                self._run_sync([req])
+            else:
+                self._on_error(error.job_id, error)
+        if again:
+            self._submit_later(entry.adapter, again)
+
+    def _submit_later(self, adapter, requests: List[dict]) -> None:
+        """_submit_to on the submitter thread, so the poller isn't held up uploading."""
+        with self._cond:
+            if self._submitter is None:
+                self._submitter = ThreadPoolExecutor(1, thread_name_prefix="sbas-batch-submit")
+            submitter = self._submitter
+        submitter.submit(self._submit_to, adapter, requests)
+
+    def _report_turnaround(self, entry: _InFlightBatch):
+        if self.on_turnaround is not None and entry.models:
+            elapsed = time.time() - entry.submitted_at
+            for model in entry.models:
+                self.on_turnaround(entry.adapter.provider, model, elapsed)
+
+    def _finish(self, entry: _InFlightBatch):
+        with self._cond:
+            self._inflight.pop(entry.batch_id, None)
+        if entry.tokens:
+            self._release_tokens(entry.tokens)
+            # Quota freed up: submit what was held back
+            with self._cond:
+                held = list(self._held.values())
+            for adapter, _ in held:
+                self._submit_later(adapter, [])
+
+    def _run_sync(self, requests: List[dict]):
+        for req in requests:
+            future = self.executor.submit(req["client"], req["model"], req["messages"], req["kwargs"])
+            future.add_done_callback(lambda done, job_id=req["job_id"]: self._deliver(job_id, done))
+
+    def _deliver(self, job_id: str, done):
+        if done.exception() is not None:
+            self._on_error(job_id, done.exception())
+        else:
+            self._on_result(job_id, done.result())
@@ -0,0 +1,43 @@
+"""
+BatchPacker — splits flushed requests into provider batches that respect batch limits.
+"""
+
+from typing import List, Dict, Optional, Tuple
+
+
+class BatchPacker:
+    """
+    Groups requests by model when the provider needs one model per batch, then fills
+    each batch up to the provider's request-count and byte limits, in arrival order.
+    max_requests / max_bytes can lower the provider limits further.
+    """
+
+    def __init__(self, max_requests: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+
+    def pack(self, requests: List[Dict], adapter) -> Tuple[List[List[Dict]], List[Dict]]:
+        """Returns (batches, oversized) where oversized requests cannot fit any batch on their own."""
+        max_requests = min(adapter.max_requests, self.max_requests or adapter.max_requests)
+        max_bytes = min(adapter.max_bytes, self.max_bytes or adapter.max_bytes)
+
+        groups = {}
+        for req in requests:
+            groups.setdefault(req["model"] if adapter.single_model else None, []).append(req)
+
+        batches, oversized = [], []
+        for group in groups.values():
+            current, size = [], 0
+            for req in group:
+                req_size = adapter.request_size(req)
+                if req_size > max_bytes:
+                    oversized.append(req)
+                    continue
+                if current and (len(current) >= max_requests or size + req_size > max_bytes):
+                    batches.append(current)
+                    current, size = [], 0
+                current.append(req)
+                size += req_size
+            if current:
+                batches.append(current)
+        return batches, oversized
@@ -4,41 +4,116 @@ Uses /v1/messages/batches endpoint for 50% cost reduction.
 Docs: https://docs.anthropic.com/en/docs/build-with-claude/message-batches
 """
 
+import json
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
+
+from sbas.batch.providers.errors import BatchItemError
+
+# error.type of errored results worth another attempt
+_RETRYABLE_ERRORS = {"rate_limit_error", "api_error", "overloaded_error", "timeout_error"}
+# Request kwargs passed on to the Messages API as they are
+_PARAMS = ("temperature", "top_p", "top_k", "stop_sequences", "metadata", "tools", "tool_choice")
 
 
 class AnthropicBatchAdapter:
+    provider = "anthropic"
+    # Message batch limits: models may be mixed, at most 100,000 requests and 256 MB
+    single_model = False
+    max_requests = 100_000
+    max_bytes = 256 * 1024 * 1024
+    # Enqueued-token quotas charge each request's max_tokens as well as its input
+    quota_counts_completion = True
+
     def __init__(self, client):
         self._client = client
 
     def submit(self, requests: List[Dict]) -> str:
         """Submit a batch of requests. Returns batch_id."""
-        batch_requests = []
-        for req in requests:
-            batch_requests.append({
-                "custom_id": req["job_id"],
-                "params": {
-                    "model": req["model"],
-                    "messages": req["messages"],
-                    "max_tokens": req.get("kwargs", {}).get("max_tokens", 1024),
-                }
-            })
-        
-        batch = self._client.messages.batches.create(requests=batch_requests)
+        batch = self._client.messages.batches.create(requests=self._batch_requests(requests))
         return batch.id
 
+    async def asubmit(self, requests: List[Dict]) -> str:
+        """submit() for an AsyncAnthropic client."""
+        batch = await self._client.messages.batches.create(requests=self._batch_requests(requests))
+        return batch.id
+
+    def check(self, batch_id: str) -> Optional[Any]:
+        """One status request. Returns the batch once it has ended, None while still running."""
+        batch = self._client.messages.batches.retrieve(batch_id)
+        return batch if batch.processing_status == "ended" else None
+
+    async def acheck(self, batch_id: str) -> Optional[Any]:
+        """check() for an AsyncAnthropic client."""
+        batch = await self._client.messages.batches.retrieve(batch_id)
+        return batch if batch.processing_status == "ended" else None
+
+    def iter_results(self, batch) -> Iterator[Tuple[str, Any]]:
+        """Yield (job_id, response) pairs for an ended batch. Errored, expired and canceled
+        requests come with a BatchItemError as response."""
+        for result in self._client.messages.batches.results(batch.id):
+            yield result.custom_id, self._outcome(result)
+
+    async def aiter_results(self, batch) -> AsyncIterator[Tuple[str, Any]]:
+        """iter_results() for an AsyncAnthropic client."""
+        async for result in await self._client.messages.batches.results(batch.id):
+            yield result.custom_id, self._outcome(result)
+
+    def request_size(self, req: Dict) -> int:
+        """Bytes this request adds to the batch request body."""
+        return len(json.dumps(self._batch_request(req))) + 1
+
+    @staticmethod
+    def _outcome(result) -> Any:
+        outcome = result.result
+        if outcome.type == "succeeded":
+            return outcome.message
+        if outcome.type == "errored":
+            error = getattr(outcome, "error", None)
+            error = getattr(error, "error", error)  # ErrorResponse wraps the error object
+            error_type = getattr(error, "type", None)
+            message = getattr(error, "message", None) or error_type or "unknown error"
+            return BatchItemError(result.custom_id, "errored", message, retryable=error_type in _RETRYABLE_ERRORS)
+        # "expired" or "canceled": the batch ended before the request ran. Only an expired one
+        # is worth another batch; a canceled batch was stopped on purpose.
+        return BatchItemError(
+            result.custom_id, outcome.type, "the batch ended before it ran", retryable=outcome.type == "expired"
+        )
+
+    @classmethod
+    def _batch_requests(cls, requests: List[Dict]) -> List[Dict]:
+        return [cls._batch_request(req) for req in requests]
+
+    @staticmethod
+    def _batch_request(req: Dict) -> Dict:
+        kwargs = req.get("kwargs") or {}
+        # Chat-style system messages go in the Messages API's top-level system parameter
+        system = [m["content"] for m in req["messages"] if m["role"] == "system"]
+        if kwargs.get("system") is not None:
+            system.insert(0, kwargs["system"])
+        params = {
+            "model": req["model"],
+            "messages": [m for m in req["messages"] if m["role"] != "system"],
+            "max_tokens": kwargs.get("max_tokens", 1024),
+        }
+        if system:
+            if all(isinstance(part, str) for part in system):
+                params["system"] = "\n\n".join(system)
+            else:
+                params["system"] = [
+                    block for part in system
+                    for block in ([{"type": "text", "text": part}] if isinstance(part, str) else part)
+                ]
+        params.update((name, kwargs[name]) for name in _PARAMS if kwargs.get(name) is not None)
+        if kwargs.get("stop") is not None and "stop_sequences" not in params:
+            stop = kwargs["stop"]
+            params["stop_sequences"] = [stop] if isinstance(stop, str) else list(stop)
+        return {"custom_id": req["job_id"], "params": params}
+
     def poll(self, batch_id: str, poll_interval: int = 30) -> Dict[str, Any]:
-        """Poll until batch is complete. Returns dict of job_id -> response."""
+        """Poll until batch is complete. Returns dict of job_id -> response (or BatchItemError)."""
         while True:
-            batch = self._client.messages.batches.retrieve(batch_id)
-            if batch.processing_status == "ended":
-                return self._parse_results(batch_id)
+            batch = self.check(batch_id)
+            if batch is not None:
+                return dict(self.iter_results(batch))
             time.sleep(poll_interval)
-
-    def _parse_results(self, batch_id: str) -> Dict[str, Any]:
-        results = {}
-        for result in self._client.messages.batches.results(batch_id):
-            if result.result.type == "succeeded":
-                results[result.custom_id] = result.result.message
-        return results
@@ -0,0 +1,32 @@
+"""
+Per-request outcomes of a provider batch that ended without a response for the request.
+
+Adapters yield a BatchItemError in place of the response for each such request, so one
+bad or expired item doesn't take the rest of the batch down with it. `retryable` says
+whether running the request again can be expected to succeed (and is wanted: requests
+of a canceled batch are not retried).
+"""
+
+from typing import Optional
+
+# HTTP statuses worth another attempt: timeouts, conflicts, rate limits, server errors
+_RETRYABLE_STATUSES = {408, 409, 429}
+
+
+def retryable_status(status: Optional[int]) -> bool:
+    return status is not None and (status in _RETRYABLE_STATUSES or status >= 500)
+
+
+class BatchItemError(RuntimeError):
+    """
+    kind is "errored" (the provider ran the request and it failed), "expired" or
+    "canceled" (the batch ended before the request ran), or "missing" (the ended batch
+    has no result for it at all).
+    """
+
+    def __init__(self, job_id: str, kind: str, message: str, retryable: bool, status: Optional[int] = None):
+        super().__init__(f"Batch request {job_id} {kind}: {message}")
+        self.job_id = job_id
+        self.kind = kind
+        self.retryable = retryable
+        self.status = status
@@ -4,61 +4,183 @@ Uses /v1/batches endpoint for 50% cost reduction.
 Docs: https://platform.openai.com/docs/guides/batch
 """
 
+import functools
 import json
+import tempfile
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
+
+from sbas.batch.providers.errors import BatchItemError, retryable_status
+
+# error.code OpenAI writes to the error file for requests a batch never ran
+_NOT_RUN = {"batch_expired": "expired", "batch_cancelled": "canceled"}
+# Of those, the ones worth another batch: a cancelled batch was stopped on purpose
+_RERUN = {"expired"}
+
+
+@functools.lru_cache(maxsize=None)
+def _completion_type():
+    """openai's ChatCompletion, or None without the openai package."""
+    try:
+        from openai.types.chat import ChatCompletion
+    except ImportError:
+        return None
+    return ChatCompletion
+
+
+def _completion(body: Dict) -> Any:
+    """A result body as the ChatCompletion client.chat.completions.create() would return.
+    Bodies that don't validate as one are passed on as the dict they are."""
+    completion_type = _completion_type()
+    if completion_type is None:
+        return body
+    try:
+        return completion_type.model_validate(body)
+    except ValueError:  # pydantic's ValidationError
+        return body
 
 
 class OpenAIBatchAdapter:
-    def __init__(self, client):
+    provider = "openai"
+    # Batch file limits: one model per file, at most 50,000 requests and 200 MB
+    single_model = True
+    max_requests = 50_000
+    max_bytes = 200 * 1024 * 1024
+    # The enqueued-token limit for batches counts input tokens only
+    quota_counts_completion = False
+
+    def __init__(self, client, spool_max_size: int = 8 * 1024 * 1024):
         self._client = client
+        self.spool_max_size = spool_max_size  # batch files larger than this are spooled to disk
 
     def submit(self, requests: List[Dict]) -> str:
         """Submit a batch of requests. Returns batch_id."""
-        # Build JSONL batch file
-        lines = []
-        for req in requests:
-            lines.append(json.dumps({
-                "custom_id": req["job_id"],
-                "method": "POST",
-                "url": "/v1/chat/completions",
-                "body": {
-                    "model": req["model"],
-                    "messages": req["messages"],
-                    **req.get("kwargs", {}),
-                }
-            }))
-        
-        jsonl_content = "\n".join(lines).encode()
-        
-        # Upload file
-        file_obj = self._client.files.create(
-            file=("batch.jsonl", jsonl_content, "application/jsonl"),
-            purpose="batch",
-        )
+        with self._spool(requests) as jsonl:
+            # Upload file
+            file_obj = self._client.files.create(
+                file=("batch.jsonl", jsonl, "application/jsonl"),
+                purpose="batch",
+            )
         
         # Create batch
-        batch = self._client.batches.create(
-            input_file_id=file_obj.id,
-            endpoint="/v1/chat/completions",
-            completion_window="24h",
-        )
+        batch = self._client.batches.create(**self._batch_params(file_obj.id))
         return batch.id
 
+    async def asubmit(self, requests: List[Dict]) -> str:
+        """submit() for an AsyncOpenAI client."""
+        with self._spool(requests) as jsonl:
+            file_obj = await self._client.files.create(
+                file=("batch.jsonl", jsonl, "application/jsonl"),
+                purpose="batch",
+            )
+        batch = await self._client.batches.create(**self._batch_params(file_obj.id))
+        return batch.id
+
+    def check(self, batch_id: str) -> Optional[Any]:
+        """One status request. Returns the batch once it has ended, None while still running."""
+        return self._ended(self._client.batches.retrieve(batch_id))
+
+    async def acheck(self, batch_id: str) -> Optional[Any]:
+        """check() for an AsyncOpenAI client."""
+        return self._ended(await self._client.batches.retrieve(batch_id))
+
+    def iter_results(self, batch) -> Iterator[Tuple[str, Any]]:
+        """
+        Yield (job_id, response) pairs for an ended batch, streaming the output file and then
+        the error file line by line. Failed requests come with a BatchItemError as response.
+        """
+        files = self._client.files
+        for file_id in self._result_files(batch):
+            if hasattr(files, "with_streaming_response"):
+                with files.with_streaming_response.content(file_id) as response:
+                    for line in response.iter_lines():
+                        if line:
+                            yield self._parse_line(line)
+            else:
+                for line in files.content(file_id).iter_lines():
+                    if line:
+                        yield self._parse_line(line)
+
+    async def aiter_results(self, batch) -> AsyncIterator[Tuple[str, Any]]:
+        """iter_results() for an AsyncOpenAI client."""
+        files = self._client.files
+        for file_id in self._result_files(batch):
+            if hasattr(files, "with_streaming_response"):
+                async with files.with_streaming_response.content(file_id) as response:
+                    async for line in response.iter_lines():
+                        if line:
+                            yield self._parse_line(line)
+            else:
+                for line in (await files.content(file_id)).iter_lines():
+                    if line:
+                        yield self._parse_line(line)
+
+    def request_size(self, req: Dict) -> int:
+        """Bytes this request takes up in the batch file."""
+        return len(self._line(req)) + 1
+
+    def _spool(self, requests: List[Dict]):
+        """Write the JSONL batch file one request at a time. Returns a file rewound to the start."""
+        jsonl = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size)
+        for req in requests:
+            jsonl.write(self._line(req))
+            jsonl.write(b"\n")
+        jsonl.seek(0)
+        return jsonl
+
+    @staticmethod
+    def _line(req: Dict) -> bytes:
+        return json.dumps({
+            "custom_id": req["job_id"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": req["model"],
+                "messages": req["messages"],
+                **req.get("kwargs", {}),
+            }
+        }).encode()
+
+    @staticmethod
+    def _batch_params(input_file_id: str) -> dict:
+        return {
+            "input_file_id": input_file_id,
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+        }
+
+    @staticmethod
+    def _ended(batch) -> Optional[Any]:
+        # Expired and cancelled batches keep the results of the requests that did run
+        if batch.status in ("completed", "cancelled", "expired"):
+            return batch
+        elif batch.status == "failed":  # the input file was rejected: nothing ran
+            raise RuntimeError(f"Batch {batch.id} failed with status: {batch.status}")
+        return None
+
+    @staticmethod
+    def _result_files(batch) -> List[str]:
+        return [file_id for file_id in (batch.output_file_id, getattr(batch, "error_file_id", None)) if file_id]
+
+    @staticmethod
+    def _parse_line(line: str) -> Tuple[str, Any]:
+        item = json.loads(line)
+        job_id = item["custom_id"]
+        response = item.get("response") or {}
+        status = response.get("status_code")
+        if item.get("error") is None and (status is None or status < 400):
+            return job_id, _completion(response["body"])
+        error = item.get("error") or (response.get("body") or {}).get("error") or {}
+        message = error.get("message") or f"status {status}"
+        if error.get("code") in _NOT_RUN:
+            kind = _NOT_RUN[error["code"]]
+            return job_id, BatchItemError(job_id, kind, message, retryable=kind in _RERUN)
+        return job_id, BatchItemError(job_id, "errored", message, retryable=retryable_status(status), status=status)
+
     def poll(self, batch_id: str, poll_interval: int = 30) -> Dict[str, Any]:
-        """Poll until batch is complete. Returns dict of job_id -> response."""
+        """Poll until batch is complete. Returns dict of job_id -> response (or BatchItemError)."""
         while True:
-            batch = self._client.batches.retrieve(batch_id)
-            if batch.status == "completed":
-                return self._parse_results(batch.output_file_id)
-            elif batch.status in ("failed", "cancelled", "expired"):
-                raise RuntimeError(f"Batch {batch_id} failed with status: {batch.status}")
+            batch = self.check(batch_id)
+            if batch is not None:
+                return dict(self.iter_results(batch))
             time.sleep(poll_interval)
-
-    def _parse_results(self, output_file_id: str) -> Dict[str, Any]:
-        content = self._client.files.content(output_file_id).text
-        results = {}
-        for line in content.strip().split("\n"):
-            item = json.loads(line)
-            results[item["custom_id"]] = item["response"]["body"]
-        return results
@@ -1,48 +1,335 @@
 """
 BatchQueue — collects LLM requests and groups them for batch submission.
+
+A background flusher submits the queue when it is full, when the oldest request
+has waited max_wait_sec, or earlier when a request's latency budget is at risk.
 """
 
-from typing import Optional, Dict, Any
+from concurrent.futures import Future
+from typing import Callable, Optional, Dict, Any, List
+import heapq
+import re
+import sys
 import threading
+import time
+
+from sbas.batch.log import BatchLog, to_json
+from sbas.batch.orchestrator import BatchOrchestrator
+from sbas.batch.results import ResultStore
+from sbas.batch.tokens import TokenLedger
+
+
+_BUDGET_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhd])\s*$")
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def budget_seconds(latency_budget: Optional[str]) -> Optional[float]:
+    """Convert a latency budget like "30m", "1h" or "24h" to seconds. None if unbounded."""
+    if not latency_budget or latency_budget == "realtime":
+        return None
+    match = _BUDGET_RE.match(str(latency_budget))
+    if not match:
+        raise ValueError(f"Invalid latency budget: {latency_budget!r}")
+    return float(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+
+
+def flush_times(now, latency_budget, deadline, max_wait_sec, max_wait_fraction):
+    """Returns (deadline, flush_by) for a request enqueued at `now`."""
+    if deadline is None:
+        budget = budget_seconds(latency_budget)
+        deadline = now + budget if budget is not None else None
+    flush_by = now + max_wait_sec
+    if deadline is not None:
+        flush_by = min(flush_by, now + max(deadline - now, 0) * max_wait_fraction)
+    return deadline, flush_by
+
+
+class QueuedRequest:
+    """
+    A request waiting in the queue. Slots instead of a dict: with hundreds of thousands
+    queued, the per-request dict is most of the queue's own memory. `messages`, `kwargs`
+    and `client` are the caller's objects (the same ones the StateManager saved), never copies.
+    """
+
+    __slots__ = ("model", "messages", "kwargs", "client", "enqueued_at", "deadline")
+
+    def __init__(self, model: str, messages: list, kwargs: dict, client, enqueued_at: float, deadline: Optional[float]):
+        self.model = sys.intern(model)  # one string per model name, not one per request
+        self.messages = messages
+        self.kwargs = kwargs or None    # most requests have none
+        self.client = client
+        self.enqueued_at = enqueued_at
+        self.deadline = deadline
+
+    def as_dict(self) -> dict:
+        """The request dict the orchestrator and adapters take, built when the batch is flushed."""
+        return {
+            "model": self.model,
+            "messages": self.messages,
+            "kwargs": self.kwargs if self.kwargs is not None else {},
+            "client": self.client,
+            "enqueued_at": self.enqueued_at,
+            "deadline": self.deadline,
+        }
 
 
 class BatchQueue:
-    def __init__(self, max_size: int = 100, max_wait_sec: int = 300):
-        self._queue = {}       # job_id -> request
-        self._results = {}     # job_id -> response
+    def __init__(
+        self,
+        max_size: int = 100,
+        max_wait_sec: int = 300,
+        max_wait_fraction: float = 0.1,
+        orchestrator=None,
+        log: Optional[BatchLog] = None,
+        token_ledger: Optional[TokenLedger] = None,
+        result_store: Optional[ResultStore] = None,
+    ):
+        self._queue = {}       # job_id -> QueuedRequest
+        # Responses not yet collected, under a memory budget and ttl
+        self._results = result_store if result_store is not None else ResultStore()
+        self._futures = {}     # job_id -> Future, until the job completes
+        self._failed = {}      # job_id -> error message, for failures recovered from the log
+        self._due = []         # heap of (flush_by, job_id)
         self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._flusher = None
+        self._closed = False
         self.max_size = max_size
         self.max_wait_sec = max_wait_sec
+        # Share of a request's latency budget it may spend waiting in the queue;
+        # the rest is left for the provider to turn the batch around.
+        self.max_wait_fraction = max_wait_fraction
+        self.orchestrator = orchestrator or BatchOrchestrator(
+            on_result=self._store_result,
+            on_error=self._store_error,
+            on_submit=self._log_submit,
+            token_ledger=token_ledger,  # per-model quotas on tokens enqueued in provider batches
+        )
+        # Optional write-ahead log; see recover()
+        self.log = log
+        # Called with (batch_id, provider, job_ids) after each provider batch submission
+        self.on_submit: Optional[Callable[[str, str, List[str]], None]] = None
 
-    def enqueue(self, job_id: str, model: str, messages: list, kwargs: dict, client) -> None:
-        with self._lock:
-            self._queue[job_id] = {
+    def enqueue(
+        self,
+        job_id: str,
+        model: str,
+        messages: list,
+        kwargs: dict,
+        client,
+        latency_budget: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> Future:
+        """Queue a request. The returned Future resolves when its response is stored."""
+        future = Future()
+        now = time.time()
+        deadline, flush_by = flush_times(now, latency_budget, deadline, self.max_wait_sec, self.max_wait_fraction)
+
+        if self.log is not None:
+            adapter = self.orchestrator.adapter(client)
+            self.log.append({
+                "e": "enqueue",
+                "job_id": job_id,
+                "provider": adapter.provider if adapter is not None else "sync",
                 "model": model,
                 "messages": messages,
                 "kwargs": kwargs,
-                "client": client,
-            }
-        # Auto-submit if batch is full
-        if len(self._queue) >= self.max_size:
-            self._submit_batch()
+                "deadline": deadline,
+                "flush_by": flush_by,
+            }, durable=self.log.sync_enqueue)
+
+        with self._cond:
+            self._queue[job_id] = QueuedRequest(model, messages, kwargs, client, now, deadline)
+            self._futures[job_id] = future
+            heapq.heappush(self._due, (flush_by, job_id))
+            self._ensure_flusher()
+            # Wake the flusher if the batch is full or this request moved the next flush earlier
+            if len(self._queue) >= self.max_size or self._due[0][1] == job_id:
+                self._cond.notify()
+        return future
 
     def get_result(self, job_id: str) -> Optional[Any]:
+        """
+        Remove and return job_id's response, or None. A response the ResultStore spilled to
+        disk, or recovered from the log, comes back as a plain dict (`model_dump()` of the
+        response), not the provider's response object.
+        """
+        result = self._results.pop(job_id)
+        if result is not None and self.log is not None:
+            self.log.append({"e": "collect", "job_id": job_id})
+        return result
+
+    def recover(self, client) -> List[str]:
+        """
+        Re-attach work recorded in the log to this process, for requests made with `client`'s provider.
+        Unsubmitted requests are queued again, in-flight provider batches are polled again
+        (not resubmitted) and undelivered results become available through get_result();
+        undelivered failures are returned, once, by find(). Returns the recovered job_ids.
+        """
+        if self.log is None:
+            return []
+        recovered = self.log.recovered
+        adapter = self.orchestrator.adapter(client)
+        provider = adapter.provider if adapter is not None else "sync"
+        job_ids = []
+
+        with self._cond:
+            for job_id, event in list(recovered.pending.items()):
+                if event["provider"] != provider:
+                    continue
+                del recovered.pending[job_id]
+                self._queue[job_id] = QueuedRequest(
+                    event["model"], event["messages"], event["kwargs"], client, time.time(), event["deadline"]
+                )
+                self._futures[job_id] = Future()
+                heapq.heappush(self._due, (event["flush_by"], job_id))
+                job_ids.append(job_id)
+            if self._queue:
+                self._ensure_flusher()
+                self._cond.notify()
+
+            for job_id, event in list(recovered.results.items()):
+                del recovered.results[job_id]
+                if "error" in event:
+                    self._failed[job_id] = event["error"]
+                else:
+                    self._results.put(job_id, event["result"])
+                job_ids.append(job_id)
+
+        if adapter is not None:
+            for batch_id, event in list(recovered.inflight.items()):
+                if event["provider"] != provider:
+                    continue
+                del recovered.inflight[batch_id]
+                with self._lock:
+                    for job_id in event["job_ids"]:
+                        self._futures[job_id] = Future()
+                # The logged requests let failed items be retried, counting the batches they already ran in
+                attempts = event.get("attempts", {})
+                requests = {
+                    job_id: {"job_id": job_id, "model": req["model"], "messages": req["messages"],
+                             "kwargs": req["kwargs"], "client": client, "attempts": attempts.get(job_id, 1)}
+                    for job_id, req in event.get("requests", {}).items()
+                }
+                self.orchestrator.track(batch_id, adapter, list(event["job_ids"]), requests=requests)
+                job_ids.extend(event["job_ids"])
+        return job_ids
+
+    def find(self, job_id: str) -> Optional[Future]:
+        """The Future of a job this queue knows about (queued, in flight, or with a result or a
+        recovered failure waiting), else None. A recovered failure is handed out only once."""
         with self._lock:
-            return self._results.pop(job_id, None)
+            future = self._futures.get(job_id)
+            error = self._failed.pop(job_id, None) if future is None else None
+        if error is not None:
+            if self.log is not None:
+                self.log.append({"e": "collect", "job_id": job_id})
+            future = Future()
+            future.set_exception(RuntimeError(error))
+        elif future is None:
+            result = self._results.get(job_id)
+            if result is not None:
+                future = Future()
+                future.set_result(result)
+        return future
 
-    def _submit_batch(self):
-        """Submit current queue as a batch to LLM provider."""
-        from sbas.batch.orchestrator import BatchOrchestrator
+    def attach(self, job_id: str, batch_id: str, client, request: Optional[dict] = None) -> Future:
+        """
+        Wait for `job_id`'s response from provider batch `batch_id`, submitted with `client`'s
+        provider by an earlier process. The batch is polled, not resubmitted. Given the original
+        `request` ({"model", "messages", "kwargs"}), the job can be retried if it fails in the batch.
+        """
+        adapter = self.orchestrator.adapter(client)
+        if adapter is None:
+            raise ValueError("Client has no batch API to re-attach to")
         with self._lock:
-            if not self._queue:
-                return
-            batch = dict(self._queue)
-            self._queue.clear()
-        
-        # Submit in background thread
-        thread = threading.Thread(
-            target=BatchOrchestrator.submit_and_poll,
-            args=(batch, self._results, self._lock),
-            daemon=True,
-        )
-        thread.start()
+            future = self._futures.get(job_id)
+            if future is not None:
+                return future
+            future = self._futures[job_id] = Future()
+        requests = None
+        if request is not None:
+            requests = {job_id: {**request, "job_id": job_id, "client": client}}
+        self.orchestrator.track(batch_id, adapter, [job_id], requests=requests)
+        return future
+
+    def flush(self) -> int:
+        """Submit everything queued right now. Returns the number of requests submitted."""
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._submit_batch(batch)
+        return len(batch)
+
+    def close(self, flush: bool = True) -> None:
+        """Stop the background flusher, optionally submitting what is still queued."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        if flush:
+            self.flush()
+
+    def _ensure_flusher(self):
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._run_flusher, name="sbas-batch-flusher", daemon=True)
+            self._flusher.start()
+
+    def _next_flush_at(self) -> Optional[float]:
+        """Earliest flush_by among queued requests (called with the lock held)."""
+        while self._due and self._due[0][1] not in self._queue:
+            heapq.heappop(self._due)
+        return self._due[0][0] if self._due else None
+
+    def _run_flusher(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    flush_at = self._next_flush_at()
+                    if len(self._queue) >= self.max_size:
+                        break
+                    if flush_at is not None and flush_at <= time.time():
+                        break
+                    self._cond.wait(None if flush_at is None else flush_at - time.time())
+                batch = self._take_batch()
+            if batch:
+                self._submit_batch(batch)
+
+    def _take_batch(self) -> dict:
+        """Detach the current queue contents (called with the lock held)."""
+        batch = {job_id: req.as_dict() for job_id, req in self._queue.items()}
+        self._queue.clear()
+        self._due.clear()
+        return batch
+
+    def _submit_batch(self, batch: dict):
+        """Submit a batch to the LLM provider."""
+        self.orchestrator.submit(batch)
+
+    def _log_submit(self, batch_id: str, provider: str, job_ids: List[str]) -> None:
+        if self.log is not None:
+            self.log.append({"e": "submit", "batch_id": batch_id, "provider": provider, "job_ids": job_ids}, durable=True)
+        if self.on_submit is not None:
+            self.on_submit(batch_id, provider, job_ids)
+
+    def _store_result(self, job_id: str, response: Any) -> None:
+        text = None
+        if self.log is not None:
+            text = to_json(response)  # serialized once, for the log and the result store
+            self.log.append_result(job_id, text)
+        self._results.put(job_id, response, text=text)
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+        if future is not None:
+            future.set_result(response)
+
+    def _store_error(self, job_id: str, error: Exception) -> None:
+        if self.log is not None:
+            self.log.append({"e": "done", "job_id": job_id, "error": str(error)})
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+        if future is not None:
+            future.set_exception(error)
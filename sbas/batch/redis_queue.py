@@ -0,0 +1,362 @@
+"""
+RedisBatchQueue — one batch queue shared by every worker process, on Redis.
+
+Any process can enqueue. Requests wait in Redis (a hash of requests plus a sorted set
+ordered by flush_by) until the elected leader — whichever process holds a short lease
+key — takes them all and submits them through its own client and orchestrator, so
+40 workers fill one batch instead of 40 small ones. Taking a request moves it to a
+hash of claims, in one transaction, until its provider batch is recorded; a new leader
+queues again the claims of a leader that died before submitting them. The leader sends each result to
+the list of the worker that enqueued it, where a listener thread completes the
+PendingJob; a list nobody reads (its worker died or closed) expires after `results_ttl`. In-flight provider batches are recorded in Redis, and a newly elected
+leader picks them up, so a leader can die without stranding its batches.
+
+Every worker must use the same provider account: the leader submits everyone's
+requests with its own client. Results are plain dicts (`model_dump()` of the response)
+in every process, the leader's own jobs included, like results recovered from a
+BatchLog; a response with no JSON form comes back as None.
+"""
+
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, List, Optional
+
+from sbas.batch.log import to_jsonable
+from sbas.batch.orchestrator import BatchOrchestrator
+from sbas.batch.queue import flush_times
+from sbas.batch.results import DEFAULT_TTL, ResultStore
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisBatchQueue:
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379",
+        name: str = "default",
+        max_size: int = 100,
+        max_wait_sec: int = 300,
+        max_wait_fraction: float = 0.1,
+        lease_sec: float = 10,
+        poll_interval: float = 1.0,
+        redis_client=None,
+        orchestrator=None,
+        result_store: Optional[ResultStore] = None,
+        results_ttl: float = DEFAULT_TTL,
+    ):
+        if redis_client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("Install redis: pip install redis")
+            redis_client = redis.Redis.from_url(url)
+        self._r = redis_client
+        self.name = name
+        self.worker_id = uuid.uuid4().hex
+        self.max_size = max_size
+        self.max_wait_sec = max_wait_sec
+        self.max_wait_fraction = max_wait_fraction
+        self.lease_sec = lease_sec
+        self.poll_interval = poll_interval
+        self.results_ttl = results_ttl  # seconds a worker's results list outlives its last push
+        # Used only while this process is the leader
+        self.orchestrator = orchestrator or BatchOrchestrator(
+            on_result=self._store_result, on_error=self._store_error, on_submit=self._record_submit
+        )
+
+        self._client = None    # the client the leader submits with; set by enqueue() or recover()
+        self._futures = {}     # job_id -> Future, for jobs this process enqueued
+        # Responses not yet collected, under a memory budget and ttl
+        self._results = result_store if result_store is not None else ResultStore()
+        self._owners = {}      # job_id -> worker_id, for jobs in batches this process submitted
+        self._remaining = {}   # batch_id -> job_ids not yet delivered
+        self._batch_of = {}    # job_id -> batch_id
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._threads = []
+        self.is_leader = False
+        # Called in the leader with (batch_id, provider, job_ids) after each provider batch submission
+        self.on_submit = None
+
+    # Redis keys
+    def _key(self, suffix: str) -> str:
+        return f"sbas:queue:{self.name}:{suffix}"
+
+    def _results_key(self, worker_id: str) -> str:
+        return self._key(f"results:{worker_id}")
+
+    def enqueue(
+        self,
+        job_id: str,
+        model: str,
+        messages: list,
+        kwargs: dict,
+        client,
+        latency_budget: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> Future:
+        """Queue a request for the shared batch. The returned Future resolves in this process."""
+        future = Future()
+        now = time.time()
+        deadline, flush_by = flush_times(now, latency_budget, deadline, self.max_wait_sec, self.max_wait_fraction)
+        with self._lock:
+            self._futures[job_id] = future
+            if self._client is None:
+                self._client = client
+            self._start()
+
+        pipe = self._r.pipeline(transaction=False)
+        pipe.hset(self._key("requests"), job_id, json.dumps({
+            "worker": self.worker_id,
+            "model": model,
+            "messages": messages,
+            "kwargs": kwargs,
+            "enqueued_at": now,
+            "deadline": deadline,
+        }))
+        pipe.zadd(self._key("due"), {job_id: flush_by})
+        pipe.execute()
+        if self.is_leader:
+            self._wake.set()
+        return future
+
+    def get_result(self, job_id: str) -> Optional[Any]:
+        return self._results.pop(job_id)
+
+    def recover(self, client) -> List[str]:
+        """Start taking part (as a candidate leader submitting with `client`). Nothing is
+        recovered per process: queued and in-flight work lives in Redis."""
+        with self._lock:
+            if self._client is None:
+                self._client = client
+            self._start()
+        return []
+
+    def flush(self) -> int:
+        """Make everything queued due now. The leader submits it on its next pass (immediately
+        when this process leads). Returns the number of requests made due."""
+        due = self._key("due")
+        job_ids = [_str(j) for j in self._r.zrange(due, 0, -1)]
+        if job_ids:
+            self._r.zadd(due, {job_id: 0 for job_id in job_ids}, xx=True)
+        if self.is_leader:
+            self._flush_due()
+        return len(job_ids)
+
+    def close(self, flush: bool = True) -> None:
+        """Stop this process's threads and give up leadership. Batches already submitted
+        are picked up by the next leader."""
+        if flush:
+            self.flush()
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        if _str(self._r.get(self._key("leader"))) == self.worker_id:
+            self._r.delete(self._key("leader"))
+        self.is_leader = False
+
+    def _start(self):
+        """Start the leader and result-listener threads (called with the lock held)."""
+        if self._threads or self._closed:
+            return
+        for target, name in ((self._run_leader, "sbas-batch-leader"), (self._run_listener, "sbas-batch-results")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # Leader side
+
+    def _campaign(self) -> bool:
+        """Take or renew the leader lease."""
+        key, lease_ms = self._key("leader"), int(self.lease_sec * 1000)
+        if self._r.set(key, self.worker_id, nx=True, px=lease_ms):
+            return True
+        if _str(self._r.get(key)) == self.worker_id:
+            self._r.pexpire(key, lease_ms)
+            return True
+        return False
+
+    def _run_leader(self):
+        while not self._closed:
+            try:
+                was_leader, self.is_leader = self.is_leader, self._campaign()
+                if self.is_leader:
+                    if not was_leader:
+                        self._adopt_inflight()
+                    self._flush_due(force=False)
+            except Exception:
+                self.is_leader = False  # Redis unavailable: step back and retry
+            self._wake.wait(min(self.poll_interval, self.lease_sec / 3))
+            self._wake.clear()
+
+    def _flush_due(self, force: bool = True) -> int:
+        """Take every queued request and submit it, if the batch is full or a request is due."""
+        due = self._key("due")
+        earliest = self._r.zrange(due, 0, 0, withscores=True)
+        if not earliest:
+            return 0
+        if not force and earliest[0][1] > time.time() and self._r.zcard(due) < self.max_size:
+            return 0
+
+        job_ids = [_str(j) for j in self._r.zrange(due, 0, -1)]
+        pipe = self._r.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hget(self._key("requests"), job_id)
+        raws = dict(zip(job_ids, pipe.execute()))
+        job_ids = [job_id for job_id in job_ids if raws[job_id] is not None]
+
+        # Move the requests to claims atomically: a leader dying from here on leaves
+        # them claimed, not lost, and a concurrent pass (two leaders for a moment
+        # around a lease expiry) can't claim them too
+        pipe = self._r.pipeline(transaction=True)
+        for job_id in job_ids:
+            pipe.zrem(due, job_id)
+            pipe.hdel(self._key("requests"), job_id)
+            pipe.hsetnx(self._key("claimed"), job_id, json.dumps({"leader": self.worker_id, "request": _str(raws[job_id])}))
+        replies = pipe.execute()
+
+        batch = {}
+        for i, job_id in enumerate(job_ids):
+            if not replies[3 * i]:
+                continue  # taken by another pass
+            req = json.loads(raws[job_id])
+            with self._lock:
+                self._owners[job_id] = req["worker"]
+            batch[job_id] = {
+                "model": req["model"],
+                "messages": req["messages"],
+                "kwargs": req["kwargs"],
+                "client": self._client,
+                "enqueued_at": req["enqueued_at"],
+                "deadline": req["deadline"],
+            }
+        if batch:
+            self.orchestrator.submit(batch)
+        return len(batch)
+
+    def _record_submit(self, batch_id: str, provider: str, job_ids: List[str]) -> None:
+        finished = []  # earlier batches whose last jobs were retried in this one
+        with self._lock:
+            owners = {job_id: self._owners.get(job_id) for job_id in job_ids}
+            self._remaining[batch_id] = set(job_ids)
+            for job_id in job_ids:
+                earlier = self._batch_of.get(job_id)
+                if earlier is not None and earlier in self._remaining:
+                    self._remaining[earlier].discard(job_id)
+                    if not self._remaining[earlier]:
+                        del self._remaining[earlier]
+                        finished.append(earlier)
+                self._batch_of[job_id] = batch_id
+        # Recording the batch and releasing the claims in one transaction: a new leader
+        # finds each job either claimed or in flight
+        pipe = self._r.pipeline(transaction=True)
+        pipe.hset(self._key("inflight"), batch_id, json.dumps({"provider": provider, "owners": owners}))
+        pipe.hdel(self._key("claimed"), *job_ids)
+        if finished:
+            pipe.hdel(self._key("inflight"), *finished)
+        pipe.execute()
+        if self.on_submit is not None:
+            self.on_submit(batch_id, provider, job_ids)
+
+    def _requeue_claims(self):
+        """Queue again, due now, the requests other leaders claimed but never submitted."""
+        claims = {
+            _str(job_id): json.loads(raw) for job_id, raw in self._r.hgetall(self._key("claimed")).items()
+        }
+        orphaned = {job_id: claim for job_id, claim in claims.items() if claim["leader"] != self.worker_id}
+        if not orphaned:
+            return
+        pipe = self._r.pipeline(transaction=True)
+        for job_id, claim in orphaned.items():
+            pipe.hset(self._key("requests"), job_id, claim["request"])
+            pipe.zadd(self._key("due"), {job_id: 0})
+            pipe.hdel(self._key("claimed"), job_id)
+        pipe.execute()
+
+    def _adopt_inflight(self):
+        """Poll the provider batches a previous leader submitted but did not finish, and
+        queue again the requests it claimed but did not submit."""
+        self._requeue_claims()
+        adapter = self.orchestrator.adapter(self._client)
+        if adapter is None:
+            return
+        for batch_id, raw in self._r.hgetall(self._key("inflight")).items():
+            batch_id, entry = _str(batch_id), json.loads(raw)
+            with self._lock:
+                if batch_id in self._remaining or entry["provider"] != adapter.provider:
+                    continue
+                self._owners.update(entry["owners"])
+                self._remaining[batch_id] = set(entry["owners"])
+                for job_id in entry["owners"]:
+                    self._batch_of[job_id] = batch_id
+            self.orchestrator.track(batch_id, adapter, list(entry["owners"]))
+
+    def _deliver(self, job_id: str, message: dict, local) -> None:
+        with self._lock:
+            owner = self._owners.pop(job_id, None)
+            batch_id = self._batch_of.pop(job_id, None)
+            finished = False
+            if batch_id is not None:
+                remaining = self._remaining.get(batch_id, set())
+                remaining.discard(job_id)
+                if not remaining:
+                    self._remaining.pop(batch_id, None)
+                    finished = True
+        pipe = self._r.pipeline(transaction=False)
+        if owner is not None and owner != self.worker_id:
+            pipe.rpush(self._results_key(owner), json.dumps({"job_id": job_id, **message}))
+            pipe.pexpire(self._results_key(owner), int(self.results_ttl * 1000))
+        # Still claimed if it never reached a provider batch (failed to submit, or run sync)
+        pipe.hdel(self._key("claimed"), job_id)
+        if finished:
+            pipe.hdel(self._key("inflight"), batch_id)
+        pipe.execute()
+        if owner is None or owner == self.worker_id:
+            local()
+
+    def _store_result(self, job_id: str, response: Any) -> None:
+        result = to_jsonable(response)  # what every worker gets, so the leader's jobs get the same
+        self._deliver(job_id, {"result": result}, lambda: self._complete(job_id, result))
+
+    def _store_error(self, job_id: str, error: Exception) -> None:
+        self._deliver(job_id, {"error": str(error)}, lambda: self._fail(job_id, error))
+
+    # Worker side
+
+    def _run_listener(self):
+        key = self._results_key(self.worker_id)
+        while not self._closed:
+            try:
+                item = self._r.blpop([key], timeout=self.poll_interval)
+            except Exception:
+                time.sleep(1)  # Redis unavailable: retry
+                continue
+            if item is None:
+                continue
+            message = json.loads(item[1])
+            if "error" in message:
+                self._fail(message["job_id"], RuntimeError(message["error"]))
+            else:
+                self._complete(message["job_id"], message.get("result"))
+
+    def _complete(self, job_id: str, response: Any) -> None:
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+        if future is not None:
+            self._results.put(job_id, response)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def _fail(self, job_id: str, error: Exception) -> None:
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
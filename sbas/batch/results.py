@@ -0,0 +1,184 @@
+"""
+ResultStore — where a batch queue keeps responses until they are collected.
+
+Results stay in memory up to a byte budget (256 MiB unless told otherwise), least
+recently used first out. A result pushed out of memory is spilled to a SQLite file when
+one is configured (and read back when it is collected), otherwise dropped. Results
+nobody collects expire after `ttl`, so abandoned jobs don't pin their responses forever.
+A 50k-response batch then costs at most `max_bytes` of RAM, however big the responses are.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Optional, Tuple
+
+from sbas.batch.log import to_json
+
+DEFAULT_MAX_BYTES = 256 * 2**20
+DEFAULT_TTL = 86400  # a day: providers give batches 24h, so anything older is abandoned
+_LOW_WATER = 0.9     # once over budget, evict down to this share of it, in one transaction
+_PURGE_INTERVAL = 1.0  # seconds between sweeps of expired spilled results
+
+
+class ResultStore:
+    """
+    `max_bytes` budgets results by their JSON size (None: unbounded); `ttl` is how long
+    an uncollected result is kept (None: forever). The spill file at `spill_path` is
+    private to one store and is emptied when the store opens it. Results read back from
+    it are plain dicts (`model_dump()` of the response), like results recovered from a
+    BatchLog. With a spill file, each result's JSON is kept next to it in memory, so
+    spilling doesn't serialize under the lock.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+        ttl: Optional[float] = DEFAULT_TTL,
+        spill_path: Optional[str] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()  # job_id -> (response, size, expires_at, JSON or None), least recently used first
+        self._expiry = deque()        # (expires_at, job_id) in put order, i.e. expiry order
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+        self.spilled = 0   # results moved to disk
+        self.dropped = 0   # results pushed out of memory with nowhere to go
+        self.expired = 0   # results that ran out their ttl uncollected
+
+        self._conn = None
+        if spill_path is not None:
+            self._conn = sqlite3.connect(spill_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=OFF")  # a cache: lost on a crash along with the process
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results (job_id TEXT PRIMARY KEY, result TEXT, expires_at REAL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+                self._conn.execute("DELETE FROM results")
+
+    def put(self, job_id: str, response: Any, text: Optional[str] = None) -> None:
+        """Keep `response` for job_id. `text` is its JSON from to_json(), when the caller
+        already has it (e.g. written to a BatchLog): it is reused instead of serializing again."""
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        # Serialized once, here, outside the lock: for the size, and for the spill file
+        if self.max_bytes is None:
+            size = 0
+        elif text is not None:
+            size = len(text)
+        else:
+            text, size = self._serialize(response)
+        if self._conn is None:
+            text = None  # nowhere to spill to: no need to keep it
+        with self._lock:
+            self._expire(now)
+            self._discard(job_id)
+            self._memory[job_id] = (response, size, expires_at, text)
+            self._bytes += size
+            if expires_at is not None:
+                self._expiry.append((expires_at, job_id))
+                if len(self._expiry) > 2 * len(self._memory) + 1024:
+                    # Mostly collected already: rebuild from what is still in memory
+                    self._expiry = deque(sorted((entry[2], key) for key, entry in self._memory.items()))
+            if self.max_bytes is not None and self._bytes > self.max_bytes:
+                self._evict(self.max_bytes * _LOW_WATER)
+
+    def get(self, job_id: str) -> Optional[Any]:
+        """The result for `job_id`, leaving it in the store, or None."""
+        return self._read(job_id, remove=False)
+
+    def pop(self, job_id: str) -> Optional[Any]:
+        """Remove and return the result for `job_id`, or None."""
+        return self._read(job_id, remove=True)
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(time.time())
+            spilled = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] if self._conn else 0
+            return len(self._memory) + spilled
+
+    @property
+    def memory_bytes(self) -> int:
+        """JSON size of the results held in memory (0 without a budget: sizes aren't computed then)."""
+        with self._lock:
+            return self._bytes
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _read(self, job_id: str, remove: bool) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._memory.get(job_id)
+            if entry is not None:
+                if remove:
+                    self._discard(job_id)
+                else:
+                    self._memory.move_to_end(job_id)
+                return entry[0]
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                "SELECT result FROM results WHERE job_id = ? AND (expires_at IS NULL OR expires_at > ?)", (job_id, now)
+            ).fetchone()
+            if row is not None and remove:
+                with self._conn:
+                    self._conn.execute("DELETE FROM results WHERE job_id = ?", (job_id,))
+        return json.loads(row[0]) if row is not None else None
+
+    @staticmethod
+    def _serialize(response: Any) -> Tuple[Optional[str], int]:
+        """(JSON of the response or None if it has none, its size in bytes)."""
+        text = to_json(response)
+        if text is None:
+            return None, len(repr(response))
+        return text, len(text)
+
+    def _discard(self, job_id: str) -> None:
+        """Forget job_id's result in memory (called with the lock held)."""
+        entry = self._memory.pop(job_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _evict(self, target: float) -> None:
+        """Move least recently used results to disk, or drop them, until memory is down to
+        `target` bytes (called with the lock held)."""
+        rows = []
+        while self._memory and self._bytes > target:
+            job_id, (_, size, expires_at, text) = self._memory.popitem(last=False)
+            self._bytes -= size
+            if self._conn is None or text is None:
+                self.dropped += 1
+            else:
+                rows.append((job_id, text, expires_at))
+        if rows:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO results (job_id, result, expires_at) VALUES (?, ?, ?)", rows)
+            self.spilled += len(rows)
+
+    def _expire(self, now: float) -> None:
+        """Drop results past their ttl (called with the lock held)."""
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, job_id = self._expiry.popleft()
+            entry = self._memory.get(job_id)
+            if entry is not None and entry[2] == expires_at:
+                del self._memory[job_id]
+                self._bytes -= entry[1]
+                self.expired += 1
+        if self._conn is not None and self.ttl is not None and now >= self._next_purge:
+            self._next_purge = now + _PURGE_INTERVAL
+            with self._conn:
+                self.expired += self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,)).rowcount
@@ -0,0 +1,92 @@
+"""
+Tokenizer-free token estimates for rate limiting and quota accounting, and the ledger
+of tokens enqueued in provider batches that admission control checks against.
+
+Roughly four characters per token for English text, plus a few tokens of framing per
+message and the completion budget the request reserves (max_tokens). Providers count
+the reserved completion tokens against rate limits too, so including them matches
+what the limits see. Batch queue limits may count input tokens only (OpenAI's do), so
+the ledger charges completion tokens only for adapters whose quota counts them.
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4
+DEFAULT_COMPLETION_TOKENS = 1024  # what AnthropicBatchAdapter reserves when max_tokens is unset
+
+
+def _chars(content: Any) -> int:
+    if content is None:
+        return 0
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):  # content parts: [{"type": "text", "text": ...}, ...]
+        return sum(_chars(part.get("text", "")) if isinstance(part, dict) else _chars(part) for part in content)
+    return len(str(content))
+
+
+def prompt_tokens(messages: list) -> int:
+    """Estimated tokens of the messages sent."""
+    return sum(_chars(m.get("content")) // CHARS_PER_TOKEN + TOKENS_PER_MESSAGE for m in messages)
+
+
+def estimate_tokens(messages: list, kwargs: dict = None, default_completion: int = DEFAULT_COMPLETION_TOKENS) -> int:
+    """Estimated prompt tokens plus the completion tokens the request may use
+    (`default_completion` when it sets no max_tokens)."""
+    kwargs = kwargs or {}
+    completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or default_completion
+    return prompt_tokens(messages) + completion
+
+
+class TokenLedger:
+    """
+    Estimated tokens currently enqueued in provider batches, per model, against quotas
+    ({model: max tokens}; `default_quota` for models without one, None for unlimited).
+    A request is charged its prompt tokens, plus its max_tokens (`completion_tokens` when
+    unset) where the provider's quota counts completion tokens too.
+    """
+
+    def __init__(
+        self,
+        quotas: Optional[Dict[str, int]] = None,
+        default_quota: Optional[int] = None,
+        completion_tokens: int = DEFAULT_COMPLETION_TOKENS,
+    ):
+        self.quotas = quotas or {}
+        self.default_quota = default_quota
+        self.completion_tokens = completion_tokens
+        self._in_flight = {}  # model -> tokens
+        self._lock = threading.Lock()
+
+    def estimate(self, messages: list, kwargs: dict, counts_completion: bool = True) -> int:
+        """Tokens a request is charged against its model's quota."""
+        if not counts_completion:
+            return prompt_tokens(messages)
+        return estimate_tokens(messages, kwargs, self.completion_tokens)
+
+    def quota(self, model: str) -> Optional[int]:
+        return self.quotas.get(model, self.default_quota)
+
+    def in_flight(self, model: str) -> int:
+        with self._lock:
+            return self._in_flight.get(model, 0)
+
+    def reserve(self, model: str, tokens: int) -> bool:
+        """Count `tokens` as in flight if they fit the model's quota. Returns whether they did."""
+        quota = self.quota(model)
+        with self._lock:
+            current = self._in_flight.get(model, 0)
+            if quota is not None and current + tokens > quota:
+                return False
+            self._in_flight[model] = current + tokens
+            return True
+
+    def release(self, model: str, tokens: int) -> None:
+        with self._lock:
+            left = self._in_flight.get(model, 0) - tokens
+            if left > 0:
+                self._in_flight[model] = left
+            else:
+                self._in_flight.pop(model, None)
@@ -0,0 +1,55 @@
+"""
+ResponseCache — LRU/TTL cache of LLM responses keyed by (model, messages, kwargs).
+
+Used by SBASInterceptor to answer repeated requests without a provider call and to
+coalesce identical requests that are already queued or in flight onto one batch slot.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 10_000, ttl: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl  # seconds; None keeps entries until evicted
+        self._entries = OrderedDict()  # key -> (response, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, messages: list, kwargs: dict) -> Optional[str]:
+        """Stable key for a request, or None if the request can't be keyed (not JSON-serializable)."""
+        try:
+            data = json.dumps([model, messages, kwargs], sort_keys=True, separators=(",", ":"))
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, response: Any) -> None:
+        with self._lock:
+            self._entries[key] = (response, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
@@ -4,42 +4,181 @@ NEVER sends prompts, responses, API keys, or any business data.
 Only sends: job_id (hashed), token counts, cost savings %, timing.
 """
 
+import gzip
 import hashlib
+import http.client
+import json
 import threading
+import time
+from collections import deque
 from typing import Optional
+from urllib.parse import urlsplit
+
+_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
 
 
 class CloudReporter:
-    def __init__(self, api_key: str, endpoint: str = "https://api.sbas.ai/v1/metrics"):
+    """
+    report() only appends to a bounded in-memory queue; when the queue is full the oldest
+    metric is dropped. One background sender posts metrics in gzip-compressed batches of
+    up to `batch_size`, at least every `flush_interval` seconds, over a single keep-alive
+    connection, retrying failed batches with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        endpoint: str = "https://api.sbas.ai/v1/metrics",
+        max_queue: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 5.0,
+        max_retries: int = 5,
+        retry_backoff: float = 1.0,
+        timeout: float = 5.0,
+    ):
         self._api_key = api_key
         self._endpoint = endpoint
         self._enabled = True
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+
+        url = urlsplit(endpoint)
+        self._conn_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self._netloc = url.netloc
+        self._path = (url.path or "/") + (f"?{url.query}" if url.query else "")
+        self._conn = None
+
+        self._queue = deque(maxlen=max_queue)
+        self._cond = threading.Condition()
+        self._sending = 0   # metrics taken off the queue but not yet sent or given up on
+        self._flush_requested = False
+        self._closed = False
+        self._sender = None  # started on the first report()
+        self.sent = 0
+        self.dropped = 0    # overflowed the queue or failed every retry
 
     def report(self, job_id: str, tokens: int, savings_pct: float, mode: str) -> None:
-        """Send anonymized metric. Non-blocking."""
+        """Queue an anonymized metric. Never blocks on the network."""
         if not self._enabled:
             return
-        
+
         payload = {
             "job_id_hash": hashlib.sha256(job_id.encode()).hexdigest()[:16],
             "tokens": tokens,
             "savings_pct": savings_pct,
             "mode": mode,
+            "ts": time.time(),
             # No prompts. No responses. No keys. No business data. Ever.
         }
-        
-        thread = threading.Thread(target=self._send, args=(payload,), daemon=True)
-        thread.start()
-
-    def _send(self, payload: dict) -> None:
-        try:
-            import urllib.request, json
-            data = json.dumps(payload).encode()
-            req = urllib.request.Request(
-                self._endpoint,
-                data=data,
-                headers={"Authorization": f"Bearer {self._api_key}", "Content-Type": "application/json"},
-            )
-            urllib.request.urlopen(req, timeout=5)
-        except Exception:
-            pass  # Never fail silently on metric reporting errors
+
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(payload)
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._run_sender, name="sbas-cloud-reporter", daemon=True)
+                self._sender.start()
+            # A full batch is due now; a first metric starts the flush_interval countdown
+            if len(self._queue) >= self.batch_size or len(self._queue) == 1:
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Send everything queued now. Returns False if it did not finish within timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._queue or self._sending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Send what is queued (waiting at most timeout seconds) and stop the sender."""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._sender is not None:
+            self._sender.join(timeout)
+
+    def _run_sender(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._queue) >= self.batch_size or (self._queue and self._flush_requested):
+                        break
+                    if not self._queue:
+                        self._cond.wait()
+                        continue
+                    # Due flush_interval after the oldest queued metric was reported, so what a
+                    # full batch left behind isn't held back another whole interval
+                    remaining = self._queue[0]["ts"] + self.flush_interval - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    # The connection is only ever used here, so it's closed here too
+                    self._reset_connection()
+                    return
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not self._queue:
+                    self._flush_requested = False
+                self._sending = len(batch)
+
+            sent = self._send_with_retry(batch)
+            with self._cond:
+                if sent:
+                    self.sent += len(batch)
+                else:
+                    self.dropped += len(batch)
+                self._sending = 0
+                self._cond.notify_all()
+
+    def _send_with_retry(self, batch: list) -> bool:
+        body = gzip.compress(json.dumps({"metrics": batch}, separators=(",", ":")).encode())
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                resume = time.monotonic() + min(self.retry_backoff * 2 ** (attempt - 1), 60)
+                with self._cond:
+                    while not self._closed and time.monotonic() < resume:
+                        self._cond.wait(resume - time.monotonic())
+                    if self._closed:
+                        return False
+            try:
+                status = self._post(body)
+            except (OSError, http.client.HTTPException):
+                self._reset_connection()
+                continue
+            if 200 <= status < 300:
+                return True
+            if status not in _RETRY_STATUSES:
+                return False  # rejected; retrying won't help
+        return False
+
+    def _post(self, body: bytes) -> int:
+        if self._conn is None:
+            self._conn = self._conn_class(self._netloc, timeout=self.timeout)
+        self._conn.request("POST", self._path, body=body, headers={
+            "Authorization": f"Bearer {self._api_key}",
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "Connection": "keep-alive",
+        })
+        response = self._conn.getresponse()
+        response.read()  # drain so the connection can be reused
+        if response.will_close:
+            self._reset_connection()
+        return response.status
+
+    def _reset_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
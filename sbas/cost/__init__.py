@@ -1 +1,2 @@
 from sbas.cost.tracker import CostTracker
+from sbas.cost.ledger import CostLedger
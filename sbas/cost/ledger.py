@@ -0,0 +1,194 @@
+"""
+CostLedger — append-only on-disk record of every tracked call.
+
+Records are written to SQLite in batches by a background writer, and each batch also
+upserts a daily rollup keyed by (day, agent, model, mode). Reports read the rollup, so a
+month of calls is a few thousand rollup rows no matter how many calls were made. Several
+workers can share one ledger file; WAL mode lets them write while others report.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+_ROLLUP_COLUMNS = ("calls", "tokens_in", "tokens_out", "cost_actual", "cost_if_sync", "saved")
+_WRITE_ATTEMPTS = 5  # tries at committing a batch of records before it is given up
+
+
+def _day(ts: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+class CostLedger:
+    """
+    Days are UTC. report(since, until) works at day resolution: it covers every day
+    that overlaps [since, until). If the writer has to give up on a batch of records after
+    repeated failures (e.g. the file stays locked), the next flush() raises the error.
+    """
+
+    def __init__(self, path: str = "./sbas_costs.db", busy_timeout: float = 30.0):
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cost_records ("
+                "job_id TEXT, agent TEXT, model TEXT, mode TEXT, tokens_in INTEGER, tokens_out INTEGER, "
+                "cost_actual REAL, cost_if_sync REAL, saved REAL, ts REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cost_records_ts ON cost_records (ts)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cost_daily ("
+                "day TEXT, agent TEXT, model TEXT, mode TEXT, calls INTEGER, tokens_in INTEGER, tokens_out INTEGER, "
+                "cost_actual REAL, cost_if_sync REAL, saved REAL, PRIMARY KEY (day, agent, model, mode))"
+            )
+        self._conn_lock = threading.Lock()
+
+        self._lock = threading.Condition()
+        self._pending = []     # CostRecords not yet picked up by the writer
+        self._committing = []  # the batch the writer is committing right now
+        self._error = None     # why the writer last gave up on a batch, raised by flush()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run_writer, name="sbas-cost-ledger", daemon=True)
+        self._writer.start()
+
+    def append(self, record) -> None:
+        """Queue a CostRecord. Returns immediately; the writer commits it with the next batch."""
+        with self._lock:
+            self._pending.append(record)
+            self._lock.notify_all()
+
+    def flush(self) -> None:
+        """Block until every record appended so far is committed, or raise why some could not be."""
+        with self._lock:
+            while self._pending or self._committing:
+                self._lock.wait()
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._closed = True
+                self._lock.notify_all()
+            self._writer.join()
+            self._conn.close()
+
+    def report(self, since: Optional[float] = None, until: Optional[float] = None, agent: Optional[str] = None) -> dict:
+        """Totals plus by_day, by_agent, by_model and by_mode breakdowns, read from the daily rollup."""
+        self.flush()
+        where, params = [], []
+        if since is not None:
+            where.append("day >= ?")
+            params.append(_day(since))
+        if until is not None:
+            where.append("day <= ?")
+            params.append(_day(until - 1e-6))
+        if agent is not None:
+            where.append("agent = ?")
+            params.append(agent)
+        sql = f"SELECT day, agent, model, mode, {', '.join(_ROLLUP_COLUMNS)} FROM cost_daily"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._conn_lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        groups = {"by_day": {}, "by_agent": {}, "by_model": {}, "by_mode": {}}
+        total = dict.fromkeys(_ROLLUP_COLUMNS, 0)
+        for day, row_agent, model, mode, *values in rows:
+            for name, value in zip(("by_day", "by_agent", "by_model", "by_mode"), (day, row_agent, model, mode)):
+                if value == "":
+                    continue  # untagged agent
+                sums = groups[name].setdefault(value, dict.fromkeys(_ROLLUP_COLUMNS, 0))
+                for column, v in zip(_ROLLUP_COLUMNS, values):
+                    sums[column] += v
+            for column, v in zip(_ROLLUP_COLUMNS, values):
+                total[column] += v
+
+        def summary(sums: dict) -> dict:
+            return {
+                "calls": sums["calls"],
+                "total_cost": round(sums["cost_actual"], 4),
+                "cost_if_all_sync": round(sums["cost_if_sync"], 4),
+                "total_saved": round(sums["saved"], 4),
+            }
+
+        def calls(mode):
+            return groups["by_mode"].get(mode, {}).get("calls", 0)
+
+        pct = round((total["saved"] / total["cost_if_sync"] * 100) if total["cost_if_sync"] > 0 else 0, 1)
+        return {
+            "total_calls": total["calls"],
+            "sync_calls": calls("sync"),
+            "async_calls": calls("async"),
+            "cached_calls": calls("cached"),
+            "total_cost": round(total["cost_actual"], 4),
+            "cost_if_all_sync": round(total["cost_if_sync"], 4),
+            "total_saved": round(total["saved"], 4),
+            "savings_pct": pct,
+            **{name: {key: summary(sums) for key, sums in sorted(group.items())} for name, group in groups.items()},
+        }
+
+    def _run_writer(self):
+        failures = 0
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+                # Everything appended while the previous batch was committing goes into this one
+                self._committing, self._pending = self._pending, []
+            try:
+                with self._conn_lock:
+                    self._commit(self._committing)
+            except sqlite3.Error as e:
+                failures += 1
+                with self._lock:
+                    if failures < _WRITE_ATTEMPTS:
+                        # Another worker may hold the write lock past the busy timeout; retry shortly
+                        self._pending = self._committing + self._pending
+                    else:
+                        # Give up on the batch rather than retry forever: flush() raises the error
+                        self._error, failures = e, 0
+                        self._lock.notify_all()
+                    self._committing = []
+                time.sleep(0.1 * failures)
+                continue
+            failures = 0
+            with self._lock:
+                self._committing = []
+                self._lock.notify_all()
+
+    def _commit(self, records: list) -> None:
+        rollup = {}
+        for r in records:
+            key = (_day(r.timestamp), r.agent or "", r.model, r.mode)
+            sums = rollup.get(key)
+            if sums is None:
+                sums = rollup[key] = [0, 0, 0, 0.0, 0.0, 0.0]
+            sums[0] += 1
+            sums[1] += r.tokens_in
+            sums[2] += r.tokens_out
+            sums[3] += r.cost_actual
+            sums[4] += r.cost_if_sync
+            sums[5] += r.saved
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO cost_records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (r.job_id, r.agent, r.model, r.mode, r.tokens_in, r.tokens_out,
+                     r.cost_actual, r.cost_if_sync, r.saved, r.timestamp)
+                    for r in records
+                ],
+            )
+            self._conn.executemany(
+                "INSERT INTO cost_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (day, agent, model, mode) DO UPDATE SET "
+                + ", ".join(f"{c} = {c} + excluded.{c}" for c in _ROLLUP_COLUMNS),
+                [(*key, *sums) for key, sums in rollup.items()],
+            )
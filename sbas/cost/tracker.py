@@ -2,9 +2,12 @@
 CostTracker — measures actual vs potential savings per LLM call.
 """
 
+import threading
 import time
+from collections import OrderedDict, deque
 from typing import Any, Optional
 from dataclasses import dataclass, field
+from sbas.cost.ledger import CostLedger
 
 
 # Approximate cost per 1M tokens (input + output average) — update as providers change
@@ -23,32 +26,86 @@ class CostRecord:
     model: str
     tokens_in: int
     tokens_out: int
-    mode: str  # "sync" | "async"
+    mode: str  # "sync" | "async" | "cached"
     cost_actual: float
     cost_if_sync: float
     saved: float
     timestamp: float = field(default_factory=time.time)
+    agent: Optional[str] = None  # tag passed through SBAS(agent=...)
 
 
-class CostTracker:
+class _Totals:
+    """Running sums for one (model, mode, agent) key."""
+    __slots__ = ("calls", "tokens_in", "tokens_out", "cost_actual", "cost_if_sync", "saved")
+
     def __init__(self):
-        self._records = []
+        self.calls = self.tokens_in = self.tokens_out = 0
+        self.cost_actual = self.cost_if_sync = self.saved = 0.0
+
+    def add(self, r: CostRecord) -> None:
+        self.calls += 1
+        self.tokens_in += r.tokens_in
+        self.tokens_out += r.tokens_out
+        self.cost_actual += r.cost_actual
+        self.cost_if_sync += r.cost_if_sync
+        self.saved += r.saved
+
+    def merge(self, other: "_Totals") -> None:
+        self.calls += other.calls
+        self.tokens_in += other.tokens_in
+        self.tokens_out += other.tokens_out
+        self.cost_actual += other.cost_actual
+        self.cost_if_sync += other.cost_if_sync
+        self.saved += other.saved
+
+
+# Rollup granularities: (name, bucket width in seconds, default retention in buckets)
+ROLLUPS = (
+    ("minute", 60, 24 * 60),     # one day of minutes
+    ("hour", 3600, 31 * 24),     # a month of hours
+    ("day", 86400, None),        # days are kept forever
+)
+
+
+def _bucket(t: float, width: int) -> int:
+    return int(t // width * width)
+
+
+def _field(obj: Any, name: str) -> Any:
+    """A response attribute, or key: responses recovered from a log or another process are dicts."""
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
 
-    def record(self, job_id: str, response: Any, mode: str) -> None:
+
+class CostTracker:
+    """
+    Keeps running totals per (model, mode) and per minute/hour/day bucket, so report()
+    costs the same no matter how many calls were recorded. Only the most recent
+    max_records raw records are kept. With a ledger, every record is also persisted to it.
+    """
+
+    def __init__(self, max_records: Optional[int] = 10_000, ledger: Optional[CostLedger] = None):
+        self._records = deque(maxlen=max_records)
+        self._totals = {}  # (model, mode, agent) -> _Totals
+        self._rollups = {name: OrderedDict() for name, _, _ in ROLLUPS}  # name -> bucket start -> {key: _Totals}
+        self._lock = threading.Lock()
+        self.ledger = ledger
+
+    def record(self, job_id: str, response: Any, mode: str, agent: Optional[str] = None) -> None:
         try:
-            model = getattr(response, "model", "unknown")
-            usage = getattr(response, "usage", None)
-            tokens_in = getattr(usage, "prompt_tokens", 0) if usage else 0
-            tokens_out = getattr(usage, "completion_tokens", 0) if usage else 0
+            model = _field(response, "model") or "unknown"
+            usage = _field(response, "usage")
+            tokens_in = _field(usage, "prompt_tokens") or 0
+            tokens_out = _field(usage, "completion_tokens") or 0
             
             rates = COST_TABLE.get(model, {"sync": 5.0, "async": 2.5})
             total_tokens = (tokens_in + tokens_out) / 1_000_000
             
-            cost_actual = total_tokens * rates.get(mode, rates["sync"])
+            # "cached": answered from the response cache or a coalesced request — no provider cost
+            cost_actual = 0.0 if mode == "cached" else total_tokens * rates.get(mode, rates["sync"])
             cost_if_sync = total_tokens * rates["sync"]
-            saved = cost_if_sync - cost_actual if mode == "async" else 0
+            saved = cost_if_sync - cost_actual if mode != "sync" else 0
 
-            self._records.append(CostRecord(
+            self._add(CostRecord(
                 job_id=job_id,
                 model=model,
                 tokens_in=tokens_in,
@@ -57,29 +114,99 @@ class CostTracker:
                 cost_actual=cost_actual,
                 cost_if_sync=cost_if_sync,
                 saved=saved,
+                timestamp=time.time(),
+                agent=agent,
             ))
         except Exception:
             pass  # Never let tracking break the main flow
 
+    def _add(self, r: CostRecord) -> None:
+        key = (r.model, r.mode, r.agent)
+        if self.ledger is not None:
+            self.ledger.append(r)
+        with self._lock:
+            self._records.append(r)
+            self._totals.setdefault(key, _Totals()).add(r)
+            for name, width, retention in ROLLUPS:
+                buckets = self._rollups[name]
+                start = _bucket(r.timestamp, width)
+                bucket = buckets.get(start)
+                if bucket is None:
+                    bucket = buckets[start] = {}
+                    while retention is not None and next(iter(buckets)) <= start - retention * width:
+                        buckets.popitem(last=False)
+                bucket.setdefault(key, _Totals()).add(r)
+
+    def _totals_since(self, since: float) -> dict:
+        """
+        Sum rollup buckets from `since` on: minutes up to the next whole hour, hours up to
+        the next whole day, then days. `since` is rounded down to the minute, or to the
+        hour/day when it is older than the minute/hour rollups retain.
+        """
+        now = time.time()
+        level = 0
+        while level < len(ROLLUPS) - 1:
+            _, width, retention = ROLLUPS[level]
+            if since >= _bucket(now, width) - (retention - 1) * width:
+                break
+            level += 1
+
+        result = {}
+        cursor = _bucket(since, ROLLUPS[level][1])
+        for i in range(level, len(ROLLUPS)):
+            name, width, _ = ROLLUPS[i]
+            until = None
+            if i + 1 < len(ROLLUPS):
+                coarser = ROLLUPS[i + 1][1]
+                until = _bucket(cursor, coarser) + (coarser if cursor % coarser else 0)
+            for start in reversed(self._rollups[name]):
+                if start < cursor:
+                    break
+                if until is None or start < until:
+                    for key, totals in self._rollups[name][start].items():
+                        result.setdefault(key, _Totals()).merge(totals)
+            if until is None:
+                break
+            cursor = until
+        return result
+
     def report(self, since: Optional[float] = None) -> dict:
-        records = self._records
-        if since:
-            records = [r for r in records if r.timestamp >= since]
-        
-        total_actual = sum(r.cost_actual for r in records)
-        total_if_sync = sum(r.cost_if_sync for r in records)
-        total_saved = sum(r.saved for r in records)
-        sync_calls = sum(1 for r in records if r.mode == "sync")
-        async_calls = sum(1 for r in records if r.mode == "async")
+        with self._lock:
+            totals = self._totals_since(since) if since else self._totals
+            by_model, by_mode, by_agent, overall = {}, {}, {}, _Totals()
+            for (model, mode, agent), t in totals.items():
+                by_model.setdefault(model, _Totals()).merge(t)
+                by_mode.setdefault(mode, _Totals()).merge(t)
+                if agent is not None:
+                    by_agent.setdefault(agent, _Totals()).merge(t)
+                overall.merge(t)
+
+        def calls(mode):
+            return by_mode[mode].calls if mode in by_mode else 0
+
+        def summary(t: _Totals) -> dict:
+            return {
+                "calls": t.calls,
+                "total_cost": round(t.cost_actual, 4),
+                "cost_if_all_sync": round(t.cost_if_sync, 4),
+                "total_saved": round(t.saved, 4),
+            }
+
+        total_if_sync = overall.cost_if_sync
+        total_saved = overall.saved
         pct = round((total_saved / total_if_sync * 100) if total_if_sync > 0 else 0, 1)
 
         return {
-            "total_calls": len(records),
-            "sync_calls": sync_calls,
-            "async_calls": async_calls,
-            "total_cost": round(total_actual, 4),
+            "total_calls": overall.calls,
+            "sync_calls": calls("sync"),
+            "async_calls": calls("async"),
+            "cached_calls": calls("cached"),
+            "total_cost": round(overall.cost_actual, 4),
             "cost_if_all_sync": round(total_if_sync, 4),
             "total_saved": round(total_saved, 4),
             "savings_pct": pct,
             "projected_monthly": round(total_saved * 30, 2),
+            "by_model": {model: summary(t) for model, t in by_model.items()},
+            "by_mode": {mode: summary(t) for mode, t in by_mode.items()},
+            "by_agent": {agent: summary(t) for agent, t in by_agent.items()},
         }
@@ -3,12 +3,19 @@ SBASInterceptor — core LLM call interceptor.
 Wraps any LLM client and transparently routes calls through the batch engine.
 """
 
-from typing import Optional, Literal
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from concurrent.futures import as_completed as futures_as_completed, wait as futures_wait
+from typing import Callable, Iterable, Iterator, List, Optional, Literal
 from sbas.state.base import BaseStateManager
 from sbas.state.memory import InMemoryStateManager
-from sbas.batch.queue import BatchQueue
+from sbas.batch.executor import SyncExecutor
+from sbas.batch.queue import BatchQueue, budget_seconds
 from sbas.cost.tracker import CostTracker
-import time
+from sbas.cache import ResponseCache
+from sbas.router import LatencyRouter, RoutingDecision
+import threading
+import uuid
+import weakref
 
 
 LatencyBudget = Literal["realtime", "1h", "6h", "24h"]
@@ -34,20 +41,110 @@ class SBASInterceptor:
         batch_queue: Optional[BatchQueue] = None,
         cost_tracker: Optional[CostTracker] = None,
         cloud_reporter=None,
+        response_cache: Optional[ResponseCache] = None,
+        agent: Optional[str] = None,
+        router: Optional[LatencyRouter] = None,
+        executor: Optional[SyncExecutor] = None,
     ):
         self._client = llm_client
         self.latency_budget = latency_budget
+        self.agent = agent  # tags cost records, for per-agent reports
         self.state_manager = state_manager or InMemoryStateManager()
         self.batch_queue = batch_queue or BatchQueue()
         self.cost_tracker = cost_tracker or CostTracker()
         self.cloud_reporter = cloud_reporter
+        # With a cache, repeated requests are answered from it and identical
+        # requests already queued or in flight share one batch slot
+        self.response_cache = response_cache
+        self._inflight = {}  # cache key -> Future of the request that owns the batch slot
+        self._inflight_lock = threading.Lock()
+        # Learns batch turnaround from the orchestrator and sends calls sync when async would miss the budget
+        self.router = router or LatencyRouter()
+        orchestrator = getattr(self.batch_queue, "orchestrator", None)
+        if orchestrator is not None and getattr(orchestrator, "on_turnaround", None) is None:
+            orchestrator.on_turnaround = self.router.observe
+        self.last_decision: Optional[RoutingDecision] = None
+        # Direct calls share the orchestrator's pool and rate limits
+        self.executor = executor or getattr(orchestrator, "executor", None) or SyncExecutor()
         self.chat = _ChatCompletionsProxy(self)
+        # Persist job_id -> provider batch_id so resume() can re-attach after a restart
+        self._jobs = weakref.WeakValueDictionary()  # job_id -> live PendingJob in this process
+        self._on_submit = None  # a callback the queue already had, called first
+        if hasattr(self.batch_queue, "on_submit"):
+            self._on_submit, self.batch_queue.on_submit = self.batch_queue.on_submit, self._record_submit
+        # Requests left behind by a previous process, when the queue has a write-ahead log
+        self.recovered_job_ids = self.batch_queue.recover(self._client)
 
     def savings_report(self):
         return self.cost_tracker.report()
 
-    def _should_use_async(self) -> bool:
-        return self.latency_budget != "realtime"
+    def route(self, model: str) -> RoutingDecision:
+        """Decide sync vs async for a call to `model`; also kept as last_decision."""
+        if self.latency_budget == "realtime":
+            decision = RoutingDecision("sync", "realtime", "", model, None)
+        else:
+            orchestrator = getattr(self.batch_queue, "orchestrator", None)
+            adapter = orchestrator.adapter(self._client) if orchestrator is not None else None
+            budget = budget_seconds(self.latency_budget)
+            # The queue holds a request for at most max_wait_sec or its share of the budget
+            queue_wait = min(
+                getattr(self.batch_queue, "max_wait_sec", 0),
+                budget * getattr(self.batch_queue, "max_wait_fraction", 0),
+            )
+            decision = self.router.decide(
+                adapter.provider if adapter is not None else "sync", model, self.latency_budget, queue_wait
+            )
+        self.last_decision = decision
+        return decision
+
+    def _should_use_async(self, model: str) -> bool:
+        return self.route(model).mode == "async"
+
+    def resume(self, job_id: str) -> "PendingJob":
+        """
+        Handle for a job created by this or an earlier process, from its job_id. A job already
+        submitted is re-attached to its provider batch (polled, not resubmitted); one that
+        never got submitted is queued again from its saved state.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        future = self.batch_queue.find(job_id) if hasattr(self.batch_queue, "find") else None
+        if future is None:
+            state = self.state_manager.load(job_id)
+            if state is None:
+                raise KeyError(f"No pending job {job_id}")
+            if state.get("batch_id") is not None:
+                if not hasattr(self.batch_queue, "attach"):
+                    raise TypeError(
+                        f"Job {job_id} is in provider batch {state['batch_id']}, and "
+                        f"{type(self.batch_queue).__name__} can't re-attach to provider batches"
+                    )
+                request = {"model": state["model"], "messages": state["messages"], "kwargs": state["kwargs"]}
+                future = self.batch_queue.attach(job_id, state["batch_id"], self._client, request)
+            else:
+                future = self.batch_queue.enqueue(
+                    job_id=job_id,
+                    model=state["model"],
+                    messages=state["messages"],
+                    kwargs=state["kwargs"],
+                    client=self._client,
+                    latency_budget=self.latency_budget,
+                )
+        return PendingJob(job_id=job_id, sbas=self, future=future)
+
+    def pending_jobs(self) -> List["PendingJob"]:
+        """resume() every job with saved state, i.e. every async job not yet collected."""
+        states = self.state_manager.load_many(list(self.state_manager.job_ids()))
+        # Other keys (e.g. WorkflowRunner agents) share the state manager
+        return [self.resume(job_id) for job_id, state in states.items() if "model" in state]
+
+    def _record_submit(self, batch_id: str, provider: str, job_ids: List[str]) -> None:
+        if self._on_submit is not None:
+            self._on_submit(batch_id, provider, job_ids)
+        # A shared queue (RedisBatchQueue) also submits other processes' jobs: update_many
+        # skips the ones with no state in this state manager rather than creating it
+        self.state_manager.update_many({job_id: {"batch_id": batch_id, "provider": provider} for job_id in job_ids})
 
     def _get_underlying_client(self):
         return self._client
@@ -67,17 +164,51 @@ class _CompletionsProxy:
         """
         Intercepts LLM call and routes to sync or async batch engine.
         """
-        import uuid
         job_id = str(uuid.uuid4())
-        start = time.time()
 
-        if not self._sbas._should_use_async():
+        # Realtime callers get responses back directly; everyone else gets a PendingJob,
+        # even when the router decides to answer this call synchronously
+        realtime = self._sbas.latency_budget == "realtime"
+
+        cache = self._sbas.response_cache
+        key = cache.key(model, messages, kwargs) if cache is not None else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                if realtime:
+                    self._sbas.cost_tracker.record(job_id, cached, mode="cached", agent=self._sbas.agent)
+                    return cached
+                future = Future()
+                future.set_result(cached)
+                return PendingJob(job_id=job_id, sbas=self._sbas, future=future, mode="cached")
+
+        if not self._sbas._should_use_async(model):
             # Direct sync call — no savings, no delay
-            result = self._sbas._client.chat.completions.create(
-                model=model, messages=messages, **kwargs
-            )
-            self._sbas.cost_tracker.record(job_id, result, mode="sync")
-            return result
+            if realtime:
+                result = self._sbas.executor.call(self._sbas._client, model, messages, kwargs)
+                if key is not None:
+                    cache.put(key, result)
+                self._sbas.cost_tracker.record(job_id, result, mode="sync", agent=self._sbas.agent)
+                return result
+            # Still async for the caller: the call runs on the executor's pool
+            future = self._sbas.executor.submit(self._sbas._client, model, messages, kwargs)
+            if key is not None:
+                future.add_done_callback(lambda done: done.exception() is None and cache.put(key, done.result()))
+            return PendingJob(job_id=job_id, sbas=self._sbas, future=future, mode="sync")
+
+        # Coalesce onto an identical request that is already queued or in flight
+        if key is not None:
+            with self._sbas._inflight_lock:
+                shared = self._sbas._inflight.get(key)
+                if shared is None:
+                    self._sbas._inflight[key] = shared = Future()
+                    owner = True
+                else:
+                    owner = False
+            if not owner:
+                future = Future()
+                shared.add_done_callback(lambda done: _copy_future(done, future))
+                return PendingJob(job_id=job_id, sbas=self._sbas, future=future, mode="cached")
 
         # Async batch path
         # 1. Save current state
@@ -85,40 +216,116 @@ class _CompletionsProxy:
         self._sbas.state_manager.save(job_id, state)
 
         # 2. Enqueue for batch submission
-        self._sbas.batch_queue.enqueue(
-            job_id=job_id,
-            model=model,
-            messages=messages,
-            kwargs=kwargs,
-            client=self._sbas._client,
-        )
+        try:
+            future = self._sbas.batch_queue.enqueue(
+                job_id=job_id,
+                model=model,
+                messages=messages,
+                kwargs=kwargs,
+                client=self._sbas._client,
+                latency_budget=self._sbas.latency_budget,
+            )
+        except Exception as e:
+            if key is not None:
+                failed = Future()
+                failed.set_exception(e)
+                self._release(key, failed, shared)
+            raise
+        if key is not None:
+            future.add_done_callback(lambda done: self._release(key, done, shared))
 
         # 3. Return a pending job handle
-        return PendingJob(job_id=job_id, sbas=self._sbas)
+        return PendingJob(job_id=job_id, sbas=self._sbas, future=future)
+
+    def _release(self, key: str, done: Future, shared: Future):
+        """The owning request finished: cache its response and fan it out to coalesced jobs."""
+        with self._sbas._inflight_lock:
+            self._sbas._inflight.pop(key, None)
+        if done.exception() is None:
+            self._sbas.response_cache.put(key, done.result())
+        _copy_future(done, shared)
+
+
+def _copy_future(source: Future, target: Future) -> None:
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
 
 
 class PendingJob:
-    """Represents an async batch job in progress."""
-    
-    def __init__(self, job_id: str, sbas: SBASInterceptor):
+    """Represents an async batch job in progress. Completes when the orchestrator stores its response."""
+
+    # One per queued request; weakly referenced from SBASInterceptor._jobs
+    __slots__ = ("job_id", "_sbas", "_future", "_mode", "status", "__weakref__")
+
+    def __init__(self, job_id: str, sbas: SBASInterceptor, future: Future, mode: str = "async"):
         self.job_id = job_id
         self._sbas = sbas
+        # Callers wait on the job's own Future, resolved only once the bookkeeping in
+        # _on_done (state cleanup, cost record) is done, so wait() never returns early
+        self._future = Future()
+        # "cached" when answered from the cache or by a coalesced request,
+        # "sync" when the router predicted the batch would miss the latency budget
+        self._mode = mode
         self.status = "pending"
+        sbas._jobs[job_id] = self
+        future.add_done_callback(self._on_done)
 
-    def wait(self, poll_interval: int = 10, timeout: int = 86400):
-        """Block until result is ready. Returns completion object."""
-        import time
-        elapsed = 0
-        while elapsed < timeout:
-            result = self._sbas.batch_queue.get_result(self.job_id)
-            if result:
-                self.status = "complete"
+    def _on_done(self, future: Future):
+        if future.exception() is not None:
+            self.status = "failed"
+            self._future.set_exception(future.exception())
+            return
+        result = future.result()
+        try:
+            if self._mode == "async":
+                self._sbas.batch_queue.get_result(self.job_id)  # drop the queue's copy
                 self._sbas.state_manager.delete(self.job_id)
-                self._sbas.cost_tracker.record(self.job_id, result, mode="async")
-                return result
-            time.sleep(poll_interval)
-            elapsed += poll_interval
-        raise TimeoutError(f"Job {self.job_id} did not complete within {timeout}s")
+            self._sbas.cost_tracker.record(self.job_id, result, mode=self._mode, agent=self._sbas.agent)
+        finally:
+            self.status = "complete"
+            self._future.set_result(result)
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    @property
+    def future(self) -> Future:
+        """The job's concurrent.futures.Future, e.g. for asyncio.wrap_future()."""
+        return self._future
+
+    def wait(self, timeout: Optional[float] = 86400):
+        """Block until result is ready. Returns completion object."""
+        try:
+            return self._future.result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Job {self.job_id} did not complete within {timeout}s") from None
+
+    result = wait
+
+    def add_done_callback(self, fn: Callable[["PendingJob"], None]) -> None:
+        """Call fn(job) once the job completes, or right away if it already has."""
+        self._future.add_done_callback(lambda _: fn(self))
 
     def __repr__(self):
         return f"<PendingJob id={self.job_id} status={self.status}>"
+
+
+def wait_all(jobs: Iterable[PendingJob], timeout: Optional[float] = None) -> list:
+    """Block until every job completes. Returns their results in order."""
+    jobs = list(jobs)
+    _, not_done = futures_wait([job._future for job in jobs], timeout=timeout)
+    if not_done:
+        raise TimeoutError(f"{len(not_done)} of {len(jobs)} jobs did not complete within {timeout}s")
+    return [job._future.result() for job in jobs]
+
+
+def as_completed(jobs: Iterable[PendingJob], timeout: Optional[float] = None) -> Iterator[PendingJob]:
+    """Yield jobs as they complete."""
+    by_future = {job._future: job for job in jobs}
+    try:
+        for future in futures_as_completed(by_future, timeout=timeout):
+            yield by_future[future]
+    except FutureTimeoutError:
+        raise TimeoutError(f"Jobs did not complete within {timeout}s") from None
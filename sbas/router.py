@@ -0,0 +1,126 @@
+"""
+LatencyRouter — decides per call whether the batch API can answer within the latency budget.
+
+Keeps a rolling window of observed batch turnaround (submit to results) per provider and
+model. A call goes async when the predicted time in the queue plus the `quantile`
+turnaround fits its budget, and sync otherwise. Only batches this process submits are
+observed, so samples age out after `max_age`: a model routed sync is tried in batches
+again once its slow turnarounds are that old, instead of staying sync forever.
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from sbas.batch.queue import budget_seconds
+
+# Provider batch APIs promise results within 24h, so budgets this long never need sync
+BATCH_WINDOW = 86400
+
+
+@dataclass
+class RoutingDecision:
+    mode: str                         # "sync" | "async"
+    reason: str
+    provider: str
+    model: str
+    budget: Optional[float]           # seconds; None for "realtime"
+    predicted: Optional[float] = None  # predicted seconds to an async result; None without data
+    samples: int = 0                  # turnaround observations behind the prediction
+
+
+class LatencyRouter:
+    """
+    Until `min_samples` turnarounds are observed for a (provider, model), calls with a
+    budget go async (optimistically, so the router can learn), or use
+    `default_turnaround` when given. Turnarounds older than `max_age` seconds (None:
+    never) no longer count.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        window: int = 200,
+        min_samples: int = 5,
+        default_turnaround: Optional[float] = None,
+        max_age: Optional[float] = 6 * 3600,
+    ):
+        self.quantile = quantile
+        self.window = window
+        self.min_samples = min_samples
+        self.default_turnaround = default_turnaround
+        self.max_age = max_age
+        self._samples: Dict[Tuple[str, str], deque] = {}  # (provider, model) -> (observed at, seconds)
+        self._quantiles: Dict[Tuple[str, str], float] = {}  # cached until the next observation
+        self._lock = threading.Lock()
+
+    def observe(self, provider: str, model: str, seconds: float) -> None:
+        """Record how long a provider batch containing `model` took to finish."""
+        key = (provider, model)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append((time.monotonic(), seconds))
+            self._quantiles.pop(key, None)
+
+    def predict(self, provider: str, model: str) -> Tuple[Optional[float], int]:
+        """(quantile turnaround in seconds or None, number of samples)."""
+        key = (provider, model)
+        with self._lock:
+            samples = self._current(key)
+            if len(samples) < self.min_samples:
+                return self.default_turnaround, len(samples)
+            value = self._quantiles.get(key)
+            if value is None:
+                ordered = sorted(seconds for _, seconds in samples)
+                value = self._quantiles[key] = ordered[min(int(self.quantile * len(ordered)), len(ordered) - 1)]
+            return value, len(samples)
+
+    def decide(self, provider: str, model: str, latency_budget: Optional[str], queue_wait: float = 0.0) -> RoutingDecision:
+        budget = budget_seconds(latency_budget)
+        if budget is None:
+            return RoutingDecision("sync", "realtime", provider, model, None)
+        if provider == "sync":
+            return RoutingDecision("async", "no batch API; queued for sequential sync calls", provider, model, budget)
+        if budget >= BATCH_WINDOW:
+            return RoutingDecision("async", "budget covers the provider batch window", provider, model, budget)
+        turnaround, samples = self.predict(provider, model)
+        if turnaround is None:
+            return RoutingDecision("async", "no turnaround observed yet", provider, model, budget, None, samples)
+        predicted = queue_wait + turnaround
+        if predicted <= budget:
+            return RoutingDecision("async", "predicted to finish within budget", provider, model, budget, predicted, samples)
+        return RoutingDecision("sync", "predicted to miss budget", provider, model, budget, predicted, samples)
+
+    def stats(self) -> dict:
+        """{(provider, model): {"samples", "p50", "p<quantile>"}} for inspection."""
+        with self._lock:
+            keys = list(self._samples)
+        result = {}
+        for key in keys:
+            with self._lock:
+                ordered = sorted(seconds for _, seconds in self._current(key))
+            if not ordered:
+                continue
+            result[key] = {
+                "samples": len(ordered),
+                "p50": ordered[len(ordered) // 2],
+                f"p{round(self.quantile * 100)}": ordered[min(int(self.quantile * len(ordered)), len(ordered) - 1)],
+            }
+        return result
+
+    def _current(self, key: Tuple[str, str]) -> deque:
+        """key's samples, less the ones past max_age (called with the lock held)."""
+        samples = self._samples.get(key)
+        if samples is None:
+            return deque()
+        if self.max_age is not None:
+            cutoff = time.monotonic() - self.max_age
+            if samples and samples[0][0] < cutoff:
+                while samples and samples[0][0] < cutoff:
+                    samples.popleft()
+                self._quantiles.pop(key, None)
+        return samples
@@ -1,2 +1,3 @@
 from sbas.state.base import BaseStateManager
 from sbas.state.memory import InMemoryStateManager
+from sbas.state.chain import ChainedStateManager
@@ -1,10 +1,14 @@
 """Abstract base class for state managers."""
 
 from abc import ABC, abstractmethod
-from typing import Optional, Any
+from typing import Dict, Iterable, Optional, Any
+from sbas.state.codecs import Codec
 
 
 class BaseStateManager(ABC):
+    # How serializing backends turn states into bytes
+    codec: Codec = Codec()
+
     @abstractmethod
     def save(self, job_id: str, state: dict) -> None: ...
 
@@ -16,3 +20,33 @@ class BaseStateManager(ABC):
 
     @abstractmethod
     def delete(self, job_id: str) -> None: ...
+
+    def job_ids(self) -> Iterable[str]:
+        """Every job_id with a saved state. Used to re-attach to jobs after a restart
+        (SBAS.pending_jobs(), WorkflowRunner.resume()); backends without it can't do that."""
+        raise TypeError(f"{type(self).__name__} can't list its jobs: implement job_ids() to resume after a restart")
+
+    # Bulk operations. Backends override these to use a single round trip / transaction.
+
+    def save_many(self, states: Dict[str, dict]) -> None:
+        for job_id, state in states.items():
+            self.save(job_id, state)
+
+    def load_many(self, job_ids: Iterable[str]) -> Dict[str, dict]:
+        """Returns job_id -> state for the jobs that exist."""
+        states = {}
+        for job_id in job_ids:
+            state = self.load(job_id)
+            if state is not None:
+                states[job_id] = state
+        return states
+
+    def update_many(self, deltas: Dict[str, dict]) -> None:
+        """Merge each delta into its job's saved state. Jobs without a saved state are skipped."""
+        for job_id, delta in deltas.items():
+            if self.load(job_id) is not None:
+                self.update(job_id, delta)
+
+    def delete_many(self, job_ids: Iterable[str]) -> None:
+        for job_id in job_ids:
+            self.delete(job_id)
@@ -0,0 +1,168 @@
+"""
+Content-addressed conversation state.
+
+ChainedStateManager wraps any state manager and stores state["messages"] as an append-only
+chain of message blocks, each addressed by the hash of its parent and content (like git
+commits). A saved state keeps only the chain head, and each save writes only the blocks
+it has not written before, so a growing conversation costs one new block per step
+instead of a full snapshot. Conversations with a common prefix, such as the same system
+prompt, share those blocks.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sbas.state.base import BaseStateManager
+
+_HEAD = "$chain"
+
+
+class ChainedStateManager(BaseStateManager):
+    """
+    Blocks live in `blocks` (default: the wrapped manager itself) under "block:<hash>".
+    They are shared between jobs, so delete() leaves them in place; a block still in use
+    is rewritten every `rewrite_after` seconds so TTL expiry or sweep() only drop blocks
+    nobody has saved recently.
+    """
+
+    def __init__(
+        self,
+        inner: BaseStateManager,
+        blocks: Optional[BaseStateManager] = None,
+        max_cached_blocks: int = 10_000,
+        rewrite_after: float = 86400,
+    ):
+        self._inner = inner
+        self._blocks = blocks or inner
+        self._cache = OrderedDict()  # hash -> (parent, message, written_at), LRU
+        self._lock = threading.Lock()
+        self.max_cached_blocks = max_cached_blocks
+        self.rewrite_after = rewrite_after
+
+    @staticmethod
+    def _block_id(digest: str) -> str:
+        return f"block:{digest}"
+
+    @staticmethod
+    def _digest(parent: Optional[str], message) -> str:
+        data = (parent or "").encode() + json.dumps(message, sort_keys=True).encode()
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    def _remember(self, digest: str, parent: Optional[str], message, written_at: float) -> None:
+        self._cache[digest] = (parent, message, written_at)
+        self._cache.move_to_end(digest)
+        while len(self._cache) > self.max_cached_blocks:
+            self._cache.popitem(last=False)
+
+    def _pack(self, state: dict) -> dict:
+        """Write new message blocks and return the state with messages replaced by the chain head."""
+        messages = state.get("messages")
+        if not isinstance(messages, list):
+            return state
+        now = time.time()
+        chain, parent = [], None
+        for message in messages:
+            digest = self._digest(parent, message)
+            chain.append((digest, parent, message))
+            parent = digest
+        head = parent
+        new_blocks = []
+        with self._lock:
+            for digest, parent, message in chain:
+                cached = self._cache.get(digest)
+                if cached is None or now - cached[2] > self.rewrite_after:
+                    new_blocks.append((digest, parent, message))
+                else:
+                    self._cache.move_to_end(digest)
+        if new_blocks:
+            self._blocks.save_many({
+                self._block_id(digest): {"parent": parent, "message": message, "written_at": now}
+                for digest, parent, message in new_blocks
+            })
+            with self._lock:
+                for digest, parent, message in new_blocks:
+                    self._remember(digest, parent, message, now)
+        return {**state, "messages": {_HEAD: head, "length": len(messages)}}
+
+    def _resolve(self, heads: Iterable[str]) -> dict:
+        """digest -> (parent, message) for every block reachable from heads.
+        Blocks not cached are fetched one chain level per bulk load."""
+        found = {}
+        frontier = {head for head in heads if head}
+        while frontier:
+            missing = []
+            with self._lock:
+                for digest in frontier:
+                    while digest and digest not in found:
+                        cached = self._cache.get(digest)
+                        if cached is None:
+                            missing.append(digest)
+                            break
+                        found[digest] = cached[:2]
+                        digest = cached[0]
+            if not missing:
+                break
+            loaded = self._blocks.load_many(self._block_id(d) for d in missing)
+            frontier = set()
+            with self._lock:
+                for digest in missing:
+                    block = loaded.get(self._block_id(digest))
+                    if block is None:
+                        raise KeyError(f"Message block {digest} is missing from the state store")
+                    found[digest] = (block["parent"], block["message"])
+                    # When the block was last written, not now: a block loaded just before
+                    # it expires must still be rewritten by the next save that uses it.
+                    # Blocks written before written_at was stored count as stale.
+                    self._remember(digest, block["parent"], block["message"], block.get("written_at", 0.0))
+                    if block["parent"]:
+                        frontier.add(block["parent"])
+        return found
+
+    def _unpack_many(self, states: Dict[str, dict]) -> Dict[str, dict]:
+        refs = {
+            job_id: state["messages"][_HEAD]
+            for job_id, state in states.items()
+            if isinstance(state.get("messages"), dict) and _HEAD in state["messages"]
+        }
+        found = self._resolve(refs.values())
+        unpacked = dict(states)
+        for job_id, head in refs.items():
+            messages, digest = [], head
+            while digest:
+                digest, message = found[digest]
+                messages.append(message)
+            messages.reverse()
+            unpacked[job_id] = {**states[job_id], "messages": messages}
+        return unpacked
+
+    def save(self, job_id: str, state: dict) -> None:
+        self._inner.save(job_id, self._pack(state))
+
+    def save_many(self, states: Dict[str, dict]) -> None:
+        self._inner.save_many({job_id: self._pack(state) for job_id, state in states.items()})
+
+    def load(self, job_id: str) -> Optional[dict]:
+        return self.load_many([job_id]).get(job_id)
+
+    def load_many(self, job_ids: Iterable[str]) -> Dict[str, dict]:
+        return self._unpack_many(self._inner.load_many(job_ids))
+
+    def update(self, job_id: str, delta: dict) -> None:
+        self._inner.update(job_id, self._pack(delta))
+
+    def update_many(self, deltas: Dict[str, dict]) -> None:
+        self._inner.update_many({job_id: self._pack(delta) for job_id, delta in deltas.items()})
+
+    def delete(self, job_id: str) -> None:
+        self._inner.delete(job_id)
+
+    def job_ids(self) -> Iterable[str]:
+        prefix = self._block_id("")
+        return [job_id for job_id in self._inner.job_ids() if not job_id.startswith(prefix)]
+
+    def delete_many(self, job_ids: Iterable[str]) -> None:
+        self._inner.delete_many(job_ids)
@@ -0,0 +1,107 @@
+"""
+State serialization codecs.
+
+A Codec turns a state dict into a tagged blob: a 4-byte header (marker, version,
+format, compression) followed by the payload. Every blob says how it was written,
+so a store holding blobs from different codecs stays readable by any of them, and
+untagged blobs are read as the plain JSON written before codecs existed.
+"""
+
+import json
+import lzma
+import zlib
+from typing import Any, Optional, Union
+
+_MARKER = 0x00   # JSON text never starts with NUL
+_VERSION = 1
+
+
+def _msgpack():
+    try:
+        import msgpack
+        return msgpack
+    except ImportError:
+        raise ImportError("Install msgpack: pip install msgpack")
+
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise ImportError("Install zstandard: pip install zstandard")
+
+
+# name -> (tag, encode, decode)
+FORMATS = {
+    "json": (1, lambda obj: json.dumps(obj, separators=(",", ":")).encode(), json.loads),
+    "msgpack": (2, lambda obj: _msgpack().packb(obj), lambda data: _msgpack().unpackb(data)),
+}
+
+# name -> (tag, compress(data, level), decompress)
+COMPRESSIONS = {
+    None: (0, lambda data, level: data, lambda data: data),
+    "zlib": (1, lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+    "lzma": (2, lambda data, level: lzma.compress(data, preset=6 if level is None else level), lzma.decompress),
+    "zstd": (
+        3,
+        lambda data, level: _zstd().ZstdCompressor(level=3 if level is None else level).compress(data),
+        lambda data: _zstd().ZstdDecompressor().decompress(data),
+    ),
+}
+
+_FORMAT_BY_TAG = {tag: decode for tag, _, decode in FORMATS.values()}
+_DECOMPRESS_BY_TAG = {tag: decompress for tag, _, decompress in COMPRESSIONS.values()}
+
+
+def fastest_format() -> str:
+    """msgpack when it is installed, JSON otherwise."""
+    try:
+        _msgpack()
+        return "msgpack"
+    except ImportError:
+        return "json"
+
+
+class Codec:
+    """
+    Encodes with `format` and, for payloads of at least `compress_threshold` bytes,
+    `compression` ("zlib", "lzma", "zstd"). Decodes anything any Codec wrote.
+    """
+
+    def __init__(
+        self,
+        format: str = "json",
+        compression: Optional[str] = None,
+        compress_threshold: int = 1024,
+        level: Optional[int] = None,
+    ):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown codec format: {format!r}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression!r}")
+        self.format = format
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        self.level = level
+
+    def encode(self, obj: Any) -> bytes:
+        format_tag, encode, _ = FORMATS[self.format]
+        payload = encode(obj)
+        compression_tag = 0
+        if self.compression is not None and len(payload) >= self.compress_threshold:
+            compression_tag, compress, _ = COMPRESSIONS[self.compression]
+            payload = compress(payload, self.level)
+        return bytes((_MARKER, _VERSION, format_tag, compression_tag)) + payload
+
+    @staticmethod
+    def decode(blob: Union[bytes, str]) -> Any:
+        if isinstance(blob, str) or not blob or blob[0] != _MARKER:
+            return json.loads(blob)  # untagged legacy JSON
+        version, format_tag, compression_tag = blob[1], blob[2], blob[3]
+        if version != _VERSION:
+            raise ValueError(f"Unsupported state blob version: {version}")
+        return _FORMAT_BY_TAG[format_tag](_DECOMPRESS_BY_TAG[compression_tag](blob[4:]))
+
+    def __repr__(self):
+        return f"Codec(format={self.format!r}, compression={self.compression!r})"
@@ -1,7 +1,7 @@
 """In-memory state manager. Use for dev/testing only — state lost on restart."""
 
 from sbas.state.base import BaseStateManager
-from typing import Optional
+from typing import Dict, Iterable, Optional
 
 
 class InMemoryStateManager(BaseStateManager):
@@ -18,5 +18,12 @@ class InMemoryStateManager(BaseStateManager):
         if job_id in self._store:
             self._store[job_id].update(delta)
 
+    def update_many(self, deltas: Dict[str, dict]) -> None:
+        for job_id, delta in deltas.items():
+            self.update(job_id, delta)
+
     def delete(self, job_id: str) -> None:
         self._store.pop(job_id, None)
+
+    def job_ids(self) -> Iterable[str]:
+        return list(self._store)
@@ -2,32 +2,158 @@
 
 import json
 from sbas.state.base import BaseStateManager
-from typing import Optional
+from sbas.state.codecs import Codec
+from typing import Dict, Iterable, Optional
+
+_EMPTY = "__sbas_empty__"  # placeholder field so an empty state still exists
+
+
+def _wrong_type(error: Exception) -> bool:
+    """A hash command hit a key in the pre-hash (JSON string) layout."""
+    return "WRONGTYPE" in str(error)
 
 
 class RedisStateManager(BaseStateManager):
-    def __init__(self, url: str = "redis://localhost:6379", ttl: int = 86400 * 7):
-        try:
-            import redis
-            self._r = redis.from_url(url)
-            self._ttl = ttl  # default 7 days
-        except ImportError:
-            raise ImportError("Install redis: pip install redis")
+    """
+    Stores each job as a hash with one codec-encoded field per top-level state key, so
+    update() is a single atomic HSET + EXPIRE round trip instead of GET/merge/SETEX.
+    Bulk operations are pipelined.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379",
+        ttl: int = 86400 * 7,
+        max_connections: Optional[int] = None,
+        connection_pool=None,
+        codec: Optional[Codec] = None,
+        redis_client=None,
+    ):
+        if codec is not None:
+            self.codec = codec
+        if redis_client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("Install redis: pip install redis")
+            pool = connection_pool or redis.ConnectionPool.from_url(url, max_connections=max_connections)
+            redis_client = redis.Redis(connection_pool=pool)
+        self._r = redis_client
+        self._ttl = ttl  # default 7 days
 
     def _key(self, job_id: str) -> str:
         return f"sbas:state:{job_id}"
 
+    def _fields(self, state: dict) -> dict:
+        return {k: self.codec.encode(v) for k, v in state.items()} or {_EMPTY: ""}
+
+    def _decode(self, fields: dict) -> Optional[dict]:
+        if not fields:
+            return None
+        return {
+            (k.decode() if isinstance(k, bytes) else k): self.codec.decode(v)
+            for k, v in fields.items()
+            if k not in (_EMPTY, _EMPTY.encode())
+        }
+
+    def _queue_save(self, pipe, job_id: str, state: dict) -> None:
+        key = self._key(job_id)
+        pipe.delete(key)
+        pipe.hset(key, mapping=self._fields(state))
+        pipe.expire(key, self._ttl)
+
     def save(self, job_id: str, state: dict) -> None:
-        self._r.setex(self._key(job_id), self._ttl, json.dumps(state))
+        pipe = self._r.pipeline(transaction=True)
+        self._queue_save(pipe, job_id, state)
+        pipe.execute()
+
+    def save_many(self, states: Dict[str, dict]) -> None:
+        pipe = self._r.pipeline(transaction=False)
+        for job_id, state in states.items():
+            self._queue_save(pipe, job_id, state)
+        pipe.execute()
 
     def load(self, job_id: str) -> Optional[dict]:
-        val = self._r.get(self._key(job_id))
-        return json.loads(val) if val else None
+        try:
+            return self._decode(self._r.hgetall(self._key(job_id)))
+        except Exception as e:
+            if not _wrong_type(e):
+                raise
+            return self._load_legacy(job_id)
+
+    def load_many(self, job_ids: Iterable[str]) -> Dict[str, dict]:
+        job_ids = list(job_ids)
+        pipe = self._r.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(self._key(job_id))
+        states = {}
+        for job_id, fields in zip(job_ids, pipe.execute(raise_on_error=False)):
+            if isinstance(fields, Exception):
+                if not _wrong_type(fields):
+                    raise fields
+                state = self._load_legacy(job_id)
+            else:
+                state = self._decode(fields)
+            if state is not None:
+                states[job_id] = state
+        return states
 
     def update(self, job_id: str, delta: dict) -> None:
-        state = self.load(job_id) or {}
-        state.update(delta)
-        self.save(job_id, state)
+        """Merge delta into the stored state atomically on the server."""
+        if not delta:
+            return
+        key = self._key(job_id)
+        pipe = self._r.pipeline(transaction=True)
+        pipe.hset(key, mapping=self._fields(delta))
+        pipe.hdel(key, _EMPTY)
+        pipe.expire(key, self._ttl)
+        try:
+            pipe.execute()
+        except Exception as e:
+            if not _wrong_type(e):
+                raise
+            # Pre-hash layout: migrate this job to a hash
+            state = self._load_legacy(job_id) or {}
+            state.update(delta)
+            self.save(job_id, state)
+
+    def update_many(self, deltas: Dict[str, dict]) -> None:
+        """Merge deltas into the jobs that have a saved state: one pipelined EXISTS pass,
+        then one pipelined write pass. Jobs without a saved state are skipped."""
+        job_ids = [job_id for job_id, delta in deltas.items() if delta]
+        if not job_ids:
+            return
+        pipe = self._r.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.exists(self._key(job_id))
+        existing = [job_id for job_id, exists in zip(job_ids, pipe.execute()) if exists]
+        for job_id in existing:
+            key = self._key(job_id)
+            pipe.hset(key, mapping=self._fields(deltas[job_id]))
+            pipe.hdel(key, _EMPTY)
+            pipe.expire(key, self._ttl)
+        replies = pipe.execute(raise_on_error=False)
+        for i, job_id in enumerate(existing):
+            error = replies[3 * i]
+            if isinstance(error, Exception):
+                if not _wrong_type(error):
+                    raise error
+                self.update(job_id, deltas[job_id])  # pre-hash layout: migrates the job
 
     def delete(self, job_id: str) -> None:
         self._r.delete(self._key(job_id))
+
+    def delete_many(self, job_ids: Iterable[str]) -> None:
+        keys = [self._key(job_id) for job_id in job_ids]
+        if keys:
+            self._r.delete(*keys)
+
+    def job_ids(self) -> Iterable[str]:
+        prefix = self._key("")
+        for key in self._r.scan_iter(match=f"{prefix}*", count=1000):
+            yield (key.decode() if isinstance(key, bytes) else key)[len(prefix):]
+
+    def _load_legacy(self, job_id: str) -> Optional[dict]:
+        """States written before the hash layout were a single JSON string."""
+        val = self._r.get(self._key(job_id))
+        return json.loads(val) if val else None
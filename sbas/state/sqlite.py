@@ -1,38 +1,197 @@
 """SQLite-backed state manager. Zero-dependency option for production."""
 
-import json
 import sqlite3
+import threading
+import time
 from sbas.state.base import BaseStateManager
-from typing import Optional
+from sbas.state.codecs import Codec
+from typing import Dict, Iterable, Optional
+
+_DELETED = object()  # pending-write marker for deletes
+_SQL_VARS = 500      # job_ids per IN (...) query
+_WRITE_ATTEMPTS = 5  # tries at committing a group before its writes are given up
 
 
 class SQLiteStateManager(BaseStateManager):
-    def __init__(self, path: str = "./sbas_state.db"):
-        self._conn = sqlite3.connect(path, check_same_thread=False)
+    """
+    Runs in WAL mode by default. Every write is committed before it returns, unless
+    group_commit=True: then writes return immediately and a background writer commits
+    everything pending in one transaction, many times faster under concurrent writers,
+    but a crash loses what was still pending. Reads see pending writes. Call flush() when
+    a write must be on disk before continuing; it raises the error if the writer had to
+    give up on a group after repeated failures.
+    """
+
+    def __init__(
+        self,
+        path: str = "./sbas_state.db",
+        journal_mode: str = "WAL",
+        synchronous: str = "NORMAL",
+        group_commit: bool = False,
+        codec: Optional[Codec] = None,
+    ):
+        if codec is not None:
+            self.codec = codec
+        self._conn = self._connect(path, journal_mode, synchronous)
         self._conn.execute(
             "CREATE TABLE IF NOT EXISTS sbas_state (job_id TEXT PRIMARY KEY, state TEXT, updated_at REAL)"
         )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sbas_state_updated_at ON sbas_state (updated_at)")
         self._conn.commit()
+        self._conn_lock = threading.Lock()
+        # A second connection lets the writer commit while readers query (":memory:" can't be shared)
+        if path == ":memory:":
+            self._reader, self._reader_lock = self._conn, self._conn_lock
+        else:
+            self._reader, self._reader_lock = self._connect(path, journal_mode, synchronous), threading.Lock()
+
+        self.group_commit = group_commit
+        self._lock = threading.Condition(threading.RLock())
+        self._pending = {}     # job_id -> (encoded state | _DELETED, updated_at), not yet picked up
+        self._committing = {}  # the writes the writer is committing right now
+        self._error = None     # why the writer last gave up on a group, raised by flush()
+        self._closed = False
+        self._writer = None
+        if group_commit:
+            self._writer = threading.Thread(target=self._run_writer, name="sbas-sqlite-writer", daemon=True)
+            self._writer.start()
+
+    @staticmethod
+    def _connect(path: str, journal_mode: str, synchronous: str):
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+        return conn
 
     def save(self, job_id: str, state: dict) -> None:
-        import time
-        self._conn.execute(
-            "INSERT OR REPLACE INTO sbas_state VALUES (?, ?, ?)",
-            (job_id, json.dumps(state), time.time()),
-        )
-        self._conn.commit()
+        self._write({job_id: (self.codec.encode(state), time.time())})
+
+    def save_many(self, states: Dict[str, dict]) -> None:
+        now = time.time()
+        self._write({job_id: (self.codec.encode(state), now) for job_id, state in states.items()})
 
     def load(self, job_id: str) -> Optional[dict]:
-        row = self._conn.execute(
-            "SELECT state FROM sbas_state WHERE job_id = ?", (job_id,)
-        ).fetchone()
-        return json.loads(row[0]) if row else None
+        return self.load_many([job_id]).get(job_id)
+
+    def load_many(self, job_ids: Iterable[str]) -> Dict[str, dict]:
+        states, missing = {}, []
+        with self._lock:
+            for job_id in job_ids:
+                pending = self._pending.get(job_id) or self._committing.get(job_id)
+                if pending is None:
+                    missing.append(job_id)
+                elif pending[0] is not _DELETED:
+                    states[job_id] = self.codec.decode(pending[0])
+        with self._reader_lock:
+            for i in range(0, len(missing), _SQL_VARS):
+                chunk = missing[i:i + _SQL_VARS]
+                rows = self._reader.execute(
+                    f"SELECT job_id, state FROM sbas_state WHERE job_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for job_id, state in rows:
+                    states[job_id] = self.codec.decode(state)
+        return states
 
     def update(self, job_id: str, delta: dict) -> None:
-        state = self.load(job_id) or {}
-        state.update(delta)
-        self.save(job_id, state)
+        self.update_many({job_id: delta})
+
+    def update_many(self, deltas: Dict[str, dict]) -> None:
+        """Merge deltas into the saved states, in one write. Jobs without a saved state are skipped."""
+        # Hold the write lock across load + save so concurrent updates don't lose each other
+        with self._lock:
+            states = self.load_many(deltas)
+            now = time.time()
+            for job_id, state in states.items():
+                state.update(deltas[job_id])
+            self._write({job_id: (self.codec.encode(state), now) for job_id, state in states.items()})
 
     def delete(self, job_id: str) -> None:
-        self._conn.execute("DELETE FROM sbas_state WHERE job_id = ?", (job_id,))
-        self._conn.commit()
+        self.delete_many([job_id])
+
+    def delete_many(self, job_ids: Iterable[str]) -> None:
+        now = time.time()
+        self._write({job_id: (_DELETED, now) for job_id in job_ids})
+
+    def job_ids(self) -> Iterable[str]:
+        self.flush()
+        with self._reader_lock:
+            return [job_id for job_id, in self._reader.execute("SELECT job_id FROM sbas_state")]
+
+    def sweep(self, older_than: float) -> int:
+        """Delete states last written before the `older_than` timestamp. Returns rows deleted."""
+        self.flush()
+        with self._conn_lock:
+            cursor = self._conn.execute("DELETE FROM sbas_state WHERE updated_at < ?", (older_than,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def flush(self) -> None:
+        """Block until every write made so far is committed, or raise why some could not be."""
+        with self._lock:
+            while self._pending or self._committing:
+                self._lock.wait()
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._closed = True
+                self._lock.notify_all()
+            if self._writer is not None:
+                self._writer.join()
+            if self._reader is not self._conn:
+                self._reader.close()
+            self._conn.close()
+
+    def _write(self, writes: dict) -> None:
+        if not self.group_commit:
+            with self._conn_lock:
+                self._commit(writes)
+            return
+        with self._lock:
+            self._pending.update(writes)
+            self._lock.notify_all()
+
+    def _run_writer(self):
+        failures = 0
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+                # Everything written while the previous transaction was committing goes into this one
+                self._committing, self._pending = self._pending, {}
+            try:
+                with self._conn_lock:
+                    self._commit(self._committing)
+            except sqlite3.Error as e:
+                failures += 1
+                with self._lock:
+                    if failures < _WRITE_ATTEMPTS:
+                        # Keep the writes (newer pending ones win) and retry shortly
+                        self._pending = {**self._committing, **self._pending}
+                    else:
+                        # Give up on them rather than retry forever: flush() raises the error
+                        self._error, failures = e, 0
+                        self._lock.notify_all()
+                    self._committing = {}
+                time.sleep(0.1 * failures)
+                continue
+            failures = 0
+            with self._lock:
+                self._committing = {}
+                self._lock.notify_all()
+
+    def _commit(self, writes: dict) -> None:
+        saves = [(job_id, state, ts) for job_id, (state, ts) in writes.items() if state is not _DELETED]
+        deletes = [(job_id,) for job_id, (state, _) in writes.items() if state is _DELETED]
+        with self._conn:
+            if saves:
+                self._conn.executemany("INSERT OR REPLACE INTO sbas_state VALUES (?, ?, ?)", saves)
+            if deletes:
+                self._conn.executemany("DELETE FROM sbas_state WHERE job_id = ?", deletes)
@@ -0,0 +1,180 @@
+"""
+WorkflowRunner — drives many agents step by step through the batch queue.
+
+Each agent is a step function called with its state and the response to its last call.
+It updates the state and returns its next request, or None when the agent is finished.
+Nothing blocks between steps: when a response arrives, a continuation on the PendingJob
+loads the agent's state from the StateManager, runs the step and queues the next call,
+on a small pool of the runner's own (not on the batch poller thread).
+Once every outstanding call is waiting in the queue, the runner flushes it, so step N
+of every agent goes out in the same provider batch(es). 10k agents take about one
+batch per step and no thread per agent.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# step(state, response) -> {"model": ..., "messages": [...], **kwargs} or None when done.
+# response is None on the first call.
+StepFn = Callable[[dict, Any], Optional[dict]]
+
+
+class WorkflowRunner:
+    """
+    Agent states live in `sbas.state_manager` under "workflow:<name>:<agent_id>", together
+    with the call the agent is waiting on and its job_id, so resume() can pick a run back
+    up in a new process.
+    """
+
+    def __init__(self, sbas, step: StepFn, name: str = "default", max_workers: int = 4):
+        self.sbas = sbas
+        self.step = step
+        self.name = name
+        self.max_workers = max_workers  # threads running continuations
+        self._pool = None  # for the current run
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._active = 0       # agents not finished yet
+        self._outstanding = 0  # calls issued and not answered yet
+        self._queued = 0       # ...of which were issued since the last flush
+        self.errors: Dict[str, Exception] = {}
+
+    def _key(self, agent_id: str) -> str:
+        return f"workflow:{self.name}:{agent_id}"
+
+    def run(self, agents: Dict[str, dict], timeout: Optional[float] = None) -> Dict[str, dict]:
+        """Run every agent from its initial state to completion. Returns agent_id -> final state."""
+        self._begin(agents)
+        for agent_id, state in agents.items():
+            self._save(agent_id, state, None)
+            self._advance(agent_id, state, None)
+        return self._finish(agents, timeout)
+
+    def resume(self, timeout: Optional[float] = None) -> Dict[str, dict]:
+        """Continue a run whose process died: re-attach every agent still waiting on a call."""
+        prefix = self._key("")
+        keys = [k for k in self.sbas.state_manager.job_ids() if k.startswith(prefix)]
+        saved = self.sbas.state_manager.load_many(keys)
+        waiting = {key[len(prefix):]: entry for key, entry in saved.items() if entry.get("job_id")}
+        self._begin(waiting)
+        for agent_id, entry in waiting.items():
+            try:
+                job = self.sbas.resume(entry["job_id"])
+            except KeyError as e:
+                # The call's response was collected but never reached the agent: make the call again
+                if entry.get("request") is None:
+                    self._fail(agent_id, entry["state"], e)
+                else:
+                    self._advance(agent_id, entry["state"], None, request=entry["request"])
+                continue
+            with self._lock:
+                self._outstanding += 1
+                self._queued += 1
+            self._attach(agent_id, job)
+        self._flush_if_wave_complete()
+        return self._finish({key[len(prefix):]: entry for key, entry in saved.items()}, timeout)
+
+    def _begin(self, agents: Iterable[str]) -> None:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"sbas-workflow-{self.name}")
+        with self._lock:
+            self._active = len(agents)
+            self._outstanding = self._queued = 0
+            self.errors = {}
+        if self._active:
+            self._done.clear()
+        else:
+            self._done.set()
+
+    def _finish(self, agents: Iterable[str], timeout: Optional[float]) -> Dict[str, dict]:
+        self._flush_if_wave_complete()
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Workflow {self.name} did not finish within {timeout}s")
+        pool, self._pool = self._pool, None
+        pool.shutdown(wait=True)  # the last continuation may still be returning
+        states = self.sbas.state_manager.load_many(self._key(agent_id) for agent_id in agents)
+        self.sbas.state_manager.delete_many(states)
+        return {key[len(self._key("")):]: entry["state"] for key, entry in states.items()}
+
+    def _save(self, agent_id: str, state: dict, job_id: Optional[str], request: Optional[dict] = None) -> None:
+        entry = {"state": state, "job_id": job_id}
+        if request is not None:
+            entry["request"] = request
+        self.sbas.state_manager.save(self._key(agent_id), entry)
+
+    def _advance(self, agent_id: str, state: dict, response: Any, request: Optional[dict] = None) -> None:
+        """Run steps until the agent makes an async call or finishes. Given `request`,
+        make that call first, before running a step."""
+        while True:
+            if request is None:
+                try:
+                    request = self.step(state, response)
+                except Exception as e:
+                    self._fail(agent_id, state, e)
+                    return
+                if request is None:
+                    self._save(agent_id, state, None)
+                    self._agent_done()
+                    return
+            kwargs = dict(request)
+            model, messages = kwargs.pop("model"), kwargs.pop("messages")
+            try:
+                job = self.sbas.chat.completions.create(model=model, messages=messages, **kwargs)
+            except Exception as e:
+                self._fail(agent_id, state, e)
+                return
+            if not hasattr(job, "add_done_callback"):
+                response, request = job, None  # realtime budget: answered directly
+                continue
+            self._save(agent_id, state, job.job_id, request)
+            with self._lock:
+                self._outstanding += 1
+                self._queued += 1
+            self._attach(agent_id, job)
+            return
+
+    def _attach(self, agent_id: str, job) -> None:
+        # Done callbacks run on the thread that completed the job, i.e. the batch poller:
+        # hand the step (and the flush it may trigger) to the pool
+        pool = self._pool
+        job.add_done_callback(lambda done: pool.submit(self._continue, agent_id, done))
+
+    def _continue(self, agent_id: str, job) -> None:
+        """Continuation: the agent's call finished."""
+        entry = self.sbas.state_manager.load(self._key(agent_id)) or {"state": {}}
+        try:
+            response = job.wait(0)
+        except Exception as e:
+            self._fail(agent_id, entry["state"], e)
+        else:
+            self._advance(agent_id, entry["state"], response)
+        # Only now is the answered call no longer outstanding: until the agent's next call
+        # is queued, no other continuation can see a complete wave and flush without it
+        with self._lock:
+            self._outstanding -= 1
+            if self._queued > self._outstanding:
+                self._queued = self._outstanding
+        self._flush_if_wave_complete()
+
+    def _flush_if_wave_complete(self) -> None:
+        """Every outstanding call is sitting in the queue: submit them as one wave."""
+        with self._lock:
+            flush = self._queued and self._queued == self._outstanding
+            if flush:
+                self._queued = 0
+        if flush:
+            self.sbas.batch_queue.flush()
+
+    def _fail(self, agent_id: str, state: dict, error: Exception) -> None:
+        with self._lock:
+            self.errors[agent_id] = error
+        self._save(agent_id, state, None)
+        self._agent_done()
+
+    def _agent_done(self) -> None:
+        with self._lock:
+            self._active -= 1
+            finished = self._active == 0
+        if finished:
+            self._done.set()
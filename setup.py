@@ -16,6 +16,7 @@ setup(
         "openai": ["openai>=1.0"],
         "anthropic": ["anthropic>=0.20"],
         "langchain": ["langchain>=0.1", "langchain-openai>=0.1"],
+        "codecs": ["msgpack>=1.0", "zstandard>=0.21"],
         "all": ["redis>=4.0", "openai>=1.0", "anthropic>=0.20", "langchain>=0.1"],
     },
     classifiers=[
@@ -0,0 +1,173 @@
+"""Tests for the asyncio interceptor."""
+import asyncio
+import json
+import pytest
+from sbas import AsyncSBAS
+from sbas.batch.async_queue import AsyncBatchQueue
+
+
+class MockObject:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class MockCompletions:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def create(self, model, messages, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return MockObject(model=model, usage=None, content=messages[-1]["content"])
+
+
+class MockAsyncClient:
+    def __init__(self):
+        self.chat = MockObject(completions=MockCompletions())
+
+
+class MockAsyncFiles:
+    def __init__(self):
+        self.uploads = {}
+
+    async def create(self, file, purpose):
+        file_id = f"file-{len(self.uploads)}"
+        self.uploads[file_id] = file[1].read()
+        return MockObject(id=file_id)
+
+    async def content(self, file_id):
+        return MockObject(iter_lines=self.uploads[file_id].splitlines)
+
+
+class MockAsyncBatches:
+    def __init__(self, files):
+        self._files = files
+        self.created = []
+
+    async def create(self, input_file_id, endpoint, completion_window):
+        self.created.append(input_file_id)
+        return MockObject(id=input_file_id)
+
+    async def retrieve(self, batch_id):
+        lines = [
+            json.dumps({"custom_id": req["custom_id"], "response": {"body": req["body"]["messages"][-1]}})
+            for req in map(json.loads, self._files.uploads[batch_id].decode().splitlines())
+        ]
+        self._files.uploads["out-" + batch_id] = "\n".join(lines)
+        return MockObject(id=batch_id, status="completed", output_file_id="out-" + batch_id)
+
+
+class MockAsyncBatchClient:
+    def __init__(self):
+        self.files = MockAsyncFiles()
+        self.batches = MockAsyncBatches(self.files)
+
+
+def user(content):
+    return [{"role": "user", "content": content}]
+
+
+def test_awaitable_jobs_share_one_loop():
+    async def main():
+        llm = MockAsyncClient()
+        client = AsyncSBAS(llm, latency_budget="24h", batch_queue=AsyncBatchQueue(max_size=50, max_sync_concurrency=8))
+        jobs = [await client.chat.completions.create(model="gpt-4o", messages=user(str(i))) for i in range(50)]
+        results = await asyncio.gather(*jobs)
+        await client.batch_queue.close()
+        return llm, client, results
+
+    llm, client, results = asyncio.run(main())
+    assert [r.content for r in results] == [str(i) for i in range(50)]
+    assert llm.chat.completions.peak == 8
+    assert client.savings_report()["async_calls"] == 50
+
+def test_batch_api_and_timeout():
+    async def main():
+        llm = MockAsyncBatchClient()
+        queue = AsyncBatchQueue(max_wait_sec=0.01, min_poll_interval=0.01)
+        client = AsyncSBAS(llm, latency_budget="24h", batch_queue=queue)
+        jobs = [await client.chat.completions.create(model="gpt-4o", messages=user(str(i))) for i in range(3)]
+        results = await asyncio.gather(*jobs)
+        await queue.close()
+
+        slow = AsyncSBAS(MockAsyncClient(), latency_budget="24h", batch_queue=AsyncBatchQueue(max_wait_sec=3600))
+        job = await slow.chat.completions.create(model="gpt-4o", messages=user("late"))
+        with pytest.raises(TimeoutError):
+            await job.wait(timeout=0.01)
+        await slow.batch_queue.close(flush=False)
+        return llm, results
+
+    llm, results = asyncio.run(main())
+    assert [r["content"] for r in results] == ["0", "1", "2"]
+    assert len(llm.batches.created) == 1
+
+def test_realtime_calls_through():
+    async def main():
+        client = AsyncSBAS(MockAsyncClient(), latency_budget="realtime")
+        return await client.chat.completions.create(model="gpt-4o", messages=user("now"))
+
+    assert asyncio.run(main()).content == "now"
+
+
+def test_realtime_anthropic_calls_use_the_messages_api():
+    class MockAsyncMessages:
+        async def create(self, **params):
+            return MockObject(model=params["model"], usage=None, content=params["messages"][-1]["content"])
+
+    async def main():
+        client = AsyncSBAS(MockObject(messages=MockAsyncMessages()), latency_budget="realtime")
+        return await client.chat.completions.create(model="claude-sonnet-4-5", messages=user("now"))
+
+    assert asyncio.run(main()).content == "now"
+
+
+class ExpiringAsyncBatches(MockAsyncBatches):
+    """The first batch ends "expired" with its requests unrun; later ones take two status checks."""
+
+    def __init__(self, files):
+        super().__init__(files)
+        self.checks = {}
+
+    async def retrieve(self, batch_id):
+        self.checks[batch_id] = self.checks.get(batch_id, 0) + 1
+        if batch_id == "file-0":
+            errors = [
+                json.dumps({"custom_id": json.loads(line)["custom_id"], "response": None,
+                            "error": {"code": "batch_expired", "message": "not run"}})
+                for line in self._files.uploads[batch_id].decode().splitlines()
+            ]
+            self._files.uploads["err-" + batch_id] = "\n".join(errors)
+            return MockObject(id=batch_id, status="expired", output_file_id=None, error_file_id="err-" + batch_id)
+        if self.checks[batch_id] < 2:
+            return MockObject(id=batch_id, status="in_progress")
+        return await super().retrieve(batch_id)
+
+
+def test_resubmission_does_not_hold_up_other_status_checks():
+    async def main():
+        llm = MockAsyncBatchClient()
+        llm.batches = ExpiringAsyncBatches(llm.files)
+        upload, gate = llm.files.create, asyncio.Event()
+
+        async def slow_reupload(file, purpose):
+            if len(llm.files.uploads) >= 2:  # the retry of the expired batch
+                await gate.wait()
+            return await upload(file, purpose)
+        llm.files.create = slow_reupload
+        queue = AsyncBatchQueue(max_wait_sec=3600, min_poll_interval=0.01)
+        client = AsyncSBAS(llm, latency_budget="24h", batch_queue=queue)
+        expired = await client.chat.completions.create(model="gpt-4o", messages=user("again"))
+        await queue.flush()
+        other = await client.chat.completions.create(model="gpt-4o", messages=user("other"))
+        await queue.flush()
+        result = await other.wait(timeout=1)  # while the retry's upload is still stuck
+        gate.set()
+        retried = await expired.wait(timeout=1)
+        await queue.close()
+        return result, retried
+
+    result, retried = asyncio.run(main())
+    assert result["content"] == "other" and retried["content"] == "again"
@@ -0,0 +1,142 @@
+"""Tests for the batch queue write-ahead log."""
+import time
+
+import pytest
+
+from sbas.batch.log import BatchLog
+from sbas.batch.queue import BatchQueue
+from tests.test_batch_queue import MockClient
+from tests.test_orchestrator import MockBatchClient
+
+
+def wait_for_result(queue, job_id, timeout=2.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        result = queue.get_result(job_id)
+        if result is not None:
+            return result
+        time.sleep(0.01)
+    return None
+
+
+def test_pending_requests_survive_restart(tmp_path):
+    path = str(tmp_path / "queue.log")
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    queue.enqueue("job-1", "gpt-4o", [{"role": "user", "content": "hi"}], {}, MockClient())
+    queue.log.close()  # process dies before the queue is flushed
+
+    client = MockClient()
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    assert queue.recover(client) == ["job-1"]
+    queue.flush()
+    assert wait_for_result(queue, "job-1") is not None
+    assert client.chat.completions.calls == ["gpt-4o"]
+    queue.log.close()
+
+    # Delivered and collected: nothing left to recover
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    assert queue.recover(client) == []
+    queue.log.close()
+
+def test_inflight_batches_are_reattached_not_resubmitted(tmp_path):
+    path = str(tmp_path / "queue.log")
+    client = MockBatchClient(polls_until_done=1)
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    queue.orchestrator.min_poll_interval = 3600
+    queue.enqueue("job-1", "gpt-4o", [], {}, client)
+    queue.enqueue("job-2", "gpt-4o", [], {}, client)
+    queue.flush()
+    queue.log.close()  # process dies while the batch is in flight
+
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    queue.orchestrator.min_poll_interval = 0.01
+    assert sorted(queue.recover(client)) == ["job-1", "job-2"]
+    assert wait_for_result(queue, "job-1") == {"model": "gpt-4o"}
+    assert wait_for_result(queue, "job-2") == {"model": "gpt-4o"}
+    assert len(client.batches.batches) == 1
+    queue.log.close()
+
+def test_undelivered_results_survive_restart(tmp_path):
+    path = str(tmp_path / "queue.log")
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    queue.enqueue("job-1", "gpt-4o", [], {}, MockBatchClient())
+    queue._store_result("job-1", {"content": "done"})
+    queue.log.close()
+
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    assert queue.recover(MockBatchClient()) == ["job-1"]
+    assert queue.get_result("job-1") == {"content": "done"}
+    queue.log.close()
+
+def test_undelivered_failures_survive_restart(tmp_path):
+    from sbas import SBAS
+    path = str(tmp_path / "queue.log")
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    queue.enqueue("job-1", "gpt-4o", [], {}, MockBatchClient())
+    queue._store_error("job-1", ValueError("Invalid 'messages'"))
+    queue.log.close()
+
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    sbas = SBAS(MockBatchClient(), latency_budget="24h", batch_queue=queue)
+    assert sbas.recovered_job_ids == ["job-1"]
+    with pytest.raises(RuntimeError, match="Invalid 'messages'"):
+        sbas.resume("job-1").wait(1)
+    assert queue.find("job-1") is None  # handed out once
+    queue.log.close()
+
+    log = BatchLog(path)
+    assert log.recovered.results == {}
+    log.close()
+
+
+def test_resubmitted_jobs_move_to_their_new_batch(tmp_path):
+    path = str(tmp_path / "queue.log")
+    log = BatchLog(path)
+    for job_id in ("job-1", "job-2"):
+        log.append({"e": "enqueue", "job_id": job_id, "provider": "openai", "model": "gpt-4o",
+                    "messages": [], "kwargs": {}, "deadline": None, "flush_by": 0})
+    log.append({"e": "submit", "batch_id": "batch-0", "provider": "openai", "job_ids": ["job-1", "job-2"]})
+    log.append({"e": "done", "job_id": "job-1", "result": {"content": "done"}})
+    log.append({"e": "submit", "batch_id": "batch-1", "provider": "openai", "job_ids": ["job-2"]})  # job-2 expired
+    log.close()
+
+    log = BatchLog(path)
+    assert list(log.recovered.inflight) == ["batch-1"]
+    assert list(log.recovered.inflight["batch-1"]["requests"]) == ["job-2"]
+    assert log.recovered.inflight["batch-1"]["attempts"] == {"job-2": 2}
+    log.close()
+
+    # The count survives compaction, and a further retry adds to it
+    log = BatchLog(path)
+    assert log.recovered.inflight["batch-1"]["attempts"] == {"job-2": 2}
+    log.append({"e": "submit", "batch_id": "batch-2", "provider": "openai", "job_ids": ["job-2"]})
+    log.close()
+    log = BatchLog(path)
+    assert log.recovered.inflight["batch-2"]["attempts"] == {"job-2": 3}
+    log.close()
+
+
+def test_recovered_jobs_keep_their_attempts(tmp_path):
+    from sbas.batch.providers.errors import BatchItemError
+    from tests.test_orchestrator import partial_client
+    path = str(tmp_path / "queue.log")
+    log = BatchLog(path)
+    log.append({"e": "enqueue", "job_id": "job-1", "provider": "openai", "model": "gpt-4o",
+                "messages": [], "kwargs": {}, "deadline": None, "flush_by": 0})
+    log.append({"e": "submit", "batch_id": "batch-a", "provider": "openai", "job_ids": ["job-1"]})
+    log.append({"e": "submit", "batch_id": "batch-b", "provider": "openai", "job_ids": ["job-1"]})
+    log.close()
+
+    # batch-b was the job's 2nd run of max_attempts=2: expiring in it is final
+    client = partial_client(expire=["job-1"], every_batch=True)
+    client.files.uploads["file-b"] = b'{"custom_id": "job-1", "body": {"model": "gpt-4o"}}'
+    client.batches.batches["batch-b"] = {"input": "file-b", "polls": 0}
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path))
+    queue.orchestrator.min_poll_interval = 0.01
+    queue.orchestrator.max_attempts = 2
+    assert queue.recover(client) == ["job-1"]
+    error = queue.find("job-1").exception(2)
+    assert isinstance(error, BatchItemError) and error.kind == "expired"
+    assert len(client.batches.batches) == 1  # not resubmitted
+    queue.orchestrator.close()
+    queue.log.close()
@@ -0,0 +1,91 @@
+"""Tests for batch queue."""
+import time
+import pytest
+from sbas.batch.queue import BatchQueue, budget_seconds
+
+
+class MockResponse:
+    model = "gpt-4o"
+    usage = None
+
+
+class MockCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, model, messages, **kwargs):
+        self.calls.append(model)
+        return MockResponse()
+
+
+class MockChat:
+    def __init__(self):
+        self.completions = MockCompletions()
+
+
+class MockClient:
+    def __init__(self):
+        self.chat = MockChat()
+
+
+def wait_for_result(queue, job_id, timeout=2.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        result = queue.get_result(job_id)
+        if result is not None:
+            return result
+        time.sleep(0.01)
+    return None
+
+
+def test_budget_seconds():
+    assert budget_seconds("realtime") is None
+    assert budget_seconds("1h") == 3600
+    assert budget_seconds("30m") == 1800
+    assert budget_seconds("24h") == 86400
+    with pytest.raises(ValueError):
+        budget_seconds("soon")
+
+def test_flushes_after_max_wait():
+    queue = BatchQueue(max_size=100, max_wait_sec=0.05)
+    queue.enqueue("job-1", "gpt-4o", [], {}, MockClient())
+    assert wait_for_result(queue, "job-1") is not None
+    queue.close()
+
+def test_flushes_early_when_deadline_at_risk():
+    queue = BatchQueue(max_size=100, max_wait_sec=3600, max_wait_fraction=0.1)
+    queue.enqueue("job-1", "gpt-4o", [], {}, MockClient(), deadline=time.time() + 0.5)
+    assert wait_for_result(queue, "job-1") is not None
+    queue.close()
+
+def test_waits_while_requests_have_slack():
+    client = MockClient()
+    queue = BatchQueue(max_size=100, max_wait_sec=3600)
+    queue.enqueue("job-1", "gpt-4o", [], {}, client, latency_budget="24h")
+    time.sleep(0.1)
+    assert client.chat.completions.calls == []
+    queue.close(flush=False)
+
+def test_flushes_when_full():
+    client = MockClient()
+    queue = BatchQueue(max_size=2, max_wait_sec=3600)
+    queue.enqueue("job-1", "gpt-4o", [], {}, client)
+    queue.enqueue("job-2", "gpt-4o", [], {}, client)
+    assert wait_for_result(queue, "job-1") is not None
+    assert wait_for_result(queue, "job-2") is not None
+    queue.close()
+
+def test_queued_requests_share_model_names_and_messages():
+    client = MockClient()
+    queue = BatchQueue(max_size=100, max_wait_sec=3600)
+    messages = [{"role": "user", "content": "hi"}]
+    queue.enqueue("job-1", "".join(["gpt-", "4o"]), messages, {}, client, latency_budget="24h")
+    queue.enqueue("job-2", "".join(["gpt-", "4o"]), messages, {"temperature": 0}, client, latency_budget="24h")
+    first, second = queue._queue["job-1"], queue._queue["job-2"]
+    assert first.model is second.model
+    assert first.messages is messages
+    with queue._lock:
+        batch = queue._take_batch()
+    assert batch["job-1"]["kwargs"] == {} and batch["job-2"]["kwargs"] == {"temperature": 0}
+    assert batch["job-1"]["client"] is client and batch["job-1"]["messages"] is messages
+    queue.close(flush=False)
@@ -0,0 +1,121 @@
+"""Tests for the batched cloud reporter, against a local HTTP server."""
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sbas.cloud.reporter import CloudReporter
+
+
+class MetricsServer:
+    """Records each POSTed batch and the client port it arrived on; fails the first `fail` requests."""
+
+    def __init__(self, fail=0, fail_status=503):
+        self.batches, self.ports, self.headers = [], [], []
+        self.fail = fail
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                if server.fail:
+                    server.fail -= 1
+                    status = fail_status
+                else:
+                    server.batches.append(json.loads(gzip.decompress(body))["metrics"])
+                    server.ports.append(self.client_address[1])
+                    server.headers.append(dict(self.headers))
+                    status = 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/v1/metrics"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    s = MetricsServer()
+    yield s
+    s.close()
+
+
+def test_metrics_are_batched_over_one_connection(server):
+    reporter = CloudReporter("key", endpoint=server.url, batch_size=10, flush_interval=60)
+    for i in range(25):
+        reporter.report(f"job-{i}", tokens=100, savings_pct=50.0, mode="async")
+    assert reporter.flush(timeout=5)
+    assert [len(b) for b in server.batches] == [10, 10, 5]
+    assert len(set(server.ports)) == 1  # keep-alive connection reused
+    assert server.headers[0]["Content-Encoding"] == "gzip"
+    assert server.headers[0]["Authorization"] == "Bearer key"
+    assert "job-0" not in json.dumps(server.batches)  # only hashed ids leave the process
+    assert reporter.sent == 25
+    reporter.close()
+
+
+def test_partial_batch_is_sent_after_flush_interval(server):
+    reporter = CloudReporter("key", endpoint=server.url, batch_size=100, flush_interval=0.05)
+    reporter.report("job-1", tokens=100, savings_pct=50.0, mode="async")
+    for _ in range(100):
+        if server.batches:
+            break
+        threading.Event().wait(0.02)
+    assert [len(b) for b in server.batches] == [1]
+    # Once idle, the next metric is due flush_interval after it was reported too
+    reporter.report("job-2", tokens=100, savings_pct=50.0, mode="async")
+    for _ in range(100):
+        if len(server.batches) == 2:
+            break
+        threading.Event().wait(0.02)
+    assert [len(b) for b in server.batches] == [1, 1]
+    reporter.close()
+    assert reporter._conn is None  # closed by the sender on its way out
+
+
+def test_failed_batches_are_retried():
+    server = MetricsServer(fail=2)
+    reporter = CloudReporter("key", endpoint=server.url, batch_size=5, retry_backoff=0.01)
+    for i in range(5):
+        reporter.report(f"job-{i}", tokens=100, savings_pct=50.0, mode="async")
+    assert reporter.flush(timeout=5)
+    assert [len(b) for b in server.batches] == [5]
+    assert reporter.dropped == 0
+    reporter.close()
+    server.close()
+
+
+def test_rejected_batches_are_dropped():
+    server = MetricsServer(fail=1, fail_status=401)
+    reporter = CloudReporter("key", endpoint=server.url, batch_size=5, retry_backoff=0.01)
+    for i in range(5):
+        reporter.report(f"job-{i}", tokens=100, savings_pct=50.0, mode="async")
+    assert reporter.flush(timeout=5)
+    assert server.batches == []
+    assert reporter.dropped == 5
+    reporter.close()
+    server.close()
+
+
+def test_overflow_drops_oldest_without_blocking():
+    # Nothing listens here; the sender keeps retrying while report() keeps returning immediately
+    reporter = CloudReporter("key", endpoint="http://127.0.0.1:9/", max_queue=3, batch_size=100,
+                             flush_interval=60, retry_backoff=60)
+    for i in range(10):
+        reporter.report(f"job-{i}", tokens=i, savings_pct=50.0, mode="async")
+    assert [m["tokens"] for m in reporter._queue] == [7, 8, 9]
+    assert reporter.dropped == 7
+    reporter.close(timeout=0.1)
@@ -0,0 +1,37 @@
+"""Tests for state codecs."""
+import json
+import pytest
+from sbas.state.codecs import Codec
+from sbas.state.sqlite import SQLiteStateManager
+
+STATE = {"messages": [{"role": "user", "content": "hello " * 500}], "step": 3}
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "lzma"])
+def test_roundtrip(compression):
+    codec = Codec(compression=compression)
+    assert codec.decode(codec.encode(STATE)) == STATE
+
+def test_compresses_only_above_threshold():
+    codec = Codec(compression="zlib", compress_threshold=1024)
+    assert len(codec.encode(STATE)) < len(json.dumps(STATE)) / 10
+    small = codec.encode({"step": 1})
+    assert small[3] == 0  # stored uncompressed
+
+def test_reads_untagged_json():
+    assert Codec.decode(json.dumps(STATE)) == STATE
+    assert Codec.decode(json.dumps(STATE).encode()) == STATE
+
+def test_mixed_codecs_in_one_store(tmp_path):
+    path = str(tmp_path / "state.db")
+    sm = SQLiteStateManager(path, codec=Codec(compression="lzma"))
+    sm.save("job-1", STATE)
+    sm.close()
+    sm = SQLiteStateManager(path, codec=Codec(compression="zlib"))
+    sm.save("job-2", STATE)
+    assert sm.load("job-1") == sm.load("job-2") == STATE
+    sm.close()
+
+def test_unknown_codec_rejected():
+    with pytest.raises(ValueError):
+        Codec(format="xml")
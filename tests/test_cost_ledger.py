@@ -0,0 +1,77 @@
+"""Tests for the on-disk cost ledger."""
+import sqlite3
+
+import pytest
+
+from sbas.cost.ledger import CostLedger
+from sbas.cost.tracker import CostTracker
+from sbas.interceptor import SBASInterceptor
+
+from tests.test_cost_tracker import MockResponse, MiniResponse
+from tests.test_interceptor import MockClient, user
+
+DAY = 86400
+
+
+def test_ledger_persists_across_restarts(tmp_path):
+    path = str(tmp_path / "costs.db")
+    ledger = CostLedger(path)
+    ct = CostTracker(ledger=ledger)
+    ct.record("job-1", MockResponse(), mode="async", agent="scraper")
+    ct.record("job-2", MiniResponse(), mode="sync", agent="writer")
+    ledger.close()
+
+    ledger = CostLedger(path)
+    report = ledger.report()
+    ledger.close()
+    assert report["total_calls"] == 2
+    assert report["async_calls"] == 1
+    assert report["by_agent"]["scraper"]["total_saved"] > 0
+    assert report["by_agent"]["writer"]["total_saved"] == 0.0
+
+
+def test_ledger_report_by_day(tmp_path, monkeypatch):
+    import sbas.cost.tracker as tracker
+    now = [10 * DAY + 3600.0]
+    monkeypatch.setattr(tracker.time, "time", lambda: now[0])
+    ledger = CostLedger(str(tmp_path / "costs.db"))
+    ct = CostTracker(ledger=ledger)
+    for day in range(5):
+        now[0] = (10 + day) * DAY + 3600.0
+        for i in range(day + 1):
+            ct.record(f"job-{day}-{i}", MockResponse(), mode="async", agent="a")
+
+    report = ledger.report(since=12 * DAY, until=14 * DAY)
+    assert list(report["by_day"]) == ["1970-01-13", "1970-01-14"]
+    assert report["total_calls"] == 3 + 4
+    assert ledger.report(agent="b")["total_calls"] == 0
+    assert ledger.report()["total_calls"] == 15
+    ledger.close()
+
+
+def test_interceptor_tags_records_with_agent(tmp_path):
+    ledger = CostLedger(str(tmp_path / "costs.db"))
+    sbas = SBASInterceptor(
+        MockClient(), latency_budget="realtime", cost_tracker=CostTracker(ledger=ledger), agent="planner"
+    )
+    sbas.chat.completions.create(model="gpt-4o", messages=user("hi"))
+    assert sbas.savings_report()["by_agent"]["planner"]["calls"] == 1
+    assert ledger.report()["by_agent"]["planner"]["calls"] == 1
+    ledger.close()
+
+
+def test_writer_gives_up_and_flush_raises(tmp_path):
+    ledger = CostLedger(str(tmp_path / "costs.db"))
+    commit = ledger._commit
+
+    def locked(records):
+        raise sqlite3.OperationalError("database is locked")
+    ledger._commit = locked
+    ct = CostTracker(ledger=ledger)
+    ct.record("job-1", MockResponse(), mode="async")
+    with pytest.raises(sqlite3.OperationalError):
+        ledger.flush()
+    ledger._commit = commit
+    ct.record("job-2", MockResponse(), mode="async")
+    assert ledger.report()["total_calls"] == 1  # the writer carries on with later records
+    ledger.close()
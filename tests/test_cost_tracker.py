@@ -25,3 +25,50 @@ def test_async_saves_money():
     assert report["async_calls"] == 1
     assert report["total_saved"] > 0
     assert report["savings_pct"] > 0
+
+
+class MiniResponse:
+    model = "gpt-4o-mini"
+    usage = MockUsage()
+
+
+def test_report_breaks_down_by_model_and_mode():
+    ct = CostTracker()
+    ct.record("job-1", MockResponse(), mode="async")
+    ct.record("job-2", MockResponse(), mode="sync")
+    ct.record("job-3", MiniResponse(), mode="cached")
+    report = ct.report()
+    assert report["total_calls"] == 3
+    assert report["by_model"]["gpt-4o"]["calls"] == 2
+    assert report["by_model"]["gpt-4o-mini"]["total_cost"] == 0.0
+    assert report["by_mode"]["sync"]["total_saved"] == 0.0
+    assert report["by_mode"]["async"]["calls"] == 1
+    assert report["by_mode"]["cached"]["calls"] == 1
+
+
+def test_raw_records_are_capped():
+    ct = CostTracker(max_records=5)
+    for i in range(20):
+        ct.record(f"job-{i}", MockResponse(), mode="async")
+    assert len(ct._records) == 5
+    assert ct.report()["async_calls"] == 20
+
+
+def test_report_since_uses_rollups(monkeypatch):
+    import sbas.cost.tracker as tracker
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(tracker.time, "time", lambda: now[0])
+    ct = CostTracker(max_records=1)
+    start = now[0]
+    # One call every 10 minutes for three days
+    for i in range(3 * 24 * 6):
+        now[0] = start + i * 600
+        ct.record(f"job-{i}", MockResponse(), mode="async")
+    end = now[0]
+
+    assert ct.report(since=end - 1)["total_calls"] == 1                  # minute resolution
+    assert ct.report(since=end - 3 * 3600 + 60)["total_calls"] == 18     # minutes + hours
+    assert ct.report(since=start)["total_calls"] == 3 * 24 * 6           # past minute retention
+    assert ct.report(since=end + 60)["total_calls"] == 0
+    # Minute buckets only reach back a day
+    assert len(ct._rollups["minute"]) <= 24 * 60
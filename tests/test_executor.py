@@ -0,0 +1,141 @@
+"""Tests for the rate-limited sync executor."""
+import threading
+import time
+
+import pytest
+
+from sbas import SBAS
+from sbas.batch.executor import SyncExecutor, TokenBucket
+from sbas.batch.tokens import estimate_tokens
+
+from tests.test_interceptor import MockResponse, user
+
+
+class MockObject:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after_ms=None):
+        super().__init__("rate limited")
+        headers = {"retry-after-ms": str(retry_after_ms)} if retry_after_ms is not None else {}
+        self.response = MockObject(headers=headers)
+
+
+class MockCompletions:
+    """Rejects the first `limited` calls with 429 and tracks peak concurrency."""
+
+    def __init__(self, limited=0, delay=0.0, retry_after_ms=10):
+        self.limited = limited
+        self.delay = delay
+        self.retry_after_ms = retry_after_ms
+        self.calls = []
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, **kwargs):
+        with self._lock:
+            self.calls.append(time.monotonic())
+            if self.limited:
+                self.limited -= 1
+                raise RateLimitError(self.retry_after_ms)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return MockResponse(messages[-1]["content"])
+
+
+class MockClient:
+    def __init__(self, **kwargs):
+        self.chat = MockObject(completions=MockCompletions(**kwargs))
+
+
+def test_runs_calls_concurrently_up_to_max_workers():
+    client = MockClient(delay=0.05)
+    executor = SyncExecutor(max_workers=4)
+    futures = [executor.submit(client, "gpt-4o", user(str(i)), {}) for i in range(12)]
+    assert [f.result(2).content for f in futures] == [str(i) for i in range(12)]
+    assert client.chat.completions.peak == 4
+    executor.close()
+
+
+def test_retries_rate_limited_calls_after_retry_after():
+    client = MockClient(limited=2, retry_after_ms=50)
+    executor = SyncExecutor(max_retries=3)
+    assert executor.call(client, "gpt-4o", user("hi"), {}).content == "hi"
+    calls = client.chat.completions.calls
+    assert len(calls) == 3
+    assert calls[1] - calls[0] >= 0.05
+    executor.close()
+
+
+def test_gives_up_after_max_retries():
+    client = MockClient(limited=10, retry_after_ms=1)
+    executor = SyncExecutor(max_retries=2)
+    with pytest.raises(RateLimitError):
+        executor.call(client, "gpt-4o", user("hi"), {})
+    assert len(client.chat.completions.calls) == 3
+    executor.close()
+
+
+def test_token_bucket_waits_once_the_burst_is_spent():
+    bucket = TokenBucket(per_minute=600)  # 10 per second
+    assert bucket.reserve(600) == 0
+    assert bucket.reserve(10) == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve(10_000) == pytest.approx(61.0, abs=0.1)  # capped at one bucketful
+
+
+def test_requests_per_minute_limit_spaces_calls():
+    client = MockClient()
+    executor = SyncExecutor(limits={"gpt-4o": (600, None)})
+    executor._model_buckets("gpt-4o")[0].reserve(600)  # spend the burst
+    start = time.monotonic()
+    futures = [executor.submit(client, "gpt-4o", user(str(i)), {}) for i in range(3)]
+    for f in futures:
+        f.result(2)
+    assert time.monotonic() - start >= 0.25
+    # Other models are not limited
+    assert executor.call(client, "gpt-4o-mini", user("hi"), {}).content == "hi"
+    executor.close()
+
+
+def test_estimate_tokens():
+    messages = [{"role": "user", "content": "x" * 400}, {"role": "user", "content": [{"type": "text", "text": "y" * 40}]}]
+    assert estimate_tokens(messages, {"max_tokens": 100}) == 100 + 4 + 10 + 4 + 100
+
+
+def test_realtime_path_retries_rate_limits():
+    client = MockClient(limited=1, retry_after_ms=1)
+    sbas = SBAS(client, latency_budget="realtime")
+    assert sbas.chat.completions.create(model="gpt-4o", messages=user("hi")).content == "hi"
+    assert len(client.chat.completions.calls) == 2
+
+
+class MockMessages:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **params):
+        self.calls.append(params)
+        return MockResponse(params["messages"][-1]["content"])
+
+
+class MockAnthropicClient:
+    def __init__(self):
+        self.messages = MockMessages()
+
+
+def test_anthropic_clients_are_called_through_the_messages_api():
+    client = MockAnthropicClient()
+    sbas = SBAS(client, latency_budget="realtime")
+    messages = [{"role": "system", "content": "Be brief."}, *user("hi")]
+    assert sbas.chat.completions.create(model="claude-sonnet-4-5", messages=messages, stop="END").content == "hi"
+    assert client.messages.calls == [{
+        "model": "claude-sonnet-4-5", "messages": user("hi"), "max_tokens": 1024,
+        "system": "Be brief.", "stop_sequences": ["END"],
+    }]
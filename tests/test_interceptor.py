@@ -0,0 +1,208 @@
+"""Tests for interceptor and pending jobs."""
+import sys
+import threading
+import time
+import types
+import pytest
+from sbas import SBAS, wait_all, as_completed
+from sbas.batch.providers import openai as openai_adapter
+from sbas.batch.queue import BatchQueue
+from sbas.cache import ResponseCache
+
+
+class MockUsage:
+    prompt_tokens = 500
+    completion_tokens = 200
+
+
+class MockResponse:
+    model = "gpt-4o"
+    usage = MockUsage()
+
+    def __init__(self, content):
+        self.content = content
+
+
+class MockCompletions:
+    def __init__(self, gate=None):
+        self._gate = gate
+
+    def create(self, model, messages, **kwargs):
+        if self._gate is not None:
+            self._gate.wait()
+        if messages and messages[-1]["content"] == "fail":
+            raise ValueError("bad request")
+        return MockResponse(messages[-1]["content"] if messages else None)
+
+
+class MockChat:
+    def __init__(self, gate=None):
+        self.completions = MockCompletions(gate)
+
+
+class MockClient:
+    def __init__(self, gate=None):
+        self.chat = MockChat(gate)
+
+
+def user(content):
+    return [{"role": "user", "content": content}]
+
+
+def test_wait_returns_result_and_records_cost():
+    client = SBAS(MockClient(), latency_budget="24h", batch_queue=BatchQueue(max_wait_sec=0.01))
+    job = client.chat.completions.create(model="gpt-4o", messages=user("hi"))
+    assert job.wait(timeout=2).content == "hi"
+    assert job.status == "complete"
+    assert client.state_manager.load(job.job_id) is None
+    assert client.savings_report()["async_calls"] == 1
+
+def test_bookkeeping_is_done_before_wait_returns():
+    from sbas.state.memory import InMemoryStateManager
+
+    class SlowDeleteState(InMemoryStateManager):
+        def delete(self, job_id):
+            time.sleep(0.01)
+            super().delete(job_id)
+
+    client = SBAS(MockClient(), latency_budget="24h", state_manager=SlowDeleteState(),
+                  batch_queue=BatchQueue(max_wait_sec=0.01))
+    jobs = [client.chat.completions.create(model="gpt-4o", messages=user(str(i))) for i in range(5)]
+    wait_all(jobs, timeout=2)
+    assert list(client.state_manager.job_ids()) == []
+    assert client.savings_report()["async_calls"] == 5
+    assert all(job.status == "complete" for job in jobs)
+
+def test_failed_job_raises():
+    client = SBAS(MockClient(), latency_budget="24h", batch_queue=BatchQueue(max_wait_sec=0.01))
+    job = client.chat.completions.create(model="gpt-4o", messages=user("fail"))
+    with pytest.raises(ValueError):
+        job.wait(timeout=2)
+    assert job.status == "failed"
+
+def test_wait_times_out():
+    gate = threading.Event()
+    client = SBAS(MockClient(gate), latency_budget="24h", batch_queue=BatchQueue(max_wait_sec=0.01))
+    job = client.chat.completions.create(model="gpt-4o", messages=user("hi"))
+    with pytest.raises(TimeoutError):
+        job.wait(timeout=0.05)
+    gate.set()
+    assert job.wait(timeout=2).content == "hi"
+
+def test_done_callback_wait_all_and_as_completed():
+    client = SBAS(MockClient(), latency_budget="24h", batch_queue=BatchQueue(max_size=3, max_wait_sec=3600))
+    seen = []
+    jobs = [client.chat.completions.create(model="gpt-4o", messages=user(str(i))) for i in range(3)]
+    jobs[0].add_done_callback(lambda job: seen.append(job.job_id))
+    assert [r.content for r in wait_all(jobs, timeout=2)] == ["0", "1", "2"]
+    assert seen == [jobs[0].job_id]
+    assert set(as_completed(jobs, timeout=2)) == set(jobs)
+
+def test_identical_requests_are_coalesced_and_cached():
+    gate = threading.Event()
+    llm = MockClient(gate)
+    calls = []
+    create = llm.chat.completions.create
+    llm.chat.completions.create = lambda **kw: calls.append(kw) or create(**kw)
+    client = SBAS(llm, latency_budget="24h", batch_queue=BatchQueue(max_wait_sec=0.01),
+                  response_cache=ResponseCache())
+    jobs = [client.chat.completions.create(model="gpt-4o", messages=user("classify")) for _ in range(5)]
+    gate.set()
+    assert [r.content for r in wait_all(jobs, timeout=2)] == ["classify"] * 5
+    again = client.chat.completions.create(model="gpt-4o", messages=user("classify"))
+    assert again.wait(timeout=2).content == "classify"
+    assert len(calls) == 1
+    report = client.savings_report()
+    assert report["async_calls"] == 1
+    assert report["cached_calls"] == 5
+    assert report["total_saved"] > 0
+
+def test_cache_entries_expire():
+    cache = ResponseCache(max_entries=2, ttl=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    cache = ResponseCache(max_entries=2)
+    for k in "abc":
+        cache.put(k, k)
+    assert cache.get("a") is None and cache.get("c") == "c"
+
+
+class MockChatCompletion:
+    @classmethod
+    def model_validate(cls, body):
+        if "model" not in body:
+            raise ValueError("model: field required")
+        completion = cls()
+        completion.__dict__.update(body)
+        return completion
+
+
+@pytest.fixture
+def openai_types(monkeypatch):
+    """Stand-in openai.types.chat, so batch results can be typed without the openai package."""
+    chat = types.ModuleType("openai.types.chat")
+    chat.ChatCompletion = MockChatCompletion
+    package = types.ModuleType("openai")
+    package.types = types.ModuleType("openai.types")
+    package.types.chat = chat
+    monkeypatch.setitem(sys.modules, "openai", package)
+    monkeypatch.setitem(sys.modules, "openai.types", package.types)
+    monkeypatch.setitem(sys.modules, "openai.types.chat", chat)
+    openai_adapter._completion_type.cache_clear()
+    yield
+    openai_adapter._completion_type.cache_clear()
+
+
+def test_batch_results_are_chat_completions(openai_types):
+    from tests.test_orchestrator import MockBatchClient
+
+    queue = BatchQueue(max_wait_sec=0.01)
+    queue.orchestrator.min_poll_interval = 0.01
+    client = SBAS(MockBatchClient(polls_until_done=1), latency_budget="24h", batch_queue=queue)
+    job = client.chat.completions.create(model="gpt-4o", messages=user("hi"))
+    result = job.wait(timeout=2)
+    assert isinstance(result, MockChatCompletion)
+    assert result.model == "gpt-4o"
+    queue.close()
+
+def test_resume_reattaches_to_submitted_batch_after_restart(tmp_path):
+    from sbas.state.sqlite import SQLiteStateManager
+    from tests.test_orchestrator import MockBatchClient
+    path = str(tmp_path / "state.db")
+    client = MockBatchClient(polls_until_done=1000)
+    first = SBAS(client, latency_budget="24h", state_manager=SQLiteStateManager(path), batch_queue=BatchQueue(max_wait_sec=60))
+    submitted = first.chat.completions.create(model="gpt-4o", messages=user("submitted"))
+    first.batch_queue.flush()
+    queued = first.chat.completions.create(model="gpt-4o", messages=user("queued"))
+    # The process dies: nothing polls the batch or flushes the queue any more
+    first.batch_queue.close(flush=False)
+    first.batch_queue.orchestrator.close()
+    first.state_manager.close()
+
+    client.batches._polls_until_done = 1
+    second = SBAS(client, latency_budget="24h", state_manager=SQLiteStateManager(path), batch_queue=BatchQueue(max_wait_sec=0.01))
+    second.batch_queue.orchestrator.min_poll_interval = 0.01
+    jobs = {job.job_id: job for job in second.pending_jobs()}
+    assert set(jobs) == {submitted.job_id, queued.job_id}
+    assert jobs[submitted.job_id].wait(2) == {"model": "gpt-4o"}
+    assert jobs[queued.job_id].wait(2) == {"model": "gpt-4o"}
+    assert len(client.batches.batches) == 2  # the submitted job was not resubmitted
+    assert second.resume(submitted.job_id) is jobs[submitted.job_id]
+    assert second.pending_jobs() == []
+    with pytest.raises(KeyError):
+        second.resume("no-such-job")
+
+
+def test_existing_on_submit_callback_is_chained():
+    from tests.test_orchestrator import MockBatchClient
+    seen = []
+    queue = BatchQueue(max_wait_sec=60)
+    queue.on_submit = lambda batch_id, provider, job_ids: seen.append((provider, list(job_ids)))
+    sbas = SBAS(MockBatchClient(polls_until_done=1000), latency_budget="24h", batch_queue=queue)
+    job = sbas.chat.completions.create(model="gpt-4o", messages=user("hi"))
+    queue.flush()
+    assert seen == [("openai", [job.job_id])]
+    assert sbas.state_manager.load(job.job_id)["provider"] == "openai"
+    queue.close(flush=False)
+    queue.orchestrator.close()
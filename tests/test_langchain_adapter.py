@@ -0,0 +1,125 @@
+"""Tests for the LangChain adapter."""
+import asyncio
+import sys
+import threading
+import types
+
+import pytest
+
+from sbas.adapters.langchain import SBASLangChain, response_content, to_messages
+from sbas.batch.queue import BatchQueue
+
+from tests.test_orchestrator import MockBatchClient
+
+
+class MockMessage:
+    def __init__(self, type, content):
+        self.type = type
+        self.content = content
+
+
+class MockPromptValue:
+    def to_messages(self):
+        return [MockMessage("system", "be brief"), MockMessage("human", "hi")]
+
+
+class MockChatModel:
+    """Stands in for ChatOpenAI: exposes the provider client and model settings."""
+    model_name = "gpt-4o-mini"
+    temperature = 0.2
+    max_tokens = None
+
+    def __init__(self):
+        self.root_client = MockBatchClient()
+        self.invoked = []
+
+    def invoke(self, input, config=None, **kwargs):
+        self.invoked.append(input)
+        return "direct"
+
+
+def test_to_messages_converts_langchain_inputs():
+    assert to_messages("hi") == [{"role": "user", "content": "hi"}]
+    assert to_messages(MockPromptValue()) == [
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "content": "hi"},
+    ]
+    assert to_messages([("human", "q"), ("ai", "a"), MockMessage("ai", "b")]) == [
+        {"role": "user", "content": "q"},
+        {"role": "assistant", "content": "a"},
+        {"role": "assistant", "content": "b"},
+    ]
+
+
+def test_response_content_reads_openai_and_anthropic_shapes():
+    assert response_content({"choices": [{"message": {"content": "openai"}}]}) == "openai"
+    assert response_content({"content": [{"type": "text", "text": "anth"}, {"type": "text", "text": "ropic"}]}) == "anthropic"
+
+
+def test_realtime_invoke_passes_through():
+    llm = MockChatModel()
+    assert SBASLangChain(llm, latency_budget="realtime").invoke("hi") == "direct"
+    assert llm.invoked == ["hi"]
+
+
+class MockAIMessage:
+    def __init__(self, content, response_metadata):
+        self.content = content
+        self.response_metadata = response_metadata
+
+
+@pytest.fixture
+def langchain_core(monkeypatch):
+    """Stand-in langchain_core.messages, so the adapter's AIMessages can be built without LangChain."""
+    messages = types.ModuleType("langchain_core.messages")
+    messages.AIMessage = MockAIMessage
+    package = types.ModuleType("langchain_core")
+    package.messages = messages
+    monkeypatch.setitem(sys.modules, "langchain_core", package)
+    monkeypatch.setitem(sys.modules, "langchain_core.messages", messages)
+
+
+def test_model_without_a_provider_client_passes_through():
+    llm = MockChatModel()
+    del llm.root_client
+    sbas_llm = SBASLangChain(llm, latency_budget="24h")
+    assert sbas_llm.invoke("hi") == "direct"
+    assert llm.invoked == ["hi"]
+
+
+def make_llm():
+    llm = MockChatModel()
+    sbas_llm = SBASLangChain(llm, latency_budget="24h", batch_queue=BatchQueue(max_size=10_000, max_wait_sec=3600))
+    sbas_llm._sbas.batch_queue.orchestrator.min_poll_interval = 0.01
+    return llm, sbas_llm
+
+
+def test_batch_becomes_one_provider_batch(langchain_core):
+    llm, sbas_llm = make_llm()
+    results = sbas_llm.batch([f"question {i}" for i in range(1000)])
+    assert len(results) == 1000
+    assert results[0].response_metadata["model_name"] == "gpt-4o-mini"
+    assert len(llm.root_client.batches.batches) == 1
+    assert b'"temperature": 0.2' in next(iter(llm.root_client.files.uploads.values()))
+
+
+def test_abatch_and_ainvoke(langchain_core):
+    llm, sbas_llm = make_llm()
+    batches = llm.root_client.batches
+    create, submitted_on = batches.create, []
+
+    def record_thread(**kwargs):
+        submitted_on.append(threading.current_thread())
+        return create(**kwargs)
+    batches.create = record_thread
+
+    async def main():
+        results = await sbas_llm.abatch(["a", "b", "c"])
+        assert submitted_on and threading.main_thread() not in submitted_on  # not on the event loop
+        sbas_llm._sbas.batch_queue.max_wait_sec = 0.01
+        single = await sbas_llm.ainvoke("d")
+        return results, single
+
+    results, single = asyncio.run(main())
+    assert len(results) == 3
+    assert single.response_metadata["model_name"] == "gpt-4o-mini"
@@ -0,0 +1,380 @@
+"""Tests for batch orchestrator."""
+import contextlib
+import json
+import threading
+import time
+from sbas.batch.orchestrator import BatchOrchestrator, adapter_for
+from sbas.batch.providers.anthropic import AnthropicBatchAdapter
+from sbas.batch.providers.errors import BatchItemError
+from sbas.batch.providers.openai import OpenAIBatchAdapter
+from sbas.batch.queue import BatchQueue
+from sbas.batch.tokens import TokenLedger
+
+from tests.test_batch_queue import MockChat, MockResponse
+
+
+class MockObject:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class MockStreamingFiles:
+    def __init__(self, files):
+        self._files = files
+        self.lines_read = 0
+
+    @contextlib.contextmanager
+    def content(self, file_id):
+        def iter_lines():
+            for line in self._files.uploads[file_id].splitlines():
+                self.lines_read += 1
+                yield line
+        yield MockObject(iter_lines=iter_lines)
+
+
+class MockFiles:
+    def __init__(self):
+        self.uploads = {}
+        self.with_streaming_response = MockStreamingFiles(self)
+
+    def create(self, file, purpose):
+        file_id = f"file-{len(self.uploads)}"
+        self.uploads[file_id] = file[1].read()
+        return MockObject(id=file_id)
+
+
+class MockBatches:
+    """Batches finish after a given number of retrieve calls and echo the request model back."""
+
+    def __init__(self, files, polls_until_done=2):
+        self._files = files
+        self._polls_until_done = polls_until_done
+        self.batches = {}
+        self.retrieve_calls = 0
+
+    def create(self, input_file_id, endpoint, completion_window):
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = {"input": input_file_id, "polls": 0}
+        return MockObject(id=batch_id)
+
+    def retrieve(self, batch_id):
+        self.retrieve_calls += 1
+        batch = self.batches[batch_id]
+        batch["polls"] += 1
+        if batch["polls"] < self._polls_until_done:
+            return MockObject(status="in_progress")
+        lines = []
+        content = self._files.uploads[batch["input"]]
+        for line in content.decode().splitlines():
+            req = json.loads(line)
+            lines.append(json.dumps({
+                "custom_id": req["custom_id"],
+                "response": {"body": {"model": req["body"]["model"]}},
+            }))
+        output_id = f"out-{batch_id}"
+        self._files.uploads[output_id] = "\n".join(lines)
+        return MockObject(status="completed", output_file_id=output_id)
+
+
+class MockBatchClient:
+    def __init__(self, polls_until_done=2):
+        self.files = MockFiles()
+        self.batches = MockBatches(self.files, polls_until_done)
+
+
+def collect(expected):
+    results = {}
+    done = threading.Event()
+
+    def on_result(job_id, response):
+        results[job_id] = response
+        if len(results) == expected:
+            done.set()
+
+    def on_error(job_id, error):
+        on_result(job_id, error)
+    return results, done, on_result, on_error
+
+
+def test_adapter_for_detects_batch_api():
+    assert isinstance(adapter_for(MockBatchClient()), OpenAIBatchAdapter)
+    assert adapter_for(object()) is None
+
+def test_submits_through_batch_api_with_one_poller():
+    client = MockBatchClient()
+    results, done, on_result, on_error = collect(20)
+    orchestrator = BatchOrchestrator(on_result, on_error, min_poll_interval=0.01, max_poll_interval=0.05)
+    threads_before = threading.active_count()
+    for i in range(10):
+        orchestrator.submit({
+            f"job-{i}-{j}": {"model": "gpt-4o-mini", "messages": [], "kwargs": {}, "client": client}
+            for j in range(2)
+        })
+    assert threading.active_count() <= threads_before + 1
+    assert done.wait(2)
+    assert len(client.batches.batches) == 10
+    assert results["job-3-1"] == {"model": "gpt-4o-mini"}
+    assert orchestrator.in_flight() == 0
+    orchestrator.close()
+
+def test_poll_interval_backs_off():
+    client = MockBatchClient(polls_until_done=4)
+    results, done, on_result, on_error = collect(1)
+    orchestrator = BatchOrchestrator(on_result, on_error, min_poll_interval=0.01, max_poll_interval=1, poll_backoff=2)
+    start = time.time()
+    orchestrator.submit({"job-1": {"model": "gpt-4o", "messages": [], "kwargs": {}, "client": client}})
+    assert done.wait(2)
+    # 0.01 + 0.02 + 0.04 + 0.08 seconds between the four status checks
+    assert time.time() - start >= 0.14
+    assert client.batches.retrieve_calls == 4
+    orchestrator.close()
+
+class FlakyBatches(MockBatches):
+    """Status checks raise ConnectionError for the first `outage` calls (forever if None)."""
+
+    def __init__(self, files, outage=None):
+        super().__init__(files, polls_until_done=1)
+        self.outage = outage
+
+    def retrieve(self, batch_id):
+        if self.outage is None or self.retrieve_calls < self.outage:
+            self.retrieve_calls += 1
+            raise ConnectionError("provider unreachable")
+        return super().retrieve(batch_id)
+
+
+def test_jobs_fail_after_repeated_transient_poll_failures():
+    for outage in (2, None):
+        client = MockBatchClient()
+        client.batches = FlakyBatches(client.files, outage=outage)
+        results, done, on_result, on_error = collect(2)
+        orchestrator = BatchOrchestrator(on_result, on_error, min_poll_interval=0.01, max_poll_failures=3)
+        orchestrator.submit({
+            f"job-{i}": {"model": "gpt-4o", "messages": [], "kwargs": {}, "client": client} for i in range(2)
+        })
+        assert done.wait(2)
+        if outage is None:
+            assert isinstance(results["job-0"], ConnectionError)
+            assert client.batches.retrieve_calls == 3
+        else:
+            assert results["job-0"] == {"model": "gpt-4o"}  # recovered within the limit
+        assert orchestrator.in_flight() == 0
+        orchestrator.close()
+
+def test_results_are_streamed_as_parsed():
+    client = MockBatchClient(polls_until_done=1)
+    adapter = OpenAIBatchAdapter(client, spool_max_size=64)
+    batch_id = adapter.submit([
+        {"job_id": f"job-{i}", "model": "gpt-4o", "messages": [{"role": "user", "content": "x" * 100}]}
+        for i in range(5)
+    ])
+    results = adapter.iter_results(adapter.check(batch_id))
+    assert next(results) == ("job-0", {"model": "gpt-4o"})
+    assert client.files.with_streaming_response.lines_read == 1
+    assert len(list(results)) == 4
+
+
+def test_token_quota_holds_back_requests_until_batches_complete():
+    client = MockBatchClient()
+    ledger = TokenLedger({"gpt-4o": 250})  # two 100-token prompts at a time
+    prompt = [{"role": "user", "content": "x" * 384}]  # 96 tokens of text + 4 of framing
+    create, threads = client.batches.create, []
+
+    def record_thread(**kwargs):
+        threads.append(threading.current_thread().name)
+        return create(**kwargs)
+    client.batches.create = record_thread
+    queue = BatchQueue(max_wait_sec=60, token_ledger=ledger)
+    queue.orchestrator.min_poll_interval = 0.01
+    futures = [
+        queue.enqueue(f"job-{i}", "gpt-4o", prompt, {"max_tokens": 4096}, client) for i in range(5)
+    ]
+    queue.flush()
+    assert len(client.batches.batches) == 1
+    assert queue.orchestrator.held() == 3
+    assert ledger.in_flight("gpt-4o") == 200
+    for f in futures:
+        assert f.result(2) == {"model": "gpt-4o"}
+    sizes = [len(client.files.uploads[b["input"]].splitlines()) for b in client.batches.batches.values()]
+    assert sizes == [2, 2, 1]
+    assert all(name.startswith("sbas-batch-submit") for name in threads[1:])  # held ones: not on the poller
+    assert ledger.in_flight("gpt-4o") == 0
+    queue.orchestrator.close()
+
+
+def test_request_over_token_quota_fails():
+    client = MockBatchClient()
+    results, done, on_result, on_error = collect(1)
+    orchestrator = BatchOrchestrator(on_result, on_error, token_ledger=TokenLedger(default_quota=50))
+    messages = [{"role": "user", "content": "x" * 400}]
+    orchestrator.submit({"job-1": {"model": "gpt-4o", "messages": messages, "kwargs": {}, "client": client}})
+    assert done.wait(1)
+    assert isinstance(results["job-1"], ValueError)
+    assert client.batches.batches == {}
+
+
+def test_quota_counts_completion_tokens_only_where_the_provider_does():
+    messages = [{"role": "user", "content": "x" * 384}]
+    ledger = TokenLedger(completion_tokens=256)
+    assert ledger.estimate(messages, {}, OpenAIBatchAdapter.quota_counts_completion) == 100
+    assert ledger.estimate(messages, {}, AnthropicBatchAdapter.quota_counts_completion) == 356
+    assert ledger.estimate(messages, {"max_tokens": 50}, AnthropicBatchAdapter.quota_counts_completion) == 150
+
+
+class PartialBatches(MockBatches):
+    """
+    Batches end "expired": requests in `expire` go to the error file as never run, those in
+    `reject` come back with a 400 and those in `lose` are in neither file. Only the first
+    batch is affected unless `every_batch`.
+    """
+
+    def __init__(self, files, expire=(), reject=(), lose=(), every_batch=False):
+        super().__init__(files, polls_until_done=1)
+        self.expire, self.reject, self.lose = set(expire), set(reject), set(lose)
+        self.every_batch = every_batch
+
+    def retrieve(self, batch_id):
+        batch = super().retrieve(batch_id)
+        if batch_id != "batch-0" and not self.every_batch:
+            return batch
+        output, errors = [], []
+        for line in self._files.uploads[batch.output_file_id].splitlines():
+            job_id = json.loads(line)["custom_id"]
+            if job_id in self.expire:
+                errors.append(json.dumps({
+                    "custom_id": job_id, "response": None,
+                    "error": {"code": "batch_expired", "message": "This request could not be executed before the completion window expired."},
+                }))
+            elif job_id in self.reject:
+                output.append(json.dumps({
+                    "custom_id": job_id, "error": None,
+                    "response": {"status_code": 400, "body": {"error": {"message": "Invalid 'messages'"}}},
+                }))
+            elif job_id not in self.lose:
+                output.append(line)
+        self._files.uploads[batch.output_file_id] = "\n".join(output)
+        self._files.uploads[f"err-{batch_id}"] = "\n".join(errors)
+        return MockObject(status="expired", id=batch_id, output_file_id=batch.output_file_id, error_file_id=f"err-{batch_id}")
+
+
+def partial_client(**kwargs):
+    client = MockBatchClient()
+    client.batches = PartialBatches(client.files, **kwargs)
+    return client
+
+
+def batch_sizes(client):
+    return [len(client.files.uploads[b["input"]].splitlines()) for b in client.batches.batches.values()]
+
+
+def test_only_retryable_failures_are_resubmitted():
+    client = partial_client(expire=[f"job-{i}" for i in range(5)], reject=["job-5"], lose=["job-6", "job-7"])
+    results, done, on_result, on_error = collect(50)
+    orchestrator = BatchOrchestrator(on_result, on_error, min_poll_interval=0.01, max_attempts=2)
+    orchestrator.submit({
+        f"job-{i}": {"model": "gpt-4o-mini", "messages": [], "kwargs": {}, "client": client} for i in range(50)
+    })
+    assert done.wait(2)
+    assert batch_sizes(client) == [50, 7]  # the 5 expired and 2 missing ones run again, nothing else
+    assert results["job-0"] == results["job-6"] == results["job-49"] == {"model": "gpt-4o-mini"}
+    assert isinstance(results["job-5"], BatchItemError)
+    assert results["job-5"].status == 400 and not results["job-5"].retryable
+    orchestrator.close()
+
+
+def test_retries_are_capped_then_fall_back_to_sync():
+    for sync_fallback in (False, True):
+        client = partial_client(expire=["job-1"], every_batch=True)
+        client.chat = MockChat()
+        results, done, on_result, on_error = collect(2)
+        orchestrator = BatchOrchestrator(
+            on_result, on_error, min_poll_interval=0.01, max_attempts=3, sync_fallback=sync_fallback
+        )
+        orchestrator.submit({
+            f"job-{i}": {"model": "gpt-4o", "messages": [], "kwargs": {}, "client": client} for i in range(2)
+        })
+        assert done.wait(2)
+        assert batch_sizes(client) == [2, 1, 1]
+        assert results["job-0"] == {"model": "gpt-4o"}
+        if sync_fallback:
+            assert isinstance(results["job-1"], MockResponse)
+            assert client.chat.completions.calls == ["gpt-4o"]
+        else:
+            assert isinstance(results["job-1"], BatchItemError) and results["job-1"].kind == "expired"
+            assert client.chat.completions.calls == []
+        orchestrator.close()
+
+
+def test_retries_are_submitted_off_the_poller_and_not_timed():
+    client = partial_client(expire=["job-0"])
+    threads = []
+    create = client.batches.create
+
+    def record_thread(**kwargs):
+        threads.append(threading.current_thread().name)
+        return create(**kwargs)
+    client.batches.create = record_thread
+    turnarounds = []
+    results, done, on_result, on_error = collect(2)
+    orchestrator = BatchOrchestrator(
+        on_result, on_error, min_poll_interval=0.01,
+        on_turnaround=lambda provider, model, seconds: turnarounds.append(model),
+    )
+    orchestrator.submit({
+        f"job-{i}": {"model": "gpt-4o", "messages": [], "kwargs": {}, "client": client} for i in range(2)
+    })
+    assert done.wait(2)
+    orchestrator.close()
+    assert threads[1].startswith("sbas-batch-submit")
+    assert turnarounds == ["gpt-4o"]  # the retry batch only: the expired one says nothing about turnaround
+
+
+def test_requests_of_a_cancelled_batch_are_not_retried():
+    line = json.dumps({
+        "custom_id": "job-1", "response": None,
+        "error": {"code": "batch_cancelled", "message": "This request was not executed because the batch was cancelled."},
+    })
+    _, error = OpenAIBatchAdapter._parse_line(line)
+    assert error.kind == "canceled" and not error.retryable
+
+
+def test_anthropic_results_are_classified_per_item():
+
+    def result(job_id, type, **kwargs):
+        return MockObject(custom_id=job_id, result=MockObject(type=type, **kwargs))
+
+    def error(error_type):
+        return MockObject(type="error", error=MockObject(type=error_type, message=error_type))
+
+    items = [
+        result("job-1", "succeeded", message={"content": "ok"}),
+        result("job-2", "errored", error=error("invalid_request_error")),
+        result("job-3", "errored", error=error("overloaded_error")),
+        result("job-4", "expired"),
+        result("job-5", "canceled"),
+    ]
+    batches = MockObject(results=lambda batch_id: iter(items))
+    adapter = AnthropicBatchAdapter(MockObject(messages=MockObject(batches=batches)))
+    outcomes = dict(adapter.iter_results(MockObject(id="msgbatch-1")))
+    assert outcomes["job-1"] == {"content": "ok"}
+    assert all(isinstance(outcomes[f"job-{i}"], BatchItemError) for i in range(2, 6))
+    assert [outcomes[f"job-{i}"].retryable for i in range(2, 6)] == [False, True, True, False]
+    assert outcomes["job-4"].kind == "expired" and outcomes["job-5"].kind == "canceled"
+
+
+def test_anthropic_requests_lift_system_messages_and_pass_sampling_params():
+    request = AnthropicBatchAdapter._batch_request({
+        "job_id": "job-1",
+        "model": "claude-sonnet-4-5",
+        "messages": [{"role": "system", "content": "be brief"}, {"role": "user", "content": "hi"}],
+        "kwargs": {"temperature": 0.2, "top_p": 0.9, "stop": "END", "max_tokens": 50},
+    })
+    assert request == {"custom_id": "job-1", "params": {
+        "model": "claude-sonnet-4-5",
+        "messages": [{"role": "user", "content": "hi"}],
+        "max_tokens": 50,
+        "system": "be brief",
+        "temperature": 0.2,
+        "top_p": 0.9,
+        "stop_sequences": ["END"],
+    }}
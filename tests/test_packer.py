@@ -0,0 +1,36 @@
+"""Tests for batch packer."""
+from sbas.batch.packer import BatchPacker
+from sbas.batch.providers.anthropic import AnthropicBatchAdapter
+from sbas.batch.providers.openai import OpenAIBatchAdapter
+
+
+def request(i, model="gpt-4o", content="hi"):
+    return {"job_id": f"job-{i}", "model": model, "messages": [{"role": "user", "content": content}], "kwargs": {}}
+
+
+def test_one_model_per_openai_batch():
+    requests = [request(i, model="gpt-4o" if i % 2 else "gpt-4o-mini") for i in range(6)]
+    batches, oversized = BatchPacker().pack(requests, OpenAIBatchAdapter(None))
+    assert oversized == []
+    assert sorted(len(b) for b in batches) == [3, 3]
+    assert all(len({r["model"] for r in b}) == 1 for b in batches)
+
+def test_anthropic_batches_mix_models():
+    requests = [request(i, model="claude-3-5-haiku-20241022" if i % 2 else "claude-3-5-sonnet-20241022") for i in range(6)]
+    batches, _ = BatchPacker().pack(requests, AnthropicBatchAdapter(None))
+    assert len(batches) == 1
+
+def test_respects_count_and_byte_limits():
+    adapter = OpenAIBatchAdapter(None)
+    size = adapter.request_size(request(0))
+    batches, _ = BatchPacker(max_requests=4).pack([request(i) for i in range(10)], adapter)
+    assert [len(b) for b in batches] == [4, 4, 2]
+    batches, _ = BatchPacker(max_bytes=size * 3).pack([request(i) for i in range(10)], adapter)
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+
+def test_oversized_request_is_rejected():
+    adapter = OpenAIBatchAdapter(None)
+    packer = BatchPacker(max_bytes=adapter.request_size(request(0)) + 10)
+    batches, oversized = packer.pack([request(0), request(1, content="x" * 100)], adapter)
+    assert [r["job_id"] for r in oversized] == ["job-1"]
+    assert [len(b) for b in batches] == [1]
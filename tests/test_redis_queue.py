@@ -0,0 +1,341 @@
+"""Tests for the Redis-backed shared batch queue, against an in-process Redis stand-in."""
+import fnmatch
+import threading
+import time
+
+from sbas import SBAS
+from sbas.batch.redis_queue import RedisBatchQueue
+
+from tests.test_interceptor import MockClient, MockCompletions, MockResponse, user
+from tests.test_orchestrator import MockBatchClient
+
+
+class WrongType(Exception):
+    """Stands in for redis.ResponseError."""
+
+    def __init__(self):
+        super().__init__("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+
+class FakeRedis:
+    """The subset of redis.Redis that RedisBatchQueue and RedisStateManager use, shared between 'processes'."""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._cond = threading.Condition()
+        self.pipelines = 0  # pipelines executed: round trips of the pipelined operations
+
+    def _get(self, key, default=None):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key, default)
+
+    def set(self, key, value, nx=False, xx=False, px=None):
+        with self._cond:
+            exists = self._get(key) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+            self._data[key] = value.encode()
+            self._expires.pop(key, None)
+            if px is not None:
+                self._expires[key] = time.time() + px / 1000
+            return True
+
+    def _hash(self, key, create=False):
+        h = self._get(key)
+        if h is None:
+            h = {}
+            if create:
+                self._data[key] = h
+        if not isinstance(h, dict):
+            raise WrongType()
+        return h
+
+    def get(self, key):
+        with self._cond:
+            value = self._get(key)
+            if value is not None and not isinstance(value, bytes):
+                raise WrongType()
+            return value
+
+    def expire(self, key, seconds):
+        return self.pexpire(key, seconds * 1000)
+
+    def exists(self, *keys):
+        with self._cond:
+            return sum(self._get(key) is not None for key in keys)
+
+    def scan_iter(self, match="*", count=None):
+        with self._cond:
+            keys = [key for key in list(self._data) if self._get(key) is not None and fnmatch.fnmatchcase(key, match)]
+        return iter(key.encode() for key in keys)
+
+    def pexpire(self, key, px):
+        with self._cond:
+            if self._get(key) is None:
+                return False
+            self._expires[key] = time.time() + px / 1000
+            return True
+
+    def delete(self, *keys):
+        with self._cond:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._cond:
+            h = self._hash(key, create=True)
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            for field, value in items.items():
+                h[field.encode()] = value.encode() if isinstance(value, str) else value
+            return len(items)
+
+    def hsetnx(self, key, field, value):
+        with self._cond:
+            h = self._hash(key, create=True)
+            if field.encode() in h:
+                return 0
+            h[field.encode()] = value.encode()
+            return 1
+
+    def hget(self, key, field):
+        with self._cond:
+            return self._hash(key).get(field.encode())
+
+    def hdel(self, key, *fields):
+        with self._cond:
+            h = self._hash(key)
+            removed = sum(h.pop(f.encode(), None) is not None for f in fields)
+            if not h:
+                self._data.pop(key, None)  # Redis drops emptied hashes
+            return removed
+
+    def hgetall(self, key):
+        with self._cond:
+            return dict(self._hash(key))
+
+    def zadd(self, key, mapping, xx=False):
+        with self._cond:
+            z = self._data.setdefault(key, {})
+            added = 0
+            for member, score in mapping.items():
+                member = member.encode()
+                if xx and member not in z:
+                    continue
+                added += member not in z
+                z[member] = float(score)
+            return added
+
+    def zrange(self, key, start, end, withscores=False):
+        with self._cond:
+            items = sorted(self._get(key, {}).items(), key=lambda kv: (kv[1], kv[0]))
+            items = items[start:] if end == -1 else items[start:end + 1]
+            return items if withscores else [member for member, _ in items]
+
+    def zrem(self, key, *members):
+        with self._cond:
+            z = self._get(key, {})
+            return sum(z.pop(m.encode(), None) is not None for m in members)
+
+    def zcard(self, key):
+        with self._cond:
+            return len(self._get(key, {}))
+
+    def rpush(self, key, value):
+        with self._cond:
+            if self._get(key) is None:
+                self._data[key] = []
+            self._data[key].append(value.encode())
+            self._cond.notify_all()
+            return len(self._data[key])
+
+    def blpop(self, keys, timeout=0):
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                for key in keys:
+                    if self._get(key):
+                        return key.encode(), self._data[key].pop(0)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._calls.append((getattr(self._redis, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self, raise_on_error=True):
+        calls, self._calls = self._calls, []
+        replies = []
+        with self._redis._cond:  # MULTI/EXEC: nothing else runs in between
+            self._redis.pipelines += 1
+            for fn, args, kwargs in calls:
+                try:
+                    replies.append(fn(*args, **kwargs))
+                except WrongType as e:
+                    replies.append(e)  # like Redis, the other commands still run
+        errors = [reply for reply in replies if isinstance(reply, Exception)]
+        if errors and raise_on_error:
+            raise errors[0]
+        return replies
+
+
+def make_queue(redis, **kwargs):
+    return RedisBatchQueue(redis_client=redis, max_wait_sec=0.05, poll_interval=0.02, lease_sec=1, **kwargs)
+
+
+def wait_until(condition, timeout=3):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_workers_share_one_batch_and_get_their_own_results():
+    redis = FakeRedis()
+    workers = [make_queue(redis) for _ in range(3)]
+    for queue in workers:
+        queue.orchestrator.min_poll_interval = 0.01
+    clients = [MockBatchClient() for _ in workers]
+    for queue, client in zip(workers, clients):
+        queue.recover(client)
+    assert wait_until(lambda: sum(q.is_leader for q in workers) == 1)
+
+    futures = {}
+    for w, queue in enumerate(workers):
+        for i in range(4):
+            futures[(w, i)] = queue.enqueue(f"job-{w}-{i}", f"model-{w}", [], {}, clients[w])
+    for (w, i), future in futures.items():
+        assert future.result(3)["model"] == f"model-{w}"
+
+    # The 12 requests went out together through the leader's client
+    leader = next(i for i, q in enumerate(workers) if q.is_leader)
+    assert all(not c.batches.batches for i, c in enumerate(clients) if i != leader)
+    assert sum(1 for _ in clients[leader].files.uploads) >= 1
+    assert redis.hgetall("sbas:queue:default:inflight") == {}
+    for queue in workers:
+        queue.close()
+
+
+def test_leadership_moves_when_the_leader_closes():
+    redis = FakeRedis()
+    first, second = make_queue(redis), make_queue(redis)
+    first.recover(MockBatchClient())
+    assert wait_until(lambda: first.is_leader)
+    second.recover(MockBatchClient())
+    first.close()
+    assert wait_until(lambda: second.is_leader)
+    future = second.enqueue("job-1", "gpt-4o", [], {}, MockBatchClient())
+    second.orchestrator.min_poll_interval = 0.01
+    assert future.result(3) == {"model": "gpt-4o"}
+    second.close()
+
+
+def test_results_for_a_closed_worker_expire():
+    redis = FakeRedis()
+    leader = make_queue(redis, results_ttl=0.2)
+    leader.recover(MockBatchClient())
+    assert wait_until(lambda: leader.is_leader)
+    leader.orchestrator.min_poll_interval = 0.01
+    worker = make_queue(redis)
+    worker.enqueue("job-1", "gpt-4o", [], {}, MockBatchClient())
+    worker.close()  # submitted, but gone before its result comes back
+    results = f"sbas:queue:default:results:{worker.worker_id}"
+    assert wait_until(lambda: redis._get(results))
+    assert wait_until(lambda: redis._get(results) is None, timeout=1)
+    leader.close()
+
+
+def test_new_leader_adopts_in_flight_batches():
+    redis = FakeRedis()
+    client = MockBatchClient(polls_until_done=1000)
+    leader, worker = make_queue(redis), make_queue(redis)
+    worker.orchestrator.min_poll_interval = 0.01
+    leader.recover(client)
+    assert wait_until(lambda: leader.is_leader)
+    worker.recover(client)
+    future = worker.enqueue("job-1", "gpt-4o", [], {}, client)
+    assert wait_until(lambda: redis.hgetall("sbas:queue:default:inflight"))
+
+    # The leader dies with the batch still running; its lease runs out
+    leader._closed = True
+    leader.orchestrator.close()
+    assert wait_until(lambda: worker.is_leader)
+    client.batches._polls_until_done = 1
+    assert future.result(3) == {"model": "gpt-4o"}
+    assert wait_until(lambda: redis.hgetall("sbas:queue:default:inflight") == {})
+    worker.close()
+
+
+def test_new_leader_requeues_requests_claimed_but_not_submitted():
+    redis = FakeRedis()
+    client = MockBatchClient()
+    leader, worker = make_queue(redis), make_queue(redis)
+    worker.orchestrator.min_poll_interval = 0.01
+    leader.orchestrator.submit = lambda batch: None  # the leader dies between claiming and submitting
+    leader.recover(client)
+    assert wait_until(lambda: leader.is_leader)
+    worker.recover(client)
+    future = worker.enqueue("job-1", "gpt-4o", [], {}, client)
+    assert wait_until(lambda: redis.hgetall("sbas:queue:default:claimed"))
+    assert redis.hgetall("sbas:queue:default:requests") == {}
+
+    leader._closed = True
+    leader.orchestrator.close()
+    assert wait_until(lambda: worker.is_leader)
+    assert future.result(3) == {"model": "gpt-4o"}
+    assert redis.hgetall("sbas:queue:default:claimed") == {}
+    worker.close()
+
+
+class DumpableResponse(MockResponse):
+    def model_dump(self):
+        return {"model": self.model, "content": self.content, "usage": {"prompt_tokens": 500, "completion_tokens": 200}}
+
+
+class DumpableCompletions(MockCompletions):
+    def create(self, model, messages, **kwargs):
+        return DumpableResponse(messages[-1]["content"])
+
+
+def test_works_behind_sbas_without_a_batch_api():
+    redis = FakeRedis()
+    sbas = SBAS(MockClient(), latency_budget="1h", batch_queue=make_queue(redis))
+    job = sbas.chat.completions.create(model="gpt-4o", messages=user("hi"))
+    assert job.wait(3) is None  # MockResponse has no JSON form
+    sbas.batch_queue.close()
+
+
+def test_leader_and_workers_get_the_same_dict_results_and_record_cost():
+    redis = FakeRedis()
+    client = MockClient()
+    client.chat.completions = DumpableCompletions()
+    leader = SBAS(client, latency_budget="1h", batch_queue=make_queue(redis))
+    assert wait_until(lambda: leader.batch_queue.is_leader)
+    worker = SBAS(client, latency_budget="1h", batch_queue=make_queue(redis))
+    jobs = {name: sbas.chat.completions.create(model="gpt-4o", messages=user(name))
+            for name, sbas in (("leader", leader), ("worker", worker))}
+    for name, job in jobs.items():
+        assert job.wait(3)["content"] == name
+    for sbas in (leader, worker):
+        # Costed from the dict: 700 tokens of gpt-4o
+        assert sbas.cost_tracker.report()["by_model"]["gpt-4o"]["cost_if_all_sync"] > 0
+        sbas.batch_queue.close()
@@ -0,0 +1,108 @@
+"""Tests for the bounded result store."""
+from sbas.batch.log import BatchLog
+from sbas.batch.queue import BatchQueue
+from sbas.batch.results import ResultStore
+
+from tests.test_batch_queue import MockClient
+
+
+class DumpedResponse:
+    """A provider response object, as the SDKs return them."""
+
+    def __init__(self, text):
+        self.text = text
+
+    def model_dump(self):
+        return {"text": self.text}
+
+
+def test_spills_least_recently_used_and_reads_back_lazily(tmp_path):
+    store = ResultStore(max_bytes=50, spill_path=str(tmp_path / "results.db"))
+    for i in range(2):
+        store.put(f"job-{i}", DumpedResponse("x" * 10))  # 22 bytes of JSON each
+    assert store.get("job-0").text == "x" * 10       # touched: job-1 is now least recently used
+    store.put("job-3", DumpedResponse("y" * 10))     # 66 > 50, so one result goes
+    assert store.spilled == 1
+    assert store.memory_bytes == 44
+    assert store.pop("job-1") == {"text": "x" * 10}  # read back from disk, as a dict
+    assert store.pop("job-1") is None
+    assert store.pop("job-0").text == "x" * 10
+    assert len(store) == 1
+    store.close()
+
+
+def test_responses_are_serialized_once(tmp_path):
+    dumps = []
+
+    class CountingResponse(DumpedResponse):
+        def model_dump(self):
+            dumps.append(self.text)
+            return super().model_dump()
+
+    store = ResultStore(max_bytes=30, spill_path=str(tmp_path / "results.db"))
+    store.put("job-1", CountingResponse("a" * 10))
+    store.put("job-2", CountingResponse("b" * 10))  # job-1 spills
+    assert store.spilled == 1
+    assert dumps == ["a" * 10, "b" * 10]  # at put time only, not again when spilling
+    assert store.pop("job-1") == {"text": "a" * 10}
+    store.close()
+
+
+def test_drops_over_budget_without_spill_file():
+    store = ResultStore(max_bytes=30)
+    store.put("job-1", {"text": "a" * 10})
+    store.put("job-2", {"text": "b" * 10})
+    assert store.dropped == 1
+    assert store.get("job-1") is None
+    assert store.get("job-2") == {"text": "b" * 10}
+
+
+def test_uncollected_results_expire(tmp_path, monkeypatch):
+    import sbas.batch.results as results
+    now = [1000.0]
+    monkeypatch.setattr(results.time, "time", lambda: now[0])
+    store = ResultStore(max_bytes=30, ttl=60, spill_path=str(tmp_path / "results.db"))
+    store.put("job-1", {"text": "a" * 10})
+    store.put("job-2", {"text": "b" * 10})  # job-1 spills
+    now[0] += 30
+    store.put("job-3", {"text": "c"})       # job-2 spills
+    assert "job-1" in store and "job-2" in store
+    now[0] += 31
+    assert store.get("job-1") is None and store.get("job-2") is None
+    assert store.get("job-3") == {"text": "c"}
+    assert store.expired == 2
+    store.close()
+
+
+def test_batch_queue_results_go_through_store(tmp_path):
+    store = ResultStore(max_bytes=1, spill_path=str(tmp_path / "results.db"))
+    queue = BatchQueue(max_size=100, max_wait_sec=3600, result_store=store)
+    future = queue.enqueue("job-1", "gpt-4o", [], {}, MockClient())
+    queue.flush()
+    future.result(2)
+    queue._store_result("job-2", {"id": "resp-2"})  # nobody waiting for it: spilled under the budget
+    assert queue.find("job-2").result() == {"id": "resp-2"}
+    assert queue.get_result("job-2") == {"id": "resp-2"}
+    assert queue.get_result("job-2") is None
+    queue.close()
+
+
+def test_logged_results_are_serialized_once_for_log_and_store(tmp_path):
+    dumps = []
+
+    class SDKResponse(DumpedResponse):
+        def model_dump_json(self):
+            dumps.append(self.text)
+            return '{"text": "%s"}' % self.text
+
+    path = str(tmp_path / "queue.log")
+    store = ResultStore(spill_path=str(tmp_path / "results.db"))
+    queue = BatchQueue(max_wait_sec=3600, log=BatchLog(path), result_store=store)
+    queue._store_result("job-1", SDKResponse("a" * 10))
+    assert dumps == ["a" * 10]
+    assert store.memory_bytes == len('{"text": "aaaaaaaaaa"}')
+    queue.close()
+    queue.log.close()
+    log = BatchLog(path)
+    assert log.recovered.results["job-1"]["result"] == {"text": "a" * 10}
+    log.close()
@@ -0,0 +1,123 @@
+"""Tests for the latency-budget router."""
+import time
+
+from sbas import SBAS
+from sbas.batch.orchestrator import BatchOrchestrator
+from sbas.batch.queue import BatchQueue
+from sbas.router import LatencyRouter
+
+from tests.test_executor import MockAnthropicClient, MockObject
+from tests.test_interceptor import MockChat, user
+from tests.test_orchestrator import MockBatchClient, collect
+
+
+class MockBatchAndChatClient(MockBatchClient):
+    def __init__(self, gate=None):
+        super().__init__()
+        self.chat = MockChat(gate)
+
+
+def observed(router, seconds, n=10, provider="openai", model="gpt-4o"):
+    for _ in range(n):
+        router.observe(provider, model, seconds)
+    return router
+
+
+def test_decision_follows_observed_turnaround():
+    router = observed(LatencyRouter(), 1800)
+    fast = router.decide("openai", "gpt-4o", "1h", queue_wait=360)
+    assert (fast.mode, fast.predicted, fast.samples) == ("async", 2160, 10)
+    slow = router.decide("openai", "gpt-4o", "30m", queue_wait=180)
+    assert slow.mode == "sync"
+    assert slow.reason == "predicted to miss budget"
+
+
+def test_quantile_tracks_the_slow_tail():
+    router = LatencyRouter(quantile=0.9)
+    observed(router, 600, n=8)
+    observed(router, 7200, n=2)
+    assert router.predict("openai", "gpt-4o") == (7200, 10)
+    assert router.decide("openai", "gpt-4o", "1h").mode == "sync"
+    assert router.stats()[("openai", "gpt-4o")]["p50"] == 600
+
+
+def test_window_forgets_old_turnaround():
+    router = LatencyRouter(window=10)
+    observed(router, 7200)
+    observed(router, 600)
+    assert router.decide("openai", "gpt-4o", "1h").mode == "async"
+
+
+def test_old_turnaround_ages_out_so_batches_are_tried_again():
+    router = observed(LatencyRouter(max_age=0.05), 7200)
+    assert router.decide("openai", "gpt-4o", "1h").mode == "sync"
+    time.sleep(0.06)
+    assert router.decide("openai", "gpt-4o", "1h").mode == "async"
+    observed(router, 600)  # the batches sent meanwhile came back fast
+    assert router.predict("openai", "gpt-4o") == (600, 10)
+
+
+def test_defaults_without_enough_samples():
+    router = observed(LatencyRouter(min_samples=5), 7200, n=4)
+    assert router.decide("openai", "gpt-4o", "1h").mode == "async"
+    assert router.decide("openai", "gpt-4o", "realtime").mode == "sync"
+    assert router.decide("openai", "gpt-4o", "24h").mode == "async"
+    assert LatencyRouter(default_turnaround=7200).decide("openai", "gpt-4o", "1h").mode == "sync"
+
+
+def test_orchestrator_reports_turnaround():
+    client = MockBatchClient()
+    router = LatencyRouter(min_samples=1)
+    results, done, on_result, on_error = collect(2)
+    orchestrator = BatchOrchestrator(on_result, on_error, min_poll_interval=0.01, on_turnaround=router.observe)
+    orchestrator.submit({
+        "job-1": {"model": "gpt-4o", "messages": [], "kwargs": {}, "client": client},
+        "job-2": {"model": "gpt-4o-mini", "messages": [], "kwargs": {}, "client": client},
+    })
+    assert done.wait(2)
+    turnaround, samples = router.predict("openai", "gpt-4o-mini")
+    assert samples == 1 and 0 < turnaround < 2
+    orchestrator.close()
+
+
+def test_interceptor_falls_back_to_sync_when_batch_would_miss_budget():
+    client = MockBatchAndChatClient()
+    router = observed(LatencyRouter(), 7200)
+    sbas = SBAS(client, latency_budget="1h", batch_queue=BatchQueue(max_wait_sec=0.01), router=router)
+    job = sbas.chat.completions.create(model="gpt-4o", messages=user("hi"))
+    assert job.wait(1).content == "hi"
+    assert sbas.last_decision.mode == "sync"
+    assert sbas.last_decision.predicted > 3600
+    assert client.batches.batches == {}
+    assert sbas.savings_report()["sync_calls"] == 1
+
+    sbas.latency_budget = "24h"
+    sbas.chat.completions.create(model="gpt-4o", messages=user("later"))
+    assert sbas.last_decision.mode == "async"
+
+
+def test_sync_routed_anthropic_call_uses_the_messages_api():
+    client = MockAnthropicClient()
+    client.messages.batches = MockObject()
+    router = observed(LatencyRouter(), 7200, provider="anthropic", model="claude-sonnet-4-5")
+    sbas = SBAS(client, latency_budget="1h", router=router)
+    job = sbas.chat.completions.create(model="claude-sonnet-4-5", messages=user("hi"))
+    assert (sbas.last_decision.mode, sbas.last_decision.provider) == ("sync", "anthropic")
+    assert job.wait(1).content == "hi"
+
+
+def test_sync_routed_call_does_not_block_create():
+    import threading
+    gate = threading.Event()
+    client = MockBatchAndChatClient(gate)
+    sbas = SBAS(client, latency_budget="1h", router=observed(LatencyRouter(), 7200))
+    job = sbas.chat.completions.create(model="gpt-4o", messages=user("hi"))
+    assert sbas.last_decision.mode == "sync"
+    assert not job.done()
+    gate.set()
+    assert job.wait(1).content == "hi"
+
+
+def test_interceptor_wires_router_to_orchestrator():
+    sbas = SBAS(MockBatchClient(), latency_budget="1h")
+    assert sbas.batch_queue.orchestrator.on_turnaround == sbas.router.observe
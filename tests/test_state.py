@@ -1,6 +1,12 @@
 """Tests for state managers."""
+import json
+import threading
+import time
 import pytest
+from sbas.state.base import BaseStateManager
 from sbas.state.memory import InMemoryStateManager
+from sbas.state.sqlite import SQLiteStateManager
+from sbas.state.chain import ChainedStateManager
 
 
 def test_save_and_load():
@@ -22,3 +28,229 @@ def test_delete():
     sm.save("job-3", {"data": "test"})
     sm.delete("job-3")
     assert sm.load("job-3") is None
+
+@pytest.mark.parametrize("group_commit", [True, False])
+def test_sqlite_roundtrip(tmp_path, group_commit):
+    sm = SQLiteStateManager(str(tmp_path / "state.db"), group_commit=group_commit)
+    sm.save("job-1", {"step": 1})
+    sm.update("job-1", {"step": 2})
+    assert sm.load("job-1") == {"step": 2}
+    sm.delete("job-1")
+    assert sm.load("job-1") is None
+    sm.close()
+
+def test_sqlite_bulk_and_durable(tmp_path):
+    path = str(tmp_path / "state.db")
+    sm = SQLiteStateManager(path)
+    sm.save_many({f"job-{i}": {"i": i} for i in range(1200)})
+    sm.delete_many(["job-0", "job-1"])
+    assert len(sm.load_many(f"job-{i}" for i in range(1200))) == 1198
+    sm.close()
+
+    sm = SQLiteStateManager(path)
+    assert sm.load("job-5") == {"i": 5}
+    assert sm.load("job-0") is None
+    sm.close()
+
+def test_sqlite_concurrent_updates_are_not_lost(tmp_path):
+    sm = SQLiteStateManager(str(tmp_path / "state.db"))
+    sm.save("job-1", {})
+
+    def worker(n):
+        for i in range(50):
+            sm.update("job-1", {f"{n}-{i}": True})
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(sm.load("job-1")) == 200
+    sm.close()
+
+def test_sqlite_group_commit_gives_up_and_flush_raises(tmp_path):
+    import sqlite3
+    sm = SQLiteStateManager(str(tmp_path / "state.db"), group_commit=True)
+    commit = sm._commit
+
+    def locked(writes):
+        raise sqlite3.OperationalError("database is locked")
+    sm._commit = locked
+    sm.save("job-1", {"step": 1})
+    with pytest.raises(sqlite3.OperationalError):
+        sm.flush()
+    sm._commit = commit
+    sm.save("job-2", {"step": 2})
+    sm.flush()  # the writer carries on with later writes
+    assert sm.load("job-1") is None and sm.load("job-2") == {"step": 2}
+    sm.close()
+
+def test_sqlite_sweep(tmp_path):
+    sm = SQLiteStateManager(str(tmp_path / "state.db"))
+    sm.save("old", {})
+    cutoff = time.time() + 1
+    assert sm.sweep(older_than=cutoff) == 1
+    assert sm.load("old") is None
+    sm.close()
+
+class RecordingStateManager(InMemoryStateManager):
+    def __init__(self):
+        super().__init__()
+        self.bytes_written = 0
+
+    def save(self, job_id, state):
+        self.bytes_written += len(json.dumps(state))
+        super().save(job_id, state)
+
+
+def agent_run(sm, job_prefix, steps=30):
+    messages = [{"role": "system", "content": "You are an e-commerce analysis agent. " * 50}]
+    for step in range(steps):
+        messages.append({"role": "user", "content": f"Step {step}: continue the analysis."})
+        sm.save(f"{job_prefix}-{step}", {"messages": list(messages), "model": "gpt-4o"})
+        messages.append({"role": "assistant", "content": f"Result of step {step}."})
+    return messages
+
+
+def test_chained_state_roundtrip():
+    sm = ChainedStateManager(InMemoryStateManager())
+    messages = agent_run(sm, "job")
+    state = sm.load("job-29")
+    assert state["messages"] == messages[:-1]
+    assert state["model"] == "gpt-4o"
+    sm.update("job-29", {"messages": messages})
+    assert sm.load("job-29")["messages"] == messages
+    # A fresh manager over the same store reassembles from stored blocks
+    assert ChainedStateManager(sm._inner).load("job-0")["messages"] == messages[:2]
+
+def test_chained_state_rewrites_stale_blocks_loaded_from_the_store(monkeypatch):
+    import sbas.state.chain as chain
+    now = [1000.0]
+    monkeypatch.setattr(chain.time, "time", lambda: now[0])
+    inner = RecordingStateManager()
+    ChainedStateManager(inner, rewrite_after=10).save("job-1", {"messages": [{"role": "user", "content": "hi"}]})
+    now[0] += 20
+    # A new process loads the block, then saves a state using it: the block is 20s old, so it's rewritten
+    sm = ChainedStateManager(inner, rewrite_after=10)
+    sm.save("job-2", sm.load("job-1"))
+    block = inner.load(next(key for key in inner.job_ids() if key.startswith("block:")))
+    assert block["written_at"] == now[0]
+
+def test_chained_state_writes_only_new_blocks():
+    full, chained = RecordingStateManager(), RecordingStateManager()
+    sm = ChainedStateManager(chained)
+    for job in ("job-a", "job-b"):  # two agents with the same system prompt
+        agent_run(full, job)
+        agent_run(sm, job)
+    assert chained.bytes_written * 10 < full.bytes_written
+
+
+def test_job_ids_lists_saved_states(tmp_path):
+    for sm in (InMemoryStateManager(), SQLiteStateManager(str(tmp_path / "s.db")),
+               ChainedStateManager(InMemoryStateManager())):
+        sm.save("job-1", {"messages": [{"role": "user", "content": "hi"}]})
+        sm.save("job-2", {"step": 1})
+        sm.delete("job-2")
+        assert list(sm.job_ids()) == ["job-1"]
+
+class DictStateManager(BaseStateManager):
+    """A custom backend implementing only the four required methods."""
+
+    def __init__(self):
+        self.states = {}
+
+    def save(self, job_id, state):
+        self.states[job_id] = dict(state)
+
+    def load(self, job_id):
+        return self.states.get(job_id)
+
+    def update(self, job_id, delta):
+        self.states.setdefault(job_id, {}).update(delta)
+
+    def delete(self, job_id):
+        self.states.pop(job_id, None)
+
+
+def test_custom_backend_without_job_ids_works_until_a_resume():
+    from sbas import SBAS
+    from sbas.batch.queue import BatchQueue
+
+    sm = DictStateManager()
+    sm.update_many({"job-1": {"step": 1}})
+    assert sm.load("job-1") is None
+    sbas = SBAS(object(), latency_budget="24h", state_manager=sm, batch_queue=BatchQueue(max_wait_sec=60))
+    with pytest.raises(TypeError, match="DictStateManager can't list its jobs"):
+        sbas.pending_jobs()
+    sbas.batch_queue.close(flush=False)
+
+@pytest.mark.parametrize("make", [
+    lambda tmp_path: InMemoryStateManager(),
+    lambda tmp_path: SQLiteStateManager(str(tmp_path / "state.db")),
+    lambda tmp_path: ChainedStateManager(InMemoryStateManager()),
+])
+def test_update_many_skips_jobs_without_state(tmp_path, make):
+    sm = make(tmp_path)
+    sm.save("job-1", {"step": 1})
+    sm.update_many({"job-1": {"batch_id": "b1"}, "other-process": {"batch_id": "b1"}})
+    assert sm.load("job-1") == {"step": 1, "batch_id": "b1"}
+    assert sm.load("other-process") is None
+    assert set(sm.job_ids()) == {"job-1"}
+
+
+def redis_state(redis=None):
+    from sbas.state.redis import RedisStateManager
+    from tests.test_redis_queue import FakeRedis
+    redis = redis or FakeRedis()
+    return redis, RedisStateManager(redis_client=redis, ttl=60)
+
+def test_redis_stores_one_hash_field_per_state_key():
+    redis, sm = redis_state()
+    sm.save("job-1", {"messages": [{"role": "user", "content": "hi"}], "step": 1})
+    fields = redis.hgetall("sbas:state:job-1")
+    assert sorted(fields) == [b"messages", b"step"]
+    assert sm.codec.decode(fields[b"step"]) == 1
+    assert redis._expires["sbas:state:job-1"] > time.time()
+    sm.save("job-2", {})
+    assert sm.load("job-2") == {}
+    assert sorted(sm.job_ids()) == ["job-1", "job-2"]
+
+def test_redis_update_writes_only_the_delta_in_one_round_trip():
+    redis, sm = redis_state()
+    sm.save("job-1", {"messages": ["m"] * 100, "step": 1})
+    pipelines, hgetall = redis.pipelines, redis.hgetall
+    redis.hgetall = None  # update must not read the state back
+    sm.update("job-1", {"step": 2})
+    redis.hgetall = hgetall
+    assert redis.pipelines == pipelines + 1
+    assert sm.load("job-1") == {"messages": ["m"] * 100, "step": 2}
+    sm.save("job-2", {})
+    sm.update("job-2", {"step": 1})
+    assert sm.load("job-2") == {"step": 1}  # the empty-state placeholder is gone
+
+def test_redis_migrates_legacy_json_states():
+    redis, sm = redis_state()
+    for job_id in ("job-1", "job-2", "job-3"):
+        redis.set(f"sbas:state:{job_id}", json.dumps({"step": 1, "job": job_id}))
+    assert sm.load("job-1") == {"step": 1, "job": "job-1"}
+    assert sm.load_many(["job-1", "job-2", "missing"]) == {
+        "job-1": {"step": 1, "job": "job-1"}, "job-2": {"step": 1, "job": "job-2"},
+    }
+    sm.update("job-1", {"step": 2})
+    sm.update_many({"job-2": {"step": 3}})
+    assert isinstance(redis._data["sbas:state:job-1"], dict)  # now a hash
+    assert sm.load("job-1") == {"step": 2, "job": "job-1"}
+    assert sm.load("job-2") == {"step": 3, "job": "job-2"}
+    assert sm.load("job-3") == {"step": 1, "job": "job-3"}
+
+def test_redis_bulk_operations_are_pipelined():
+    redis, sm = redis_state()
+    states = {f"job-{i}": {"i": i} for i in range(100)}
+    pipelines = redis.pipelines
+    sm.save_many(states)
+    assert redis.pipelines == pipelines + 1
+    assert sm.load_many(states) == states
+    assert redis.pipelines == pipelines + 2
+    sm.update_many({job_id: {"done": True} for job_id in states})
+    assert redis.pipelines == pipelines + 4  # an EXISTS pass, then a write pass
+    sm.delete_many(list(states)[:50])
+    assert len(sm.load_many(states)) == 50
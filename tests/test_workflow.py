@@ -0,0 +1,124 @@
+"""Tests for the wave-scheduled workflow runner."""
+import threading
+
+import pytest
+
+from sbas import SBAS
+from sbas.batch.queue import BatchQueue
+from sbas.state.memory import InMemoryStateManager
+from sbas.workflow import WorkflowRunner
+
+from tests.test_interceptor import MockClient
+from tests.test_orchestrator import MockBatchClient
+from tests.test_redis_queue import wait_until
+
+
+def checkout_step(state, response):
+    if response is not None:
+        state["answers"].append(response["model"])
+    if state["step"] == 3:
+        return None
+    state["step"] += 1
+    return {"model": f"model-{state['step']}", "messages": [{"role": "user", "content": f"step {state['step']}"}]}
+
+
+def agents(n):
+    return {f"agent-{i}": {"step": 0, "answers": []} for i in range(n)}
+
+
+def test_each_step_of_every_agent_shares_a_batch():
+    client = MockBatchClient()
+    sbas = SBAS(client, latency_budget="24h", batch_queue=BatchQueue(max_size=10_000, max_wait_sec=3600))
+    sbas.batch_queue.orchestrator.min_poll_interval = 0.01
+    runner = WorkflowRunner(sbas, checkout_step)
+    states = runner.run(agents(300), timeout=5)
+    assert len(states) == 300
+    assert states["agent-42"] == {"step": 3, "answers": ["model-1", "model-2", "model-3"]}
+    assert len(client.batches.batches) == 3
+    assert runner.errors == {}
+    assert list(sbas.state_manager.job_ids()) == []
+
+
+def test_steps_run_off_the_batch_poller_thread():
+    threads = set()
+
+    def step(state, response):
+        threads.add(threading.current_thread().name)
+        return checkout_step(state, response)
+
+    sbas = SBAS(MockBatchClient(), latency_budget="24h", batch_queue=BatchQueue(max_wait_sec=3600))
+    sbas.batch_queue.orchestrator.min_poll_interval = 0.01
+    WorkflowRunner(sbas, step, name="checkout").run(agents(3), timeout=5)
+    assert "sbas-batch-poller" not in threads
+    assert any(name.startswith("sbas-workflow-checkout") for name in threads)
+
+
+def test_failed_agents_are_reported_and_others_finish():
+    def step(state, response):
+        if state.get("fail"):
+            raise ValueError("agent crashed")
+        return checkout_step(state, response)
+
+    sbas = SBAS(MockBatchClient(), latency_budget="24h", batch_queue=BatchQueue(max_wait_sec=3600))
+    sbas.batch_queue.orchestrator.min_poll_interval = 0.01
+    runner = WorkflowRunner(sbas, step)
+    start = agents(3)
+    start["agent-1"]["fail"] = True
+    states = runner.run(start, timeout=5)
+    assert set(runner.errors) == {"agent-1"}
+    assert states["agent-0"]["step"] == 3
+
+
+def test_realtime_budget_runs_steps_inline():
+    def step(state, response):
+        if response is not None:
+            state["answers"].append(response.content)
+        if len(state["answers"]) == 2:
+            return None
+        return {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]}
+
+    sbas = SBAS(MockClient(), latency_budget="realtime")
+    states = WorkflowRunner(sbas, step).run({"a": {"answers": []}}, timeout=1)
+    assert states["a"]["answers"] == ["hi", "hi"]
+
+
+def test_resume_continues_a_run_from_saved_state():
+    client = MockBatchClient(polls_until_done=1000)
+    state_manager = InMemoryStateManager()
+    first = SBAS(client, latency_budget="24h", state_manager=state_manager, batch_queue=BatchQueue(max_wait_sec=3600))
+    runner = WorkflowRunner(first, checkout_step, name="checkout")
+    timed_out = []
+
+    def run():
+        with pytest.raises(TimeoutError):
+            runner.run(agents(5), timeout=1)
+        timed_out.append(True)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert wait_until(lambda: len(client.batches.batches) == 1)
+    # The process dies with step 1 in flight
+    first.batch_queue.orchestrator.close()
+    thread.join()
+    assert timed_out
+
+    client.batches._polls_until_done = 1
+    second = SBAS(client, latency_budget="24h", state_manager=state_manager, batch_queue=BatchQueue(max_wait_sec=3600))
+    second.batch_queue.orchestrator.min_poll_interval = 0.01
+    states = WorkflowRunner(second, checkout_step, name="checkout").resume(timeout=5)
+    assert len(states) == 5
+    assert states["agent-0"] == {"step": 3, "answers": ["model-1", "model-2", "model-3"]}
+    assert len(client.batches.batches) == 3
+
+
+def test_resume_makes_calls_again_when_their_job_is_gone():
+    client = MockBatchClient(polls_until_done=1)
+    sbas = SBAS(client, latency_budget="24h", batch_queue=BatchQueue(max_wait_sec=3600))
+    sbas.batch_queue.orchestrator.min_poll_interval = 0.01
+    request = {"model": "model-1", "messages": [{"role": "user", "content": "step 1"}]}
+    # Both agents' step-1 responses were collected before the process died; only one saved its call
+    sbas.state_manager.save("workflow:checkout:agent-0", {"state": {"step": 1, "answers": []}, "job_id": "gone", "request": request})
+    sbas.state_manager.save("workflow:checkout:agent-1", {"state": {"step": 1, "answers": []}, "job_id": "gone"})
+    runner = WorkflowRunner(sbas, checkout_step, name="checkout")
+    states = runner.resume(timeout=5)
+    assert states["agent-0"] == {"step": 3, "answers": ["model-1", "model-2", "model-3"]}
+    assert set(runner.errors) == {"agent-1"} and isinstance(runner.errors["agent-1"], KeyError)